@@ -0,0 +1,226 @@
+import os
+import json
+import warnings
+import urllib.request
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from config import DATA_DIR
+
+BASELINE_PATH = os.path.join(DATA_DIR, "alert_baseline.json")
+ALERTS_PATH = os.path.join(DATA_DIR, "alerts.jsonl")
+
+# High values of these indexes indicate a bloom; the other indexes alert on deviations either way
+BLOOM_INDEXES = ("Cyanobacteria", "SABI", "CGI")
+# Scales the MAD to the standard deviation of normally distributed values
+MAD_SCALE = 1.4826
+ALERT_COLUMNS = ["date", "index", "kind", "value", "median", "mad", "z", "aoi"]
+
+
+class SeasonalBaseline:
+    """
+    Per-index seasonal baseline of the AOI medians, for bloom and anomaly alerts.
+
+    Values are kept in day-of-season bins of `bin_days` days of the year
+    (at most `max_per_bin` recent dates per bin). A new date is scored against
+    its bin and the `window` bins on each side, over all earlier dates:
+    robust z = (value - median) / (1.4826 * MAD), for all indexes at once,
+    when at least `min_samples` values are available. Scoring reads only
+    that window and folding the date in appends one row to one bin, so the
+    cost of a new date does not grow with the length of the history.
+    """
+
+    def __init__(self, indexes, aoi=None, bin_days=7, window=2, min_samples=5, max_per_bin=20, threshold=3.5):
+        self.indexes = list(indexes)
+        self.aoi = aoi
+        self.bin_days = bin_days
+        self.window = window
+        self.min_samples = min_samples
+        self.max_per_bin = max_per_bin
+        self.threshold = threshold
+        self.dates = set()
+        # {bin: [[value per index], ...]} in date order; None where an index had no value
+        self.bins = {}
+        self._bloom = np.array([name in BLOOM_INDEXES for name in self.indexes])
+
+    def _bin(self, date_str):
+        return (date.fromisoformat(date_str).timetuple().tm_yday - 1) // self.bin_days
+
+    def score(self, date_str, values):
+        """
+        Robust z-scores of one date's values against the baseline (without folding them in).
+        Returns:
+            Arrays aligned with `indexes`: z (NaN without enough history), median and MAD.
+        """
+        x = np.array(values, dtype=np.float64)
+        b = self._bin(str(date_str))
+        rows = [row for offset in range(-self.window, self.window + 1) for row in self.bins.get(b + offset, ())]
+        k = len(self.indexes)
+        if len(rows) < self.min_samples:
+            nan = np.full(k, np.nan)
+            return nan, nan, nan
+        history = np.array(rows, dtype=np.float64)
+        missing = np.isnan(history)
+        enough = (~missing).sum(axis=0) >= self.min_samples
+        if missing.any():
+            with warnings.catch_warnings():
+                # Indexes without any value in the window stay NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                median = np.nanmedian(history, axis=0)
+                mad = np.nanmedian(np.abs(history - median), axis=0)
+        else:
+            # np.median is much faster than np.nanmedian on small windows
+            median = np.median(history, axis=0)
+            mad = np.median(np.abs(history - median), axis=0)
+        median = np.where(enough, median, np.nan)
+        mad = np.where(enough, mad, np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # A constant history (MAD 0) gives no score
+            z = np.where(mad > 0, (x - median) / (MAD_SCALE * mad), np.nan)
+        return z, median, mad
+
+    def update(self, date_str, values):
+        """
+        Scores one date, then folds it into the baseline.
+        Returns:
+            The alerts of the date (dicts with ALERT_COLUMNS); none when the date was already folded in.
+        """
+        date_str = str(date_str)
+        if date_str in self.dates:
+            return []
+        x = np.array(values, dtype=np.float64)
+        z, median, mad = self.score(date_str, x)
+
+        with np.errstate(invalid="ignore"):
+            bloom = self._bloom & (z >= self.threshold)
+            anomaly = ~self._bloom & (np.abs(z) >= self.threshold)
+        alerts = [
+            {
+                "date": date_str,
+                "index": self.indexes[i],
+                "kind": "bloom" if bloom[i] else "anomaly",
+                "value": round(float(x[i]), 4),
+                "median": round(float(median[i]), 4),
+                "mad": round(float(mad[i]), 4),
+                "z": round(float(z[i]), 2),
+                "aoi": self.aoi,
+            }
+            for i in np.flatnonzero(bloom | anomaly)
+        ]
+
+        self.dates.add(date_str)
+        rows = self.bins.setdefault(self._bin(date_str), [])
+        rows.append([None if np.isnan(v) else float(v) for v in x])
+        if len(rows) > self.max_per_bin:
+            del rows[0]
+        return alerts
+
+    def update_frame(self, df):
+        # Scores and folds in every row of a wide table (date index) not seen yet, in date order
+        new = sorted(str(d) for d in df.index if str(d) not in self.dates)
+        values = df.reindex(index=new, columns=self.indexes).to_numpy(dtype=np.float64, na_value=np.nan)
+        alerts = []
+        for date_str, row in zip(new, values):
+            alerts.extend(self.update(date_str, row))
+        return alerts
+
+    def to_dict(self):
+        return {
+            "indexes": self.indexes,
+            "aoi": self.aoi,
+            "bin_days": self.bin_days,
+            "window": self.window,
+            "min_samples": self.min_samples,
+            "max_per_bin": self.max_per_bin,
+            "threshold": self.threshold,
+            "dates": sorted(self.dates),
+            "bins": {str(b): rows for b, rows in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data["indexes"], data["aoi"], data["bin_days"], data["window"], data["min_samples"],
+                    data["max_per_bin"], data["threshold"])
+        state.dates = set(data["dates"])
+        state.bins = {int(b): rows for b, rows in data["bins"].items()}
+        return state
+
+    def save(self, path=BASELINE_PATH):
+        # Written atomically (one temporary file per process); readers see either the previous or the new state
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+def load_baseline(path=BASELINE_PATH, indexes=None):
+    # The persisted baseline, or None when missing, unreadable or kept for other indexes
+    try:
+        with open(path) as f:
+            state = SeasonalBaseline.from_dict(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if indexes is not None and state.indexes != list(indexes):
+        return None
+    return state
+
+
+class JsonlSink:
+    # Appends every alert as one JSON line; the log the Charts page reads
+    def __init__(self, path=ALERTS_PATH):
+        self.path = path
+
+    def emit(self, alerts):
+        if not alerts:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(alert) + "\n" for alert in alerts)
+
+
+class WebhookSink:
+    """
+    Posts recent alerts (dated within `max_age_days`) as one JSON list to
+    `url`, so back-filling the history does not notify. Without a url it is
+    a stub that only keeps the payloads in `sent`. Delivery is best effort:
+    failures are counted, never raised.
+    """
+
+    def __init__(self, url=None, timeout=5, max_age_days=10):
+        self.url = url
+        self.timeout = timeout
+        self.max_age_days = max_age_days
+        self.sent = []
+        self.failed = 0
+
+    def emit(self, alerts):
+        since = str(date.today() - timedelta(days=self.max_age_days))
+        recent = [alert for alert in alerts if alert["date"] >= since]
+        if not recent:
+            return
+        self.sent.append(recent)
+        if self.url is None:
+            return
+        request = urllib.request.Request(
+            self.url, data=json.dumps(recent).encode(), headers={"Content-Type": "application/json"}
+        )
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except OSError:
+            self.failed += 1
+
+
+def default_sinks():
+    # The JSONL log, and the webhook when WQ_ALERT_WEBHOOK is set
+    return [JsonlSink(), WebhookSink(os.environ.get("WQ_ALERT_WEBHOOK"))]
+
+
+def load_alerts(path=ALERTS_PATH):
+    # The alert log as a DataFrame, oldest first
+    try:
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        rows = []
+    return pd.DataFrame(rows, columns=ALERT_COLUMNS).sort_values("date", kind="stable", ignore_index=True)
@@ -0,0 +1,146 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from online_stats import month_name
+
+
+def _freeze(df):
+    # Rebuilds the frame over read-only column arrays, so writes through any view raise ValueError
+    columns = {}
+    for name in df.columns:
+        arr = df[name].to_numpy(copy=True)
+        arr.flags.writeable = False
+        columns[name] = arr
+    return pd.DataFrame(columns, index=df.index.copy(), copy=False)
+
+
+def _view(df):
+    # Shallow copy: callers may relabel it without touching the memoized frame
+    return df.copy(deep=False)
+
+
+def content_hash(df):
+    # Hash of the values, dates and index names; equal tables share derived aggregates
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\0".join(map(str, df.columns)).encode())
+    h.update("\0".join(map(str, df.index)).encode())
+    h.update(np.ascontiguousarray(df.to_numpy(dtype=np.float32, na_value=np.nan)).tobytes())
+    return h.hexdigest()
+
+
+class AnalyticsFrame:
+    """
+    Wide float32 statistics table (DatetimeIndex, one column per index) with
+    the aggregates of the Charts page computed once and memoized.
+    All returned frames are read-only views shared between reruns and sessions.
+
+    With an `online` OnlineStats covering exactly the dates of the table, the
+    monthly medians and the correlation are read from its running statistics
+    instead of being computed over the whole history.
+    """
+
+    def __init__(self, all_stats, online=None):
+        wide = all_stats.astype(np.float32)
+        self.dates = [str(d) for d in wide.index]
+        wide.index = pd.to_datetime(wide.index)
+        wide.index.name = "date"
+        self.indexes = [str(c) for c in wide.columns]
+        self.hash = content_hash(wide)
+        self._wide = _freeze(wide)
+        self._derived = {}
+        self._lock = threading.Lock()
+        if online is not None and (online.indexes != self.indexes or online.dates != set(self.dates)):
+            online = None
+        self.online = online
+
+    def _memo(self, name, compute):
+        with self._lock:
+            if name not in self._derived:
+                derived = compute()
+                if isinstance(derived, dict):
+                    derived = {key: _freeze(df) for key, df in derived.items()}
+                else:
+                    derived = _freeze(derived)
+                self._derived[name] = derived
+            return self._derived[name]
+
+    @property
+    def wide(self):
+        return _view(self._wide)
+
+    def index_frame(self, index_name):
+        # One-column "median" table with the original date strings, as shown next to the line charts
+        frames = self._memo("index_frames", lambda: {
+            name: pd.DataFrame({"median": self._wide[name].to_numpy()}, index=pd.Index(self.dates, name="date"))
+            for name in self.indexes
+        })
+        return _view(frames[index_name])
+
+    def monthly_medians(self, index_name):
+        """
+        Monthly medians of one index (rounded to 2 decimals), indexed by full month
+        name; months without data are dropped.
+        """
+        def compute():
+            if self.online is not None:
+                monthly = self.online.monthly_medians().round(2)
+                monthly.index = pd.Index(monthly.index.map(month_name), name="date")
+            else:
+                # Same year-month keys as OnlineStats.monthly_medians
+                monthly = self._wide.groupby(self._wide.index.to_period("M")).median().astype(np.float64).round(2)
+                monthly.index = pd.Index(monthly.index.strftime("%Y-%m").map(month_name), name="date")
+            return {name: monthly[[name]].rename(columns={name: "median"}).dropna() for name in self.indexes}
+
+        return _view(self._memo("monthly", compute)[index_name])
+
+    def correlation(self):
+        # Pairwise correlation over dates with all indexes present, upper triangle masked out
+        def compute():
+            if self.online is not None:
+                corr = self.online.correlation().round(2)
+            else:
+                corr = self._wide.dropna().astype(np.float64).corr().round(2)
+            return corr.mask(np.triu(np.ones(corr.shape, dtype=bool)))
+
+        return _view(self._memo("correlation", compute))
+
+    def summary(self):
+        """
+        Per-index summary of the medians over all dates.
+        Returns:
+            A DataFrame indexed by index name with count, mean, median, min, max, last and last_date.
+        """
+        def compute():
+            wide = self._wide.astype(np.float64)
+            last_dates = {name: wide[name].last_valid_index() for name in self.indexes}
+            df = pd.DataFrame({
+                "count": wide.count(),
+                "mean": wide.mean(),
+                "median": wide.median(),
+                "min": wide.min(),
+                "max": wide.max(),
+                "last": [wide[name].get(d, np.nan) if d is not None else np.nan for name, d in last_dates.items()],
+                "last_date": [d.strftime("%Y-%m-%d") if d is not None else None for d in last_dates.values()],
+            }, index=self.indexes)
+            return df.round({"mean": 2, "median": 2, "min": 2, "max": 2, "last": 2})
+
+        return _view(self._memo("summary", compute))
+
+
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def analytics_frame(all_stats, online=None, max_entries=4):
+    # AnalyticsFrame of the table, reused (with its aggregates) while the content is unchanged
+    frame = AnalyticsFrame(all_stats, online)
+    with _frames_lock:
+        if frame.hash in _frames:
+            _frames.move_to_end(frame.hash)
+            return _frames[frame.hash]
+        _frames[frame.hash] = frame
+        while len(_frames) > max_entries:
+            _frames.popitem(last=False)
+    return frame
@@ -0,0 +1,64 @@
+import os
+import json
+import threading
+from config import DATA_DIR
+
+COVERAGE_PATH = os.path.join(DATA_DIR, "coverage.json")
+
+
+class CoverageCache:
+    """
+    Valid-pixel fraction of the AOI per acquisition day, persisted so each
+    day is reduced on Earth Engine only once.
+
+    An entry remembers the ids of the scenes it was computed from and is
+    reused while the day has exactly those scenes; a scene added to a day
+    (late ingestion, reprocessing) makes that day stale. `settings` (AOI,
+    masking, scale) must match for a persisted cache to be reused at all.
+    """
+
+    def __init__(self, settings=None, days=None):
+        self.settings = dict(settings or {})
+        self.days = dict(days or {})
+
+    def get(self, day, scenes):
+        # The cached fraction of `day`, or None when missing or computed from other scenes
+        entry = self.days.get(day)
+        if entry is None or entry["scenes"] != sorted(scenes):
+            return None
+        return entry["coverage"]
+
+    def put(self, day, scenes, coverage):
+        self.days[day] = {"scenes": sorted(scenes), "coverage": coverage}
+
+    def missing(self, scenes_by_day):
+        # Days of {day: scene ids} without a valid entry, in the given order
+        return [day for day, scenes in scenes_by_day.items() if self.get(day, scenes) is None]
+
+    def to_dict(self):
+        return {"settings": self.settings, "days": self.days}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["settings"], data["days"])
+
+    def save(self, path=COVERAGE_PATH):
+        # Written atomically; readers see either the previous or the new state
+        # (one temporary file per writer, as several processes build catalogs at once)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+def load_coverage(path=COVERAGE_PATH, settings=None):
+    # The persisted cache, or None when missing, unreadable or computed with other settings
+    try:
+        with open(path) as f:
+            cache = CoverageCache.from_dict(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if settings is not None and cache.settings != dict(settings):
+        return None
+    return cache
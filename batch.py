@@ -0,0 +1,206 @@
+"""
+Headless statistics pipeline: the per-date AOI medians of the water indexes,
+computed outside Streamlit (no streamlit import) for scheduled runs.
+
+    python -m batch --start 2023-03-01 --end 2024-01-01 --indexes SABI CGI --out data/batch
+    python -m batch --publish    # nightly: also update the app's store and snapshot
+    python -m batch --cube       # also append new composites to the local raster cube
+
+Dates are split into batches evaluated concurrently on the shared Earth
+Engine executor. Every finished batch is written as a part file and recorded
+in the run's checkpoint, so an interrupted run resumes with the remaining
+dates. With --publish the results go to the store and snapshot the pages
+read; run the app with WQ_APP_REFRESH=0 so it only reads them. With --cube
+the composites of dates newer than the local raster cube are exported into
+it, so the pages, statistics and prefetching read them without Earth Engine.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+from concurrent.futures import as_completed
+import pandas as pd
+import gee_data
+from config import DATA_DIR
+from ee_executor import get_executor
+from gee_data import MIN_COVERAGE, START_DATE, ImageryCatalog, export_to_cube
+from raster_cube import CUBE_DIR, open_cube
+from stats import STATS_INDEXES, publish_snapshot, stats_all_indexes
+from timeseries_store import TimeSeriesStore
+
+BATCH_DIR = os.path.join(DATA_DIR, "batch")
+FORMATS = ("parquet", "csv")
+
+
+class Checkpoint:
+    """
+    Dates finished by a run, saved after every batch. A checkpoint belongs to
+    the run parameters it was created with; resuming with other parameters
+    (indexes, AOI, ...) into the same directory is refused.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = dict(params)
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state["params"] != self.params:
+                raise ValueError(f"{path} belongs to a run with other parameters: {state['params']}")
+            self.done = set(state["done"])
+
+    def mark(self, dates):
+        # Written atomically, after the dates' part file
+        self.done.update(dates)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"params": self.params, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+
+def write_part(out_dir, df, fmt):
+    # One batch of wide statistics (date index, one column per index)
+    parts_dir = os.path.join(out_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    path = os.path.join(parts_dir, f"part-{df.index.min()}_{df.index.max()}.{fmt}")
+    tmp_path = os.path.join(parts_dir, f".{os.path.basename(path)}.tmp")
+    if fmt == "csv":
+        df.to_csv(tmp_path)
+    else:
+        df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_parts(out_dir, fmt):
+    # All batches written so far as one table; a date written twice (resumed batch) keeps its last value
+    paths = sorted(glob.glob(os.path.join(out_dir, "parts", f"part-*.{fmt}")), key=os.path.getmtime)
+    if not paths:
+        return pd.DataFrame()
+    frames = [pd.read_csv(p, index_col="date") if fmt == "csv" else pd.read_parquet(p) for p in paths]
+    df = pd.concat(frames)
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    df.index.name = "date"
+    return df
+
+
+def run_batch(start_date=START_DATE, end_date=None, indexes=STATS_INDEXES, out_dir=BATCH_DIR, aoi=None,
+              fmt="parquet", batch_size=20, min_coverage=MIN_COVERAGE, log=print):
+    """
+    Computes the statistics of every catalog date in [start_date, end_date)
+    not finished by an earlier run into `out_dir`.
+    Parameters:
+        aoi: Earth Engine asset id of the area of interest (default: the app's AOI).
+        fmt: "parquet" or "csv", for the part files and the combined table.
+    Returns:
+        The wide statistics table of all finished dates, also written to
+        `out_dir`/stats.<fmt>.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; one of {FORMATS}")
+    indexes = list(indexes)
+    if aoi is not None:
+        gee_data.set_aoi(aoi)
+    params = {"start_date": start_date, "end_date": end_date, "indexes": indexes, "aoi": gee_data.AOI_ASSET,
+              "min_coverage": min_coverage, "format": fmt}
+    checkpoint = Checkpoint(os.path.join(out_dir, "checkpoint.json"), params)
+
+    catalog = ImageryCatalog(indexes, start_date=start_date, end_date=end_date, min_coverage=min_coverage,
+                             coverage_path=os.path.join(out_dir, "coverage.json"))
+    todo = [d for d in catalog.dates if d not in checkpoint.done]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    log(f"{len(catalog.dates)} dates, {len(catalog.dates) - len(todo)} done earlier, {len(batches)} batches to run")
+
+    # Batches finish in any order; each is persisted as soon as it is done
+    executor = get_executor()
+    futures = {
+        executor.submit(stats_all_indexes, catalog.collection_for(batch), indexes): batch for batch in batches
+    }
+    failed = []
+    for future in as_completed(futures):
+        batch = futures[future]
+        try:
+            df = future.result()
+        except Exception as e:
+            failed.append(e)
+            log(f"batch {batch[0]}..{batch[-1]} failed: {e}")
+            continue
+        if not df.empty:
+            write_part(out_dir, df, fmt)
+        checkpoint.mark(batch)
+        log(f"batch {batch[0]}..{batch[-1]}: {len(df)} dates")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(batches)} batches failed; run again to resume") from failed[0]
+
+    result = read_parts(out_dir, fmt)
+    if not result.empty:
+        path = os.path.join(out_dir, f"stats.{fmt}")
+        if fmt == "csv":
+            result.to_csv(path)
+        else:
+            result.to_parquet(path)
+    return result
+
+
+def publish(df, store=None):
+    """
+    Appends batch results to the app's statistics store (dates already stored
+    are skipped) and rewrites the snapshot the pages are served from.
+    Returns:
+        Number of (date, index) rows added to the store.
+    """
+    store = store or TimeSeriesStore()
+    added = store.append(df.reindex(columns=STATS_INDEXES))
+    publish_snapshot(store)
+    return added
+
+
+def export_cube(start_date=START_DATE, end_date=None, indexes=STATS_INDEXES, root=CUBE_DIR,
+                min_coverage=MIN_COVERAGE, log=print):
+    """
+    Appends the composites of the catalog dates newer than the last date of
+    the local raster cube (all of them for a new cube).
+    Returns:
+        The RasterCube.
+    """
+    catalog = ImageryCatalog(indexes, start_date=start_date, end_date=end_date, min_coverage=min_coverage)
+    existing = open_cube(root)
+    before = len(existing.dates) if existing is not None else 0
+    cube = export_to_cube(catalog, root)
+    log(f"{len(cube.dates) - before} dates appended to the cube in {root}, {len(cube.dates)} in total")
+    return cube
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--start", default=START_DATE, help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="End date, exclusive (default: today)")
+    parser.add_argument("--indexes", nargs="+", default=STATS_INDEXES)
+    parser.add_argument("--aoi", default=None, help="Earth Engine asset id of the AOI (default: the app's)")
+    parser.add_argument("--out", default=BATCH_DIR, help="Output and checkpoint directory")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--min-coverage", type=float, default=MIN_COVERAGE)
+    parser.add_argument("--publish", action="store_true", help="Also update the app's store and snapshot")
+    parser.add_argument("--cube", action="store_true", help="Also append new composites to the local raster cube")
+    parser.add_argument("--cube-dir", default=CUBE_DIR, help="Raster cube directory (default: the app's)")
+    args = parser.parse_args(argv)
+
+    if (args.publish or args.cube) and (args.aoi is not None or not set(STATS_INDEXES) <= set(args.indexes)):
+        parser.error(f"--publish and --cube need the app's AOI and all of {STATS_INDEXES}")
+
+    df = run_batch(args.start, args.end, args.indexes, args.out, args.aoi, args.format, args.batch_size,
+                   args.min_coverage)
+    print(f"{len(df)} dates in {os.path.join(args.out, 'stats.' + args.format)}")
+    if args.publish:
+        print(f"published {publish(df)} rows to the app's statistics store")
+    if args.cube:
+        export_cube(args.start, args.end, STATS_INDEXES, args.cube_dir, args.min_coverage)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Feeds many seasons of synthetic index medians with injected blooms into the
+seasonal alert baseline and reports the cost of a new date early and late in
+the history (against rescanning the history per date), the detection of the
+injected blooms, and the time to score one new date for many AOIs. Also
+checks that chunked updates and a saved/reloaded baseline give the same
+alerts as one pass.
+
+    python -m benchmarks.bench_alerts
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from alerts import BLOOM_INDEXES, MAD_SCALE, SeasonalBaseline, load_baseline
+from benchmarks.bench_analytics import INDEXES
+
+
+def seasonal_series(years, first_year=2000, step_days=5, n_blooms=40, seed=0):
+    # Season-shaped medians (April-October) with noise, and bloom spikes on bloom indexes
+    rng = np.random.default_rng(seed)
+    dates = []
+    for year in range(first_year, first_year + years):
+        day = date(year, 4, 1)
+        while day.month <= 10:
+            dates.append(str(day))
+            day += timedelta(days=step_days)
+    doy = np.array([date.fromisoformat(d).timetuple().tm_yday for d in dates])
+    season = np.sin((doy - 91) / 214 * np.pi)[:, None]
+    values = 0.2 + 0.3 * season * np.linspace(0.5, 1.5, len(INDEXES)) + rng.normal(0, 0.02, (len(dates), len(INDEXES)))
+    df = pd.DataFrame(values, index=pd.Index(dates, name="date"), columns=INDEXES)
+
+    # Blooms after the first two seasons, so the baseline has history
+    bloom_columns = [c for c in INDEXES if c in BLOOM_INDEXES]
+    start = len(dates) // years * 2
+    blooms = set()
+    for i in rng.choice(np.arange(start, len(dates)), n_blooms, replace=False):
+        column = bloom_columns[rng.integers(len(bloom_columns))]
+        df.iloc[i, INDEXES.index(column)] += 0.4
+        blooms.add((dates[i], column))
+    return df, blooms
+
+
+def rescan_score(df, position, bin_days=7, window=2):
+    # Reference: the baseline of one date recomputed from the whole history before it
+    history = df.iloc[:position]
+    bins = (pd.to_datetime(history.index).dayofyear - 1) // bin_days
+    b = (pd.Timestamp(df.index[position]).dayofyear - 1) // bin_days
+    rows = history[(bins >= b - window) & (bins <= b + window)]
+    median = rows.median()
+    mad = (rows - median).abs().median()
+    return (df.iloc[position] - median) / (MAD_SCALE * mad)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--aois", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    df, blooms = seasonal_series(args.years)
+    per_season = len(df) // args.years
+    print(f"{len(df)} dates over {args.years} seasons, {len(blooms)} injected blooms")
+
+    # Default baseline: at most max_per_bin dates per bin, so the window stops growing after some seasons
+    baseline = SeasonalBaseline(INDEXES)
+    alerts, times = [], []
+    for date_str, row in zip(df.index, df.to_numpy()):
+        start = time.perf_counter()
+        alerts.extend(baseline.update(date_str, row))
+        times.append(time.perf_counter() - start)
+    early = np.median(times[per_season * 2:per_season * 3]) * 1e6
+    late = np.median(times[-per_season:]) * 1e6
+
+    start = time.perf_counter()
+    for position in range(len(df) - per_season, len(df)):
+        rescan_score(df, position)
+    rescan = (time.perf_counter() - start) / per_season * 1e6
+    print(f"per new date: {early:7.1f} us in season 3, {late:7.1f} us in season {args.years} "
+          f"(rescanning the history: {rescan:8.1f} us)")
+
+    found = {(a["date"], a["index"]) for a in alerts if a["kind"] == "bloom"}
+    recall = len(found & blooms) / len(blooms)
+    false_alerts = len({(a["date"], a["index"]) for a in alerts} - blooms)
+    scored = len(df) - per_season
+    print(f"blooms detected: {recall:.0%}, other alerts: {false_alerts} over {scored * len(INDEXES)} scored values")
+
+    # Same z-scores as the rescanning reference, without the cap
+    check = SeasonalBaseline(INDEXES, max_per_bin=10 ** 6)
+    check.update_frame(df.iloc[:-1])
+    z, _, _ = check.score(df.index[-1], df.iloc[-1].to_numpy())
+    same_z = np.allclose(z, rescan_score(df, len(df) - 1).to_numpy(), equal_nan=True)
+
+    # Chunked updates and a saved/reloaded baseline give the same alerts
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "baseline.json")
+        chunked, state = [], SeasonalBaseline(INDEXES)
+        for i in range(0, len(df), 97):
+            chunked.extend(state.update_frame(df.iloc[i:i + 97]))
+            state.save(path)
+            state = load_baseline(path, INDEXES)
+    same_alerts = chunked == alerts
+    print(f"z-scores match the rescan: {same_z}, chunked and reloaded updates match: {same_alerts}")
+
+    # Many AOIs with the full history: one new date each
+    history = SeasonalBaseline(INDEXES)
+    history.update_frame(df.iloc[:-1])
+    baselines = [SeasonalBaseline.from_dict({**history.to_dict(), "aoi": f"aoi-{i}"}) for i in range(args.aois)]
+    start = time.perf_counter()
+    for b in baselines:
+        b.update(df.index[-1], df.iloc[-1].to_numpy())
+    print(f"{args.aois} AOIs, one new date each: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    ok = same_z and same_alerts and recall >= 0.9 and late < early * 3 and late < rescan
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
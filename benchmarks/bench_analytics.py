@@ -0,0 +1,124 @@
+"""
+Charts page aggregates: the per-rerun pandas work of the previous page
+(three table copies per index, monthly resampling, correlation) against the
+memoized AnalyticsFrame, plus the page's rerun time under AppTest.
+
+    python -m benchmarks.bench_analytics
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEXES = ['SABI', 'CGI', 'CDOM', 'DOC', 'Cyanobacteria', 'Turbidity']
+
+
+def synthetic_stats(n_dates=900, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2023-03-01", periods=n_dates, freq="D").strftime("%Y-%m-%d")
+    values = rng.normal(size=(n_dates, len(INDEXES))).cumsum(axis=0).round(2)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return pd.DataFrame(values, index=pd.Index(dates, name="date"), columns=INDEXES)
+
+
+def old_rerun(all_stats):
+    # The previous page body: every tab re-derived its tables from fresh copies
+    get = {name: (lambda name=name: all_stats[[name]].rename(columns={name: "median"})) for name in INDEXES}
+    for name in INDEXES:
+        get[name]()
+    monthly = {}
+    for name in INDEXES:
+        df = get[name]()
+        df.index = pd.to_datetime(df.index)
+        m = df.resample("ME").median().dropna()
+        m.index = m.index.strftime("%B")
+        monthly[name] = m
+    merged = pd.concat([get[name]().rename(columns={"median": name}) for name in INDEXES], axis=1).dropna()
+    corr = merged.corr().round(2)
+    return monthly, corr.mask(np.triu(np.ones_like(corr, dtype=bool)))
+
+
+def new_rerun(frame):
+    for name in INDEXES:
+        frame.index_frame(name)
+    monthly = {name: frame.monthly_medians(name) for name in INDEXES}
+    return monthly, frame.correlation()
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def page_reruns(runs=3):
+    from benchmarks import fake_ee
+    fake_ee.install()
+    from streamlit.testing.v1 import AppTest
+    import stats
+
+    stats.refresh_snapshot()
+    app = AppTest.from_file(os.path.join(ROOT, "pages", "1_📈 Charts.py"), default_timeout=120)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+    return times, [e.value for e in app.exception]
+
+
+def main():
+    os.environ.setdefault("WQ_DATA_DIR", tempfile.mkdtemp(prefix="wq-bench-"))
+    from benchmarks import fake_ee
+    fake_ee.quiet_streamlit()
+    from analytics import analytics_frame
+
+    all_stats = synthetic_stats()
+    old_time, (old_monthly, old_corr) = timed(lambda: old_rerun(all_stats), 5)
+    build_time, frame = timed(lambda: analytics_frame(all_stats), 1)
+    first_time, _ = timed(lambda: new_rerun(frame), 1)
+    new_time, (new_monthly, new_corr) = timed(lambda: new_rerun(frame), 50)
+
+    print(f"old rerun:           {old_time * 1000:8.2f} ms")
+    print(f"analytics build:     {build_time * 1000:8.2f} ms (once per data version)")
+    print(f"first rerun:         {first_time * 1000:8.2f} ms (computes the aggregates)")
+    print(f"memoized rerun:      {new_time * 1000:8.2f} ms")
+
+    ok = True
+    for name in INDEXES:
+        if not np.allclose(old_monthly[name]["median"], new_monthly[name]["median"], atol=0.01):
+            print(f"Monthly medians differ for {name}")
+            ok = False
+    if not np.allclose(old_corr.to_numpy(), new_corr.to_numpy(), atol=0.011, equal_nan=True):
+        print("Correlation matrices differ")
+        ok = False
+
+    view = frame.monthly_medians(INDEXES[0])
+    view.index = range(len(view))
+    try:
+        view.iloc[0, 0] = 0
+        print("Memoized frame is writable")
+        ok = False
+    except ValueError:
+        pass
+    if list(frame.monthly_medians(INDEXES[0]).index) == list(view.index):
+        print("Relabelling a view changed the memoized frame")
+        ok = False
+
+    if analytics_frame(all_stats.copy()) is not frame:
+        print("Equal content did not reuse the memoized frame")
+        ok = False
+
+    times, exceptions = page_reruns()
+    print("Charts page runs:    " + ", ".join(f"{t * 1000:.0f} ms" for t in times)
+          + f", exceptions: {len(exceptions)}")
+    return 0 if ok and not exceptions else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Runs the headless batch pipeline against the fake `ee` backend: checks that
+it does not import Streamlit, that a run interrupted by failing batches
+resumes with only the remaining dates and ends with the same table as an
+uninterrupted run (and as the app's stats_all_indexes), in Parquet and CSV,
+and that --publish feeds the snapshot the pages read.
+
+    python -m benchmarks.bench_batch
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks import fake_ee
+
+
+def main():
+    data_dir = tempfile.mkdtemp(prefix="wq-batch-")
+    os.environ["WQ_DATA_DIR"] = data_dir
+    fake_ee.install(latency=0.02)
+
+    import batch
+    import stats
+    from gee_data import ImageryCatalog
+    from snapshot import load_snapshot
+
+    ok = "streamlit" not in sys.modules
+    print(f"streamlit imported: {not ok}")
+
+    reference = stats.stats_all_indexes(ImageryCatalog().collection, stats.STATS_INDEXES)
+    quiet = lambda message: None
+
+    for fmt in batch.FORMATS:
+        out = os.path.join(data_dir, f"out-{fmt}")
+
+        start = time.perf_counter()
+        clean = batch.run_batch(out_dir=os.path.join(out, "clean"), fmt=fmt, batch_size=4, log=quiet)
+        clean_time = time.perf_counter() - start
+
+        # Every third batch fails on the first run
+        original = batch.stats_all_indexes
+        calls = []
+
+        def flaky(ic, indexes):
+            calls.append(1)
+            if len(calls) % 3 == 0:
+                raise RuntimeError("simulated Earth Engine error")
+            return original(ic, indexes)
+
+        batch.stats_all_indexes = flaky
+        try:
+            batch.run_batch(out_dir=os.path.join(out, "resumed"), fmt=fmt, batch_size=4, log=quiet)
+            interrupted = False
+        except RuntimeError:
+            interrupted = True
+        finally:
+            batch.stats_all_indexes = original
+        first_calls = len(calls)
+
+        calls.clear()
+        batch.stats_all_indexes = lambda ic, indexes: calls.append(1) or original(ic, indexes)
+        try:
+            resumed = batch.run_batch(out_dir=os.path.join(out, "resumed"), fmt=fmt, batch_size=4, log=quiet)
+        finally:
+            batch.stats_all_indexes = original
+
+        same = resumed.equals(clean) and clean.astype("float64").equals(reference.astype("float64"))
+        print(f"{fmt:8s} clean run {clean_time * 1000:6.1f} ms, {len(clean)} dates; interrupted: {interrupted}, "
+              f"resumed {len(calls)} of {first_calls} batches; same table: {same}")
+        ok &= interrupted and len(calls) == first_calls // 3 and same
+
+    # Publishing: the app's store and snapshot get the batch table
+    added = batch.publish(clean)
+    snapshot = load_snapshot()
+    published = snapshot is not None and snapshot.dates == list(clean.index)
+    print(f"published {added} rows, snapshot matches: {published}")
+    ok &= published and "streamlit" not in sys.modules
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
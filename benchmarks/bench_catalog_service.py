@@ -0,0 +1,135 @@
+"""
+Serves the imagery catalog through the stale-while-revalidate CatalogService
+against the fake `ee` backend and reports what a visitor waits for: many
+sessions arriving at once on a cold start (one build), the first visitor
+after a restart (persisted catalog, no round trip) and readers while the
+catalog is rebuilt in the background. Also checks that a failed rebuild
+keeps the last good catalog and that a date found by a revalidation
+reaches the pages' catalog descriptor while the startup snapshot is older.
+
+    python -m benchmarks.bench_catalog_service --sessions 16
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import fake_ee
+
+
+def timed_get(service):
+    start = time.perf_counter()
+    catalog = service.get()
+    return catalog, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--max-age", type=float, default=1.0, help="Revalidation period of the rebuild check")
+    args = parser.parse_args(argv)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["WQ_DATA_DIR"] = tmp
+        # Every revalidation builds the catalog, not a shared cache hit of the same period
+        os.environ["WQ_SHARED_CACHE"] = "off"
+        fake_ee.install(latency=args.latency)
+        fake_ee.quiet_streamlit()
+        import gee_data
+        from gee_data import CatalogService, ImageryCatalog
+
+        path = os.path.join(tmp, "catalog.json")
+        # Warm the persisted cloud coverage, which every build reuses
+        ImageryCatalog()
+
+        fake_ee.stats.reset()
+        start = time.perf_counter()
+        ImageryCatalog()
+        blocking = time.perf_counter() - start
+        print(f"plain catalog build: {blocking * 1000:6.1f} ms, {fake_ee.stats.round_trips} round trips")
+
+        # Cold start: every session waits for the same single build
+        service = CatalogService(path=path, max_age=3600)
+        with ThreadPoolExecutor(args.sessions) as pool:
+            results = list(pool.map(lambda _: timed_get(service), range(args.sessions)))
+        same = len({id(catalog) for catalog, _ in results}) == 1
+        slowest = max(secs for _, secs in results)
+        print(f"cold start, {args.sessions} sessions: {service.builds} build(s), slowest {slowest * 1000:6.1f} ms, "
+              f"one catalog: {same}")
+        ok &= service.builds == 1 and same
+        service.stop()
+
+        # Restart: served from the persisted catalog without a request
+        fake_ee.stats.reset()
+        restarted = CatalogService(path=path, max_age=3600)
+        catalog, secs = timed_get(restarted)
+        restored = catalog.dates == results[0][0].dates and restarted.version == service.version
+        print(f"after a restart: {secs * 1000:6.3f} ms, {fake_ee.stats.round_trips} round trips, "
+              f"same dates and version: {restored}")
+        ok &= restored and fake_ee.stats.round_trips == 0
+        restarted.stop()
+
+        # Revalidation: readers keep getting the last good catalog while it is rebuilt
+        revalidating = CatalogService(path=path, max_age=args.max_age)
+        first = revalidating.version
+        stop = threading.Event()
+        reads = []
+
+        def reader():
+            while not stop.is_set():
+                reads.append(timed_get(revalidating)[1])
+                time.sleep(0.001)
+
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        window = args.max_age * 3.5
+        time.sleep(window)
+        stop.set()
+        for thread in readers:
+            thread.join()
+        revalidating.stop()
+        swapped = revalidating.version - first
+        print(f"revalidating every {args.max_age:.1f} s for {window:.1f} s: {swapped} swaps in "
+              f"{revalidating.builds} builds, {len(reads)} reads, slowest {max(reads) * 1000:6.3f} ms, "
+              f"age {revalidating.age:.2f} s")
+        ok &= swapped == revalidating.builds and 2 <= swapped <= 4 and max(reads) < args.latency
+
+        # A failing rebuild keeps the last good catalog
+        class Failing(ImageryCatalog):
+            def __init__(self, *args, **kwargs):
+                raise RuntimeError("simulated Earth Engine error")
+
+        gee_data.ImageryCatalog = Failing
+        before = revalidating.get()
+        entry = revalidating.revalidate()
+        kept = entry[0] is before and revalidating.get() is before and revalidating.error is not None
+        print(f"failed rebuild keeps the last good catalog: {kept}")
+        ok &= kept
+        gee_data.ImageryCatalog = ImageryCatalog
+
+        # A date added by a revalidation reaches the pages, the snapshot still being the older one
+        import pandas as pd
+        from snapshot import snapshot_version, write_snapshot
+        from stats import get_imagery_cache
+
+        app_service = gee_data.get_catalog_service()
+        write_snapshot(pd.DataFrame(index=app_service.get().dates, columns=["SABI"], dtype=float))
+        fake_ee.install(fake_ee.make_scenes(41), latency=0)
+        app_service.revalidate()
+        new_date = app_service.get().dates[-1]
+        dates = get_imagery_cache(snapshot_version(), gee_data.catalog_version())["dates"]
+        app_service.stop()
+        print(f"date {new_date} added by a revalidation served to the pages: {new_date in dates}")
+        ok &= new_date in dates
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Compares the per-date composites (`compute_median_by_date` mapped over the
+dates, one filterDate scan of the collection per date) with the single-pass
+`daily_composites` (scenes grouped by day with a join) over a multi-year
+scene list against the fake `ee` backend, and checks that both produce the
+same images. Also checks the local `day_index` grouping against the per-date
+scan.
+
+    python -m benchmarks.bench_compositing
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import fake_ee
+
+
+def per_date(s2_masked, dates, indexes):
+    from gee_data import compute_median_by_date
+
+    return fake_ee.ImageCollection(
+        fake_ee.List(dates).map(lambda d: compute_median_by_date(s2_masked, d, indexes))
+    )
+
+
+def same_images(a, b):
+    # Equal band values (NaN for masked) and dates, image by image
+    if a.size() != b.size():
+        return False
+    for x, y in zip(a._images, b._images):
+        if x._props["system:time_start"] != y._props["system:time_start"] or list(x._bands) != list(y._bands):
+            return False
+        for name in x._bands:
+            u, v = (math.nan if img._bands[name] is None else img._bands[name] for img in (x, y))
+            if not (u == v or math.isnan(u) and math.isnan(v)):
+                return False
+    return True
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=240, help="Acquisition days (about 40 per season)")
+    parser.add_argument("--scenes-per-day", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    fake_ee.install(fake_ee.make_scenes(args.days, args.scenes_per_day, start="2019-04-01"))
+    from gee_data import WQ_INDEXES as INDEXES, daily_composites, daily_medians_local, day_index, s2_masked_collection
+
+    s2_masked = s2_masked_collection("2019-01-01", "2026-12-31")
+    times = s2_masked.aggregate_array("system:time_start").getInfo()
+    dates = list(day_index(times))
+    print(f"{s2_masked.size()} scenes on {len(dates)} days, {dates[0]} .. {dates[-1]}")
+
+    fake_ee.stats.reset()
+    old, old_time = timed(lambda: per_date(s2_masked, dates, INDEXES))
+    old_scans = fake_ee.stats.calls["filterDate"]
+    fake_ee.stats.reset()
+    new, new_time = timed(lambda: daily_composites(s2_masked, INDEXES, dates))
+    new_scans = fake_ee.stats.calls["filterDate"]
+    print(f"per-date:     {old_time * 1000:8.1f} ms, {old_scans} collection scans")
+    print(f"single pass:  {new_time * 1000:8.1f} ms, {new_scans} collection scans, "
+          f"{old_time / new_time:.1f}x faster")
+
+    ok = same_images(old, new)
+    print(f"composites match: {ok}")
+
+    # A subset of the dates (as the statistics refresh batches) gives the same images too
+    subset = dates[::7]
+    ok_subset = same_images(per_date(s2_masked, subset, INDEXES), daily_composites(s2_masked, INDEXES, subset))
+    print(f"subset composites match: {ok_subset}")
+
+    # Local grouping: the same scenes per day as the filterDate scan, and the same medians
+    index = day_index(times)
+    ok_local = all(
+        len(positions) == s2_masked.filterDate(day, fake_ee.Date(day).advance(1, "day")).size()
+        for day, positions in index.items()
+    )
+    bands = list(s2_masked._images[0]._bands)
+    values = np.array([[np.nan if img._bands[b] is None else img._bands[b] for b in bands]
+                       for img in s2_masked._images])
+    local_days, local_medians = daily_medians_local(values, times)
+    reference = np.array([[np.nan if v is None else v for v in
+                           (s2_masked.filterDate(day, fake_ee.Date(day).advance(1, "day")).median()._bands[b]
+                            for b in bands)] for day in local_days])
+    ok_local &= local_days == dates and np.allclose(local_medians, reference, equal_nan=True)
+    _, local_time = timed(lambda: day_index(times))
+    print(f"local day index: {local_time * 1000:.2f} ms for {len(times)} scenes, matches: {ok_local}")
+
+    return 0 if ok and ok_subset and ok_local and new_scans < old_scans else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
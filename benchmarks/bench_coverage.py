@@ -0,0 +1,134 @@
+"""
+Builds the imagery catalog with and without the cloud-coverage pruning over
+an archive where a share of the days is clouded over the AOI (fake `ee`
+backend), and reports the dates kept, the round trips and the work of the
+statistics over the catalog. Also checks that the coverage is computed once
+per day: a rebuilt catalog reuses it, a scene added to a day recomputes only
+that day, and a day the reduction has no value for (a null mean, or no row)
+counts as not covered and is cached like any other.
+
+    python -m benchmarks.bench_coverage
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks import fake_ee
+
+
+def clouded_archive(n_days, scenes_per_day, clouded_share, seed=0):
+    # Synthetic scenes with every scene of `clouded_share` of the days flagged as opaque cloud
+    scenes = fake_ee.make_scenes(n_days, scenes_per_day, seed=seed)
+    days = sorted({img._props["system:index"][:8] for img in scenes})
+    clouded = set(random.Random(seed).sample(days, int(len(days) * clouded_share)))
+    for img in scenes:
+        if img._props["system:index"][:8] in clouded:
+            img._bands["QA60"] = 1 << 10
+    return scenes
+
+
+def fully_clouded(scenes):
+    # Days whose scenes passing the scene-wide cloud filter are all flagged in QA60
+    flags = {}
+    for img in scenes:
+        if img._props["CLOUDY_PIXEL_PERCENTAGE"] < 20:
+            day = img._props["system:index"][:8]
+            flags.setdefault(f"{day[:4]}-{day[4:6]}-{day[6:]}", []).append(img._bands["QA60"] != 0)
+    return {day for day, clouded in flags.items() if all(clouded)}
+
+
+def without_values(days):
+    # Coverage reductions with a null mean for the first of `days` and no row for the others
+    reduce_columns = fake_ee.ImageCollection.reduceColumns
+
+    def reduce(self, reducer, selectors):
+        result = reduce_columns(self, reducer, selectors)
+        if selectors != ["day", "coverage"]:
+            return result
+        rows = [[day, None if day == days[0] else fraction]
+                for day, fraction in result._values["list"] if day not in days[1:]]
+        return fake_ee.Dictionary({"list": rows})
+
+    fake_ee.ImageCollection.reduceColumns = reduce
+    return reduce_columns
+
+
+def build(path, **kwargs):
+    from gee_data import ImageryCatalog
+
+    fake_ee.stats.reset()
+    start = time.perf_counter()
+    catalog = ImageryCatalog(coverage_path=path, **kwargs)
+    return catalog, fake_ee.stats.round_trips, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--scenes-per-day", type=int, default=2)
+    parser.add_argument("--clouded", type=float, default=0.3, help="Share of fully clouded days")
+    parser.add_argument("--min-coverage", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    scenes = clouded_archive(args.days, args.scenes_per_day, args.clouded)
+    # Measure the Earth Engine work itself, not shared cache hits from earlier runs
+    os.environ["WQ_SHARED_CACHE"] = "off"
+    fake_ee.install(scenes)
+    import stats
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "coverage.json")
+        for label, min_coverage in (("no pruning", 0.0), ("pruning   ", args.min_coverage)):
+            catalog, trips, secs = build(path, start_date="2023-01-01", min_coverage=min_coverage)
+            fake_ee.stats.reset()
+            stats.stats_all_indexes(catalog.collection, stats.STATS_INDEXES)
+            print(f"{label}: {len(catalog.dates):4d} dates, catalog {trips} round trips {secs * 1000:6.1f} ms, "
+                  f"statistics {sum(fake_ee.stats.calls.values())} calls")
+        clouded = fully_clouded(scenes)
+        pruned = set(catalog.coverage) - set(catalog.dates)
+        print(f"pruned {len(pruned)} dates, {len(clouded)} fully clouded")
+        ok &= pruned == clouded
+
+        # Rebuilt from the persisted coverage: no coverage round trip
+        _, trips, _ = build(path, start_date="2023-01-01", min_coverage=args.min_coverage)
+        print(f"rebuilt catalog: {trips} round trips")
+        ok &= trips == 1
+
+        # A late scene of an already covered day: only that day is reduced again
+        extra = fake_ee.Image(dict(scenes[0]._bands), {**scenes[0]._props, "system:index": "late"})
+        fake_ee.install(scenes + [extra])
+        fake_ee.stats.reset()
+        catalog, trips, _ = build(path, start_date="2023-01-01", min_coverage=args.min_coverage)
+        joined = fake_ee.stats.calls["fromImages"]
+        print(f"late scene: {trips} round trips, {joined} day(s) reduced")
+        ok &= trips == 2 and joined == 1
+
+        # SCL masking prunes further (days whose scenes are all classified as cloud or shadow)
+        scl_catalog = build(os.path.join(tmp, "scl.json"), start_date="2023-01-01",
+                            min_coverage=args.min_coverage, scl=True)[0]
+        print(f"with SCL masking: {len(scl_catalog.dates)} dates")
+        ok &= set(scl_catalog.dates) <= set(catalog.dates)
+
+        # Days without a coverage value are pruned, and cached so a rebuild does not reduce them again
+        empty = catalog.dates[:2]
+        reduce_columns = without_values(empty)
+        try:
+            nodata_path = os.path.join(tmp, "nodata.json")
+            catalog, trips, _ = build(nodata_path, start_date="2023-01-01", min_coverage=args.min_coverage)
+            cached = [catalog.coverage.get(day) for day in empty]
+            _, rebuilt, _ = build(nodata_path, start_date="2023-01-01", min_coverage=args.min_coverage)
+        finally:
+            fake_ee.ImageCollection.reduceColumns = reduce_columns
+        print(f"null / missing coverage: kept {sorted(set(empty) & set(catalog.dates))}, cached as {cached}, "
+              f"rebuilt in {rebuilt} round trips")
+        ok &= not set(empty) & set(catalog.dates) and cached == [0.0, 0.0] and rebuilt == 1
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Exports the imagery catalog into a local raster cube against the fake `ee`
+backend (`python -m batch --cube`, in two runs: the first half of the
+catalog, then the dates added since) and checks the result: the grid and
+bounds of the AOI, one computePixels request per new date, every (date,
+index) slice and overview level against the pixels of its composite, masked
+pixels as NaN and the number of chunk files.
+
+    python -m benchmarks.bench_cube_export
+"""
+import argparse
+import glob
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import fake_ee
+
+
+def expected_slice(catalog, date_str, name, grid):
+    # The composite's band as the fake serves it at pixel level
+    value = catalog.image(date_str)._bands[name]
+    return fake_ee._pixels(value, *fake_ee.grid_centres(grid)).astype(np.float32)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["WQ_DATA_DIR"] = tmp
+        os.environ["WQ_SHARED_CACHE"] = "off"
+        # A fully clouded day (kept with min_coverage=0) exports as NODATA, read back as NaN
+        scenes = fake_ee.make_scenes()
+        for scene in scenes[2:4]:
+            scene._bands["QA60"] = 1 << 10
+        fake_ee.install(scenes, latency=args.latency)
+        import batch
+        import gee_data
+        from raster_cube import block_mean
+
+        root = os.path.join(tmp, "cube")
+        catalog = gee_data.ImageryCatalog(batch.STATS_INDEXES, min_coverage=0)
+        middle = catalog.dates[len(catalog.dates) // 2]
+
+        runs = []
+        for end_date in (middle, None):
+            fake_ee.stats.reset()
+            start = time.perf_counter()
+            cube = batch.export_cube(end_date=end_date, root=root, min_coverage=0, log=lambda msg: None)
+            runs.append((len(cube.dates), fake_ee.stats.calls["computePixels"], time.perf_counter() - start))
+
+        first, second = runs
+        print(f"first run: {first[0]} dates, {first[1]} computePixels, {first[2]:.2f} s")
+        print(f"second run: {second[0] - first[0]} new dates, {second[1]} computePixels, {second[2]:.2f} s")
+        incremental = first[1] == first[0] and second[1] == second[0] - first[0] and cube.dates == catalog.dates
+        ok &= incremental
+
+        grid = cube.meta["grid"]
+        x0, y0, x1, y1 = fake_ee.AOI_BOUNDS["EPSG:32633"]
+        west, south, east, north = fake_ee.AOI_BOUNDS["EPSG:4326"]
+        shape = (round((y1 - y0) / 10), round((x1 - x0) / 10))
+        placed = tuple(cube.meta["shape"]) == shape and cube.meta["bounds"] == [[south, west], [north, east]]
+        print(f"grid {cube.meta['shape']} at 10 m, AOI bounds: {placed}")
+        ok &= placed
+
+        exact = overviews = True
+        masked = 0
+        for date_str in cube.dates:
+            for name in cube.indexes:
+                expected = expected_slice(catalog, date_str, name, grid)
+                masked += int(np.isnan(expected).all())
+                exact &= np.allclose(cube.read(date_str, name), expected, equal_nan=True)
+                for factor in cube.overviews:
+                    overviews &= np.allclose(cube.read(date_str, name, factor), block_mean(expected, factor),
+                                             equal_nan=True)
+        n_chunks = math.ceil(len(cube.dates) / cube.meta["chunk_dates"])
+        chunk_files = {
+            factor: len(glob.glob(os.path.join(root, "chunk-*.npy" if factor == 1 else f"overview{factor}-chunk-*.npy")))
+            for factor in [1, *cube.overviews]
+        }
+        print(f"slices match their composites: {exact}, overviews match: {overviews}, "
+              f"{masked} fully masked slices as NaN")
+        print(f"chunk files per level: {chunk_files} (expected {n_chunks} each)")
+        ok &= exact and overviews and masked > 0 and all(n == n_chunks for n in chunk_files.values())
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Evaluates per-date composites serially and through the shared RequestExecutor
+against the fake `ee` backend with simulated round-trip latency. Also checks
+in-flight deduplication and backoff on quota errors.
+
+    python -m benchmarks.bench_executor
+"""
+import argparse
+import sys
+import threading
+import time
+
+from benchmarks import fake_ee
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    fake_ee.install(latency=args.latency)
+    fake_ee.quiet_streamlit()
+    from ee_executor import RequestExecutor
+    from gee_data import get_s2_imagery
+
+    catalog = get_s2_imagery()
+    images = [catalog.image(d).bandNames() for d in catalog.dates[:32]]
+
+    fake_ee.stats.reset()
+    start = time.perf_counter()
+    serial = [img.getInfo() for img in images]
+    serial_time = time.perf_counter() - start
+
+    executor = RequestExecutor(max_workers=args.workers, rate=1000)
+    start = time.perf_counter()
+    parallel = executor.map(lambda img: img.getInfo(), images)
+    parallel_time = time.perf_counter() - start
+    print(f"{len(images)} getInfo calls: serial {serial_time:.2f} s, "
+          f"executor ({args.workers} workers) {parallel_time:.2f} s, speedup {serial_time / parallel_time:.1f}x")
+
+    fake_ee.stats.reset()
+    same = catalog.image(catalog.dates[0]).bandNames()
+    futures = [executor.submit(same.getInfo, key=same.serialize()) for _ in range(10)]
+    [f.result() for f in futures]
+    print(f"10 identical in-flight requests: {fake_ee.stats.round_trips} round trip(s), "
+          f"{executor.deduplicated} deduplicated")
+
+    failures = iter([fake_ee.EEException("Quota exceeded"), fake_ee.EEException("Too many concurrent aggregations")])
+    lock = threading.Lock()
+
+    def flaky():
+        with lock:
+            error = next(failures, None)
+        if error is not None:
+            raise error
+        return "ok"
+
+    retrying = RequestExecutor(max_workers=1, rate=1000, backoff=0.01)
+    print(f"quota errors: result {retrying.run(flaky)!r} after {retrying.retries} retries")
+
+    ok = parallel == serial and fake_ee.stats.round_trips == 1 and retrying.retries == 2
+    return 0 if ok and parallel_time < serial_time else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
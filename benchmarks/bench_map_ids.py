@@ -0,0 +1,75 @@
+"""
+Replays Water Quality page reruns (users toggling between dates and indexes
+they already viewed) against the fake `ee` backend and counts the getMapId
+requests with and without the MapIdCache, then checks the expiry handling
+with a short TTL.
+
+    python -m benchmarks.bench_map_ids
+"""
+import argparse
+import random
+import sys
+import time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reruns", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    from benchmarks import fake_ee
+    fake_ee.install(latency=args.latency)
+    fake_ee.quiet_streamlit()
+    from create_map import vis_params
+    from gee_data import get_s2_imagery
+    from tile_cache import MapIdCache, ee_tile_url_format
+
+    catalog = get_s2_imagery()
+    rng = random.Random(0)
+    views = [(rng.choice(catalog.dates[-6:]), rng.choice(["SABI", "CDOM", "Turbidity"])) for _ in range(args.reruns)]
+    images = {d: catalog.image(d) for d in {d for d, _ in views}}
+
+    fake_ee.stats.reset()
+    start = time.perf_counter()
+    for date_str, index_name in views:
+        ee_tile_url_format(images[date_str].select(index_name), vis_params[index_name])
+    uncached_time = time.perf_counter() - start
+    uncached_calls = fake_ee.stats.calls["getMapId"]
+
+    fake_ee.stats.reset()
+    cache = MapIdCache()
+    start = time.perf_counter()
+    for date_str, index_name in views:
+        cache.url_format(date_str, index_name, vis_params[index_name], images[date_str].select(index_name))
+    cached_time = time.perf_counter() - start
+    cached_calls = fake_ee.stats.calls["getMapId"]
+    stats = cache.stats()
+
+    print(f"{args.reruns} reruns over {len(set(views))} distinct (date, index) layers")
+    print(f"addLayer every rerun: {uncached_calls:4d} getMapId, {uncached_time:6.2f} s")
+    print(f"MapIdCache:           {cached_calls:4d} getMapId, {cached_time:6.2f} s, saved {stats['getmapid_saved']}")
+    ok = cached_calls == len(set(views)) == stats["getmapid_calls"]
+
+    # Expiry: served while fresh, refreshed in the background near expiry, fetched again once expired
+    fake_ee.stats.reset()
+    date_str, index_name = views[0]
+    image, vis = images[date_str].select(index_name), vis_params[index_name]
+    cache = MapIdCache(ttl=1.0, refresh_margin=0.5)
+    first = cache.url_format(date_str, index_name, vis, image)
+    fresh = cache.url_format(date_str, index_name, vis, image)
+    time.sleep(0.6)
+    stale = cache.url_format(date_str, index_name, vis, image)
+    time.sleep(args.latency + 0.2)
+    refreshed = cache.url_format(date_str, index_name, vis, image)
+    time.sleep(1.1)
+    expired = cache.url_format(date_str, index_name, vis, image)
+    stats = cache.stats()
+    print(f"expiry: {stats['hits']} hits, {stats['misses']} misses, {stats['refreshes']} background refreshes")
+    ok &= first == fresh == stale and refreshed != stale and expired != refreshed
+    ok &= stats["refreshes"] == 1 and stats["misses"] == 2
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
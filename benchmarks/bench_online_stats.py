@@ -0,0 +1,105 @@
+"""
+Checks the running statistics of online_stats.OnlineStats against the pandas
+baseline (means, variances, complete-date correlation, monthly medians), for
+a single stream, for merged partial states and after a save/load round
+trip, and times folding in one new date against recomputing from scratch.
+
+    python -m benchmarks.bench_online_stats
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_analytics import INDEXES, synthetic_stats
+
+
+def pandas_baseline(df):
+    wide = df.copy()
+    wide.index = pd.to_datetime(wide.index)
+    monthly = wide.groupby(wide.index.to_period("M")).median()
+    monthly.index = monthly.index.strftime("%Y-%m")
+    return {
+        "mean": df.mean().to_numpy(),
+        "variance": df.var().to_numpy(),
+        "correlation": df.dropna().corr().to_numpy(),
+        "monthly": monthly.dropna(how="all"),
+    }
+
+
+def compare(label, state, expected, rtol=1e-9, atol=1e-9):
+    # Agreement with pandas up to floating-point summation order
+    monthly = state.monthly_medians()
+    checks = {
+        "mean": np.allclose(state.mean, expected["mean"], rtol=rtol, atol=atol),
+        "variance": np.allclose(state.variance, expected["variance"], rtol=rtol, atol=atol),
+        "correlation": np.allclose(state.correlation().to_numpy(), expected["correlation"],
+                                   rtol=rtol, atol=atol, equal_nan=True),
+        "monthly": list(monthly.index) == list(expected["monthly"].index) and np.allclose(
+            monthly.to_numpy(), expected["monthly"].to_numpy(), rtol=rtol, atol=atol, equal_nan=True),
+    }
+    failed = [name for name, ok in checks.items() if not ok]
+    print(f"{label:<22} {'ok' if not failed else 'MISMATCH: ' + ', '.join(failed)}")
+    return not failed
+
+
+def main():
+    from online_stats import OnlineStats, load_online_stats
+
+    df = synthetic_stats(n_dates=1200, seed=1)
+    # Large offset: the naive sum-of-squares formula would lose precision here
+    df = df + 1e4
+    expected = pandas_baseline(df)
+    ok = True
+
+    state = OnlineStats(INDEXES)
+    state.update_frame(df)
+    ok &= compare("streamed", state, expected)
+
+    parts = [OnlineStats(INDEXES) for _ in range(3)]
+    for part, rows in zip(parts, np.array_split(np.arange(len(df)), 3)):
+        part.update_frame(df.iloc[rows])
+    merged = parts[0].merge(parts[1]).merge(parts[2])
+    ok &= compare("merged (3 parts)", merged, expected)
+
+    # Interleaved dates: months split across the parts
+    even, odd = OnlineStats(INDEXES), OnlineStats(INDEXES)
+    even.update_frame(df.iloc[::2])
+    odd.update_frame(df.iloc[1::2])
+    ok &= compare("merged (interleaved)", even.merge(odd), expected)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="wq-bench-"), "online_stats.json")
+    state.save(path)
+    loaded = load_online_stats(path, INDEXES)
+    ok &= compare("save/load", loaded, expected)
+    if not (np.array_equal(loaded.comoment, state.comoment) and np.array_equal(loaded.m2, state.m2)
+            and loaded.dates == state.dates):
+        print("Loaded state differs from the saved one")
+        ok = False
+
+    if state.update_frame(df) != 0 or state.update(df.index[0], df.iloc[0]):
+        print("Dates already folded in were counted again")
+        ok = False
+
+    # One new date: fold in vs recompute everything
+    history, new = df.iloc[:-1], df.iloc[-1:]
+    base = OnlineStats(INDEXES)
+    base.update_frame(history)
+    start = time.perf_counter()
+    base.update_frame(new)
+    base.correlation()
+    base.monthly_medians()
+    online_time = time.perf_counter() - start
+    start = time.perf_counter()
+    pandas_baseline(df)
+    full_time = time.perf_counter() - start
+    print(f"one new date: online {online_time * 1000:.2f} ms, pandas recompute {full_time * 1000:.2f} ms")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
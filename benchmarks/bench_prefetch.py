@@ -0,0 +1,94 @@
+"""
+Steps through the dates with the Next layer button (with a short pause per
+step, as a user looking at each map) against the fake `ee` backend, and
+reports the time to get each layer's tile URL template and the coarse AOI
+statistics with and without the neighbour prefetch. Also checks that a
+prefetched date stops at the coarse statistics until it is shown, and the
+cancellation on a jump and the budget.
+
+    python -m benchmarks.bench_prefetch
+"""
+import argparse
+import statistics
+import sys
+import time
+
+
+def step_through(catalog, dates, index_name, steps, think, prefetch):
+    # As the Water Quality page: the layer and the progressive statistics of the date shown,
+    # the layers and coarse statistics of its neighbours warmed in the background
+    from create_map import vis_params, warm_index_layer
+    from prefetch import PrefetchScheduler, neighbour_dates
+    from stats import PROGRESSIVE_SCALES, progressive_date_stats
+    from tile_cache import MapIdCache
+
+    map_ids = MapIdCache()
+    jobs = {}
+    scheduler = PrefetchScheduler()
+
+    def date_stats(date_str):
+        if date_str not in jobs:
+            jobs[date_str] = progressive_date_stats(catalog, date_str, until=PROGRESSIVE_SCALES[0])
+        return jobs[date_str]
+
+    def warm(date_str, name):
+        warm_index_layer(catalog, date_str, name, map_ids=map_ids)
+        date_stats(date_str).wait(timeout=10)
+
+    current = dates[0]
+    waits = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        map_ids.url_format(current, index_name, vis_params[index_name], catalog.image(current).select(index_name))
+        date_stats(current).refine().wait(timeout=10)
+        waits.append(time.perf_counter() - start)
+        if prefetch:
+            scheduler.schedule([(d, index_name) for d in neighbour_dates(dates, current)], warm)
+        time.sleep(think)
+        current = dates[(dates.index(current) + 1) % len(dates)]
+    return waits, scheduler, jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--steps", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--think", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    from benchmarks import fake_ee
+    fake_ee.install(latency=args.latency)
+    from gee_data import ImageryCatalog
+    from prefetch import PrefetchScheduler
+
+    dates = ImageryCatalog().dates
+    ok = True
+    for prefetch in (False, True):
+        catalog = ImageryCatalog()
+        waits, scheduler, jobs = step_through(catalog, dates, "SABI", args.steps, args.think, prefetch)
+        label = "with prefetch" if prefetch else "no prefetch  "
+        print(f"{label}: median wait {statistics.median(waits) * 1000:7.1f} ms, "
+              f"max {max(waits[1:]) * 1000:7.1f} ms after the first layer, scheduler {scheduler.stats()}")
+        if prefetch:
+            ok &= max(waits[1:]) < args.latency / 2
+            # The date prefetched after the last step was never shown: coarse statistics only
+            ahead = dates[args.steps % len(dates)]
+            held = jobs[ahead].current()[0] == jobs[ahead].levels[0] and not jobs[ahead].done
+            print(f"prefetched, not shown: {ahead} held at {jobs[ahead].current()[0]} m: {held}")
+            ok &= held
+
+    # A jump cancels what was queued for the previous position; the budget caps started tasks
+    scheduler = PrefetchScheduler(max_queue=4, budget=5)
+    slow = lambda date_str, index_name: time.sleep(0.2)
+    scheduler.schedule([(d, "SABI") for d in dates[:4]], slow)
+    time.sleep(0.05)
+    scheduler.schedule([(d, "SABI") for d in dates[10:14]], slow)
+    time.sleep(2)
+    stats = scheduler.stats()
+    print(f"jump: {stats}")
+    ok &= stats["cancelled"] == 3 and stats["started"] == 5 and stats["budget_left"] == 0
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
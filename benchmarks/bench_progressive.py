@@ -0,0 +1,132 @@
+"""
+Measures the progressive statistics level by level: on a local raster cube
+of synthetic composites, the time of the AOI medians and of a map layer at
+each overview level and their error against the 10 m result; against the
+fake `ee` backend (latency plus a per-pixel cost of the reduction), the time
+to each level of one date's quick look against a plain 10 m request. Also
+checks that a failed refinement is retried from the level that failed.
+
+    python -m benchmarks.bench_progressive --dates 16 --height 1200 --width 1800
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks import fake_ee
+from benchmarks.synthetic_rasters import INDEX_RANGES, synthetic_composite
+from raster_cube import RasterCube
+
+INDEXES = ['SABI', 'CGI', 'CDOM', 'DOC', 'Cyanobacteria', 'Turbidity']
+
+
+def local_levels(args, scales):
+    from create_map import colorize, vis_params
+    from stats import stats_from_cube
+
+    shape = (args.height, args.width)
+    dates = [str(date(2023, 4, 1) + timedelta(days=3 * i)) for i in range(args.dates)]
+    spans = np.array([INDEX_RANGES[name][1] - INDEX_RANGES[name][0] for name in INDEXES])
+    with tempfile.TemporaryDirectory() as tmp:
+        cube = RasterCube.create(tmp, INDEXES, shape)
+        for d in dates:
+            cube.append(d, synthetic_composite(d, INDEXES, shape))
+
+        rows = {}
+        for scale in sorted(scales):
+            start = time.perf_counter()
+            df = stats_from_cube(cube, INDEXES, scale=scale)
+            stats_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for d in dates:
+                colorize(cube.read(d, "Cyanobacteria", scale // 10), vis_params["Cyanobacteria"])
+            layer_time = time.perf_counter() - start
+            rows[scale] = df, stats_time, layer_time
+
+    exact = rows[10][0].to_numpy()
+    ok = True
+    print(f"local cube: {len(dates)} dates x {len(INDEXES)} indexes x {args.height} x {args.width}")
+    for scale in sorted(scales, reverse=True):
+        df, stats_time, layer_time = rows[scale]
+        # Error as a share of each index's value range
+        errors = np.abs(df.to_numpy() - exact) / spans * 100
+        error, worst = np.nanmedian(errors), np.nanmax(errors)
+        print(f"  {scale:3d} m: medians {stats_time / len(dates) * 1000:6.1f} ms/date, "
+              f"layer {layer_time / len(dates) * 1000:6.1f} ms/date, error {error:.3f} % of range (max {worst:.3f} %)")
+        ok &= worst < 5.0
+    ok &= rows[max(scales)][1] < rows[10][1]
+    return ok
+
+
+def ee_levels(args, scales):
+    from gee_data import ImageryCatalog
+    from stats import STATS_INDEXES, progressive_date_stats, stats_all_indexes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = ImageryCatalog(coverage_path=f"{tmp}/coverage.json")
+    date_str = catalog.dates[-1]
+
+    start = time.perf_counter()
+    exact = stats_all_indexes(catalog.collection_for([date_str]), STATS_INDEXES)
+    plain = time.perf_counter() - start
+
+    job = progressive_date_stats(catalog, date_str, STATS_INDEXES, scales=scales)
+    job.wait(scales[-1], timeout=60)
+    timings = ", ".join(f"{scale} m after {job.timings[scale] * 1000:6.1f} ms" for scale in scales)
+    print(f"earth engine ({args.latency * 1000:.0f} ms latency, {args.scale_cost * 1000:.0f} ms at 10 m): "
+          f"plain 10 m request {plain * 1000:6.1f} ms")
+    print(f"  progressive: {timings}")
+    same = job.final and job.current()[1].equals(exact)
+    print(f"  final level matches the plain request: {same}")
+    return same and job.timings[scales[0]] < plain
+
+
+def retried_levels(scales):
+    from progressive import Progressive
+
+    calls = []
+
+    def compute(level):
+        calls.append(level)
+        if level == scales[1] and calls.count(level) == 1:
+            raise RuntimeError("simulated Earth Engine error")
+        return level
+
+    job = Progressive(compute, scales)
+    job.wait(scales[1], timeout=5)
+    failed = job.done and job.error is not None and job.current()[0] == scales[0]
+    # Not yet due, then due
+    early = job.retry(after=60).error is not None
+    job.retry().wait(scales[-1], timeout=5)
+    retried = job.final and job.error is None and calls == [scales[0], scales[1], scales[1], scales[-1]]
+    print(f"failed at {scales[1]} m, kept {scales[0]} m: {failed}; retry not before it is due: {early}; "
+          f"retried from the failed level: {retried}")
+    return failed and early and retried
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dates", type=int, default=16)
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--width", type=int, default=1800)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--scale-cost", type=float, default=1.0, help="Seconds of a 10 m reduction round trip")
+    args = parser.parse_args(argv)
+
+    # Measure the Earth Engine work itself, not shared cache hits from earlier runs
+    os.environ["WQ_SHARED_CACHE"] = "off"
+    fake_ee.install(latency=args.latency, scale_cost=args.scale_cost)
+    from stats import PROGRESSIVE_SCALES
+
+    ok = local_levels(args, PROGRESSIVE_SCALES)
+    ok &= ee_levels(args, PROGRESSIVE_SCALES)
+    ok &= retried_levels(PROGRESSIVE_SCALES)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
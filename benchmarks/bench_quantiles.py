@@ -0,0 +1,67 @@
+"""
+Accuracy, memory and speed of streaming KLL quantiles against exact
+np.nanquantile on a memory-mapped raster, serially and across processes.
+
+    python -m benchmarks.bench_quantiles --size 8000 --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from quantile_sketch import quantiles_npy
+
+QS = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=8000)
+    parser.add_argument("--k", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "raster.npy")
+        arr = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(args.size, args.size))
+        rng = np.random.default_rng(0)
+        for start in range(0, args.size, 500):
+            block = rng.lognormal(3, 0.8, size=arr[start:start + 500].shape).astype(np.float32)
+            block[rng.random(block.shape) < 0.3] = np.nan
+            arr[start:start + 500] = block
+        arr.flush()
+
+        start = time.perf_counter()
+        exact = np.nanquantile(np.asarray(arr), QS)
+        exact_time = time.perf_counter() - start
+        finite = np.sort(arr[np.isfinite(arr)])
+
+        results = {}
+        for workers in (1, args.workers):
+            # Heap of this process; with several workers the sketches live in the worker processes
+            tracemalloc.start()
+            start = time.perf_counter()
+            approx = quantiles_npy(path, QS, k=args.k, workers=workers)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if workers == 1 else None
+            tracemalloc.stop()
+            ranks = np.searchsorted(finite, approx, side="right") / len(finite)
+            results[workers] = (elapsed, peak, np.abs(ranks - QS).max(), approx)
+
+    print(f"raster: {args.size}x{args.size}, valid pixels: {len(finite)}, k={args.k}")
+    print(f"exact np.nanquantile: {exact_time:.2f} s, loads {arr.nbytes / 2 ** 20:.0f} MiB into memory")
+    # The documented bound of KLLSketch: 3.3 / (k / 100) percent of the ranks
+    bound = 3.3 / args.k
+    for workers, (elapsed, peak, rank_error, approx) in results.items():
+        heap = f", peak heap {peak / 2 ** 20:.1f} MiB" if peak is not None else ""
+        print(f"sketch, {workers} process(es): {elapsed:.2f} s{heap}, max rank error {rank_error:.4f} "
+              f"(bound {bound:.4f}), relative value error {np.abs(approx / exact - 1).max():.4f}")
+    return 0 if all(r[2] <= bound for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Appends synthetic composites to a local RasterCube and measures append cost,
+zero-copy (date, index) reads and local AOI medians. Also checks that full
+chunks are never rewritten by later appends.
+
+    python -m benchmarks.bench_raster_cube --dates 64 --height 1200 --width 1800
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.synthetic_rasters import synthetic_composite
+from raster_cube import RasterCube, cube_medians
+
+INDEXES = ['SABI', 'CGI', 'CDOM', 'DOC', 'Cyanobacteria', 'Turbidity']
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dates", type=int, default=64)
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--width", type=int, default=1800)
+    parser.add_argument("--chunk-dates", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    shape = (args.height, args.width)
+    dates = [str(date(2023, 4, 1) + timedelta(days=3 * i)) for i in range(args.dates)]
+    composites = {d: synthetic_composite(d, INDEXES, shape) for d in dates}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cube = RasterCube.create(tmp, INDEXES, shape, chunk_dates=args.chunk_dates)
+
+        half = len(dates) // 2
+        start = time.perf_counter()
+        for d in dates[:half]:
+            cube.append(d, composites[d])
+        full_chunks = [os.path.join(tmp, f) for f in sorted(os.listdir(tmp)) if f.startswith("chunk-")][:half // args.chunk_dates]
+        before = {p: file_hash(p) for p in full_chunks}
+        for d in dates[half:]:
+            cube.append(d, composites[d])
+        append_time = time.perf_counter() - start
+        unchanged = all(file_hash(p) == h for p, h in before.items())
+
+        reopened = RasterCube(tmp)
+        start = time.perf_counter()
+        views = [reopened.read(d, name) for d in dates for name in INDEXES]
+        read_time = time.perf_counter() - start
+        zero_copy = all(isinstance(v.base, np.memmap) or isinstance(v, np.memmap) for v in views)
+        exact = all(np.array_equal(reopened.read(d), composites[d], equal_nan=True) for d in dates)
+
+        start = time.perf_counter()
+        medians = cube_medians(reopened, INDEXES)
+        median_time = time.perf_counter() - start
+
+    n_slices = len(dates) * len(INDEXES)
+    print(f"cube: {len(dates)} dates x {len(INDEXES)} indexes x {args.height} x {args.width}")
+    print(f"append: {append_time / len(dates) * 1000:.1f} ms/date, full chunks unchanged: {unchanged}")
+    print(f"read: {read_time / n_slices * 1e6:.1f} us/slice, zero-copy: {zero_copy}, exact: {exact}")
+    print(f"AOI medians: {median_time:.2f} s for {len(medians)} dates")
+    return 0 if unchanged and zero_copy and exact else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Starts several worker processes (standing in for Streamlit replicas) on one
+data directory against the fake `ee` backend. Every worker loads the
+imagery catalog and the statistics table at the same moment. Reports the
+Earth Engine round trips of all workers with and without the shared cache.
+Also checks content keys, TTL expiry, size-based eviction, reads while
+another process holds the write lock and the takeover of a key whose
+computing process died. A worker that crashes is reported with its error.
+
+    python -m benchmarks.bench_shared_cache --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import fake_ee
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker(start_at, latency):
+    # One replica's cold start: catalog and statistics, beginning at `start_at`
+    fake_ee.install(latency=latency)
+    import stats
+    from gee_data import get_s2_imagery
+    from shared_cache import get_shared_cache
+
+    time.sleep(max(0.0, start_at - time.time()))
+    start = time.perf_counter()
+    df = stats.stats_all_indexes(get_s2_imagery().collection, stats.STATS_INDEXES)
+    cache = get_shared_cache()
+    return {
+        "seconds": time.perf_counter() - start,
+        "round_trips": fake_ee.stats.round_trips,
+        "table": df.to_json(),
+        "hits": cache.hits if cache else 0,
+        "misses": cache.misses if cache else 0,
+        "waits": cache.waits if cache else 0,
+    }
+
+
+def run_workers(n, latency, shared):
+    with tempfile.TemporaryDirectory(prefix="wq-shared-") as data_dir:
+        env = dict(os.environ, WQ_DATA_DIR=data_dir, PYTHONPATH=ROOT, WQ_SHARED_CACHE="sqlite" if shared else "off")
+        start_at = time.time() + 2.0
+        procs = [
+            subprocess.Popen([sys.executable, "-m", "benchmarks.bench_shared_cache", "--worker", str(start_at),
+                              "--latency", str(latency)], cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, text=True)
+            for _ in range(n)
+        ]
+        results = []
+        for proc in procs:
+            out, err = proc.communicate()
+            if proc.returncode != 0:
+                # A crashed replica: report its error instead of a missing result
+                raise RuntimeError(f"worker exited with {proc.returncode}:\n{err}")
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def local_checks():
+    # Content keys, TTL, eviction and lock takeover on one SQLite file
+    fake_ee.install()
+    from gee_data import ImageryCatalog
+    from shared_cache import SharedCache, SQLiteBackend, set_shared_cache, shared
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = ImageryCatalog(coverage_path=os.path.join(tmp, "coverage.json"))
+        calls = []
+
+        @shared()
+        def count_dates(ic, label):
+            calls.append(label)
+            return len(catalog.dates)
+
+        set_shared_cache(SharedCache(SQLiteBackend(os.path.join(tmp, "keys.sqlite"))))
+        count_dates(catalog.collection_for(catalog.dates[:3]), "a")
+        count_dates(catalog.collection_for(catalog.dates[:3]), label="a")
+        count_dates(catalog.collection_for(catalog.dates[1:4]), "a")
+        content = calls == ["a", "a"]
+        print(f"content keys: an equal graph is a hit, another graph a miss: {content}")
+        ok &= content
+
+        backend = SQLiteBackend(os.path.join(tmp, "ttl.sqlite"), max_bytes=10_000)
+        cache = SharedCache(backend, ttl=0.2)
+        cache.set("short", 1)
+        fresh = cache.get("short") == 1
+        time.sleep(0.3)
+        expired = cache.get("short") is None and backend.stats()["entries"] == 0
+        print(f"TTL: fresh hit {fresh}, expired after its TTL {expired}")
+        ok &= fresh and expired
+
+        for i in range(10):
+            cache.set(f"blob-{i}", b"x" * 3000, ttl=60)
+            if i >= 1:
+                # blob-0 stays recently used
+                cache.get("blob-0")
+        stats = backend.stats()
+        lru = cache.get("blob-0") is not None and cache.get("blob-1") is None
+        print(f"eviction: {stats['entries']} entries, {stats['bytes']} bytes of 10000, "
+              f"{stats['evictions']} evicted, least recently used first: {lru}")
+        ok &= stats["bytes"] <= 10_000 and stats["evictions"] > 0 and lru
+
+        # Reads do not wait for a writer holding the write lock
+        import sqlite3
+        writer = sqlite3.connect(backend.path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        start = time.perf_counter()
+        read = cache.get("blob-0") is not None
+        took = time.perf_counter() - start
+        writer.execute("ROLLBACK")
+        writer.close()
+        print(f"read during another process's write: {read}, {took * 1000:.1f} ms")
+        ok &= read and took < 0.5
+
+        # A computing process that died holding the lock: waiters take over once its lease expires
+        dead = SharedCache(SQLiteBackend(os.path.join(tmp, "lock.sqlite")), lock_ttl=0.5)
+        dead.backend.acquire("orphan", 0.5)
+        start = time.perf_counter()
+        value = dead.get_or_compute("orphan", lambda: "recomputed")
+        took = time.perf_counter() - start
+        print(f"orphaned lock taken over after {took:.2f} s: {value == 'recomputed'}")
+        ok &= value == "recomputed" and took < 2.0
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--worker", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        print(json.dumps(worker(args.worker, args.latency)))
+        return 0
+
+    ok = True
+    tables = []
+    for shared in (False, True):
+        results = run_workers(args.workers, args.latency, shared)
+        trips = sum(r["round_trips"] for r in results)
+        slowest = max(r["seconds"] for r in results)
+        counts = {k: sum(r[k] for r in results) for k in ("hits", "misses", "waits")}
+        print(f"{'shared cache' if shared else 'per process '}: {args.workers} workers, {trips:3d} round trips, "
+              f"slowest {slowest * 1000:6.1f} ms; {counts}")
+        tables.append({r["table"] for r in results})
+        if shared:
+            # One catalog build and one statistics table between all workers
+            ok &= counts["misses"] == 2
+    same = len(tables[0] | tables[1]) == 1
+    print(f"same table everywhere: {same}")
+    ok &= same
+    ok &= local_checks()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
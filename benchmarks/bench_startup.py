@@ -0,0 +1,100 @@
+"""
+Import time of the app modules and time to first paint of every page, run
+against the fake `ee` backend (with simulated round-trip latency) in fresh
+processes. Fails when importing a module talks to Earth Engine or eagerly
+pulls in geemap, folium plugins or plotly.
+
+    python -m benchmarks.bench_startup
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["gee_data", "stats", "create_map", "snapshot"]
+PAGES = ["Home.py", "pages/0_💧 Water Quality.py", "pages/1_📈 Charts.py"]
+HEAVY = ["folium.plugins", "plotly", "plotly.graph_objects", "matplotlib"]
+
+
+def child_import(module):
+    from benchmarks import fake_ee
+    fake_ee.install()
+    import importlib
+
+    # Streamlit itself is imported by every page (and pulls in plotly), so it is the baseline
+    start = time.perf_counter()
+    import streamlit  # noqa: F401
+    baseline = set(sys.modules)
+    streamlit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    importlib.import_module(module)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "streamlit_seconds": streamlit_time, "round_trips": fake_ee.stats.round_trips,
+            "heavy": [m for m in HEAVY if m in sys.modules and m not in baseline]}
+
+
+def child_page(page, latency, warm):
+    from benchmarks import fake_ee
+    fake_ee.install(latency=latency)
+    from streamlit.testing.v1 import AppTest
+
+    if warm:
+        import stats
+        stats.refresh_snapshot()
+        fake_ee.stats.reset()
+
+    start = time.perf_counter()
+    app = AppTest.from_file(os.path.join(ROOT, page), default_timeout=120).run()
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "round_trips": fake_ee.stats.round_trips,
+            "exception": [e.value for e in app.exception]}
+
+
+def run_child(*args, data_dir):
+    env = dict(os.environ, WQ_DATA_DIR=data_dir, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", *args],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--child", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        kind, *rest = args.child
+        if kind == "import":
+            result = child_import(rest[0])
+        else:
+            result = child_page(rest[0], float(rest[1]), rest[2] == "warm")
+        print(json.dumps(result))
+        return 0
+
+    ok = True
+    with tempfile.TemporaryDirectory() as data_dir:
+        for module in MODULES:
+            r = run_child("import", module, data_dir=data_dir)
+            clean = r["round_trips"] == 0 and not r["heavy"]
+            ok &= clean
+            print(f"import {module:<12} {r['seconds'] * 1000:7.1f} ms (+{r['streamlit_seconds'] * 1000:.0f} ms streamlit), "
+                  f"round trips: {r['round_trips']}, "
+                  f"heavy modules: {r['heavy'] or 'none'}")
+
+    for page in PAGES:
+        for scenario in ("cold", "warm"):
+            with tempfile.TemporaryDirectory() as data_dir:
+                r = run_child("page", page, str(args.latency), scenario, data_dir=data_dir)
+            print(f"first paint {page:<28} {scenario}: {r['seconds'] * 1000:7.1f} ms, "
+                  f"round trips: {r['round_trips']}, exceptions: {len(r['exception'])}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Compares the per-index `stats_imagery` calls with the batched
+`stats_all_indexes` against the offline fake `ee` backend. Also runs the
+incremental store refresh over a growing archive and checks that only the
+dates after the latest stored one are fetched, that a second run is a no-op,
+and that the store holds one row per (date, index). Also checks that the
+in-app snapshot refresh is rescheduled, without overlapping runs.
+
+    python -m benchmarks.bench_stats
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks import fake_ee
+
+
+def refresh(store):
+    # Runs the store refresh, recording the dates computed on Earth Engine
+    import stats
+
+    fetched = []
+    stats_all_indexes = stats.stats_all_indexes
+
+    def record(*args, **kwargs):
+        df = stats_all_indexes(*args, **kwargs)
+        fetched.extend(df.index)
+        return df
+
+    stats.stats_all_indexes = record
+    try:
+        rows = stats.refresh_stats_store(store)
+    finally:
+        stats.stats_all_indexes = stats_all_indexes
+    return rows, fetched
+
+
+def check_refresh(tmp):
+    from stats import STATS_INDEXES
+    from timeseries_store import TimeSeriesStore
+
+    ok = True
+    store = TimeSeriesStore(os.path.join(tmp, "timeseries"))
+    scenes = fake_ee.make_scenes()
+    # The first half of the archive, then the scenes acquired since
+    fake_ee.install(scenes[:len(scenes) // 2])
+    first_rows, first = refresh(store)
+    latest = store.latest_date()
+    fake_ee.install(scenes)
+    rows, fetched = refresh(store)
+    new_only = bool(fetched) and min(fetched) > latest and rows == len(fetched) * len(STATS_INDEXES)
+    print(f"refresh: {len(first)} dates, then {len(fetched)} dates after {latest} ({rows} rows): {new_only}")
+    ok &= new_only and first_rows == len(first) * len(STATS_INDEXES)
+
+    again, refetched = refresh(store)
+    print(f"second refresh: {again} rows, {len(refetched)} dates fetched")
+    ok &= again == 0 and not refetched
+
+    long_df = store.load()
+    unique = not long_df.duplicated(["date", "index"]).any() and len(long_df) == len(first + fetched) * len(STATS_INDEXES)
+    print(f"store: {len(long_df)} rows, one per (date, index): {unique}")
+    ok &= unique
+
+    # An overlapping part (e.g. from a concurrent refresh) wins over the earlier one
+    overlap = long_df[long_df["date"] == latest].assign(median=-1.0)
+    overlap.to_parquet(os.path.join(store.path, f"part-{latest}_{latest}.parquet"), index=False)
+    wide = store.to_wide(STATS_INDEXES)
+    last_wins = len(wide) == len(first + fetched) and (wide.loc[latest] == -1.0).all()
+    print(f"overlapping part read back once, last value kept: {last_wins}")
+    return ok and last_wins
+
+
+def check_refresh_schedule(interval=0.2, run_time=0.5, window=1.5):
+    # Runs longer than the interval: one at a time, each started once the previous one finished
+    import stats
+
+    runs = []
+    active = []
+
+    def refresh_snapshot():
+        active.append(1)
+        runs.append(len(active))
+        time.sleep(run_time)
+        active.pop()
+
+    stats.refresh_snapshot = refresh_snapshot
+    stats.start_background_refresh(interval)
+    time.sleep(window)
+    scheduled = 2 <= len(runs) <= window / run_time + 1 and max(runs) == 1
+    print(f"in-app refresh every {interval} s ({run_time} s per run) over {window} s: {len(runs)} runs, "
+          f"never overlapping: {scheduled}")
+    return scheduled
+
+
+def main():
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["WQ_DATA_DIR"] = tmp.name
+    # Measure the Earth Engine work itself, not shared cache hits from earlier runs
+    os.environ["WQ_SHARED_CACHE"] = "off"
+    fake_ee.install()
+    fake_ee.quiet_streamlit()
+
+    import stats
+    from gee_data import get_s2_imagery
+
+    ic = get_s2_imagery().collection
+
+    fake_ee.stats.reset()
+    start = time.perf_counter()
+    per_index = {name: stats.stats_imagery(ic, name) for name in stats.STATS_INDEXES}
+    per_index_time = time.perf_counter() - start
+    per_index_trips = fake_ee.stats.round_trips
+
+    fake_ee.stats.reset()
+    start = time.perf_counter()
+    batched = stats.stats_all_indexes(ic, stats.STATS_INDEXES)
+    batched_time = time.perf_counter() - start
+    batched_trips = fake_ee.stats.round_trips
+
+    print(f"per-index: {per_index_trips} round trips, {per_index_time * 1000:.1f} ms")
+    print(f"batched:   {batched_trips} round trips, {batched_time * 1000:.1f} ms")
+
+    for name, df in per_index.items():
+        if not df["median"].equals(stats.index_stats(batched, name)["median"]):
+            print(f"Mismatch between per-index and batched medians for {name}")
+            return 1
+
+    ok = batched_trips == 1 and per_index_trips == len(stats.STATS_INDEXES)
+    ok &= check_refresh(tmp.name)
+    ok &= check_refresh_schedule()
+    tmp.cleanup()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
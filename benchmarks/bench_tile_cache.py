@@ -0,0 +1,97 @@
+"""
+Replays repeated pan/zoom sessions through the local tile endpoint with a
+stand-in tile source (fixed latency, no network) and reports hit ratio and
+wall time against fetching every tile from the source. Also checks that a
+layer's tile URL still serves tiles after a restart of the Earth Engine tile
+source (fake `ee` backend).
+
+    python -m benchmarks.bench_tile_cache
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from tile_cache import TileCache, TileServer, vis_hash
+
+
+class FakeTileSource:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, date_str, index_name, vhash, z, x, y):
+        self.calls += 1
+        time.sleep(self.latency)
+        return f"{date_str}/{index_name}/{vhash}/{z}/{x}/{y}".encode().ljust(20000, b"\0")
+
+
+def viewport_tiles(rng, dates, indexes, vhash):
+    # A user looking at one date/index at z13-z15 around the AOI
+    date_str, index_name = rng.choice(dates), rng.choice(indexes)
+    z = rng.choice([13, 14, 15])
+    cx, cy = 4486 * 2 ** (z - 13) + rng.randint(-2, 2), 2700 * 2 ** (z - 13) + rng.randint(-2, 2)
+    return [(date_str, index_name, vhash, z, cx + dx, cy + dy) for dx in range(-2, 3) for dy in range(-1, 2)]
+
+
+def restarted_layers(tmp):
+    # A tile URL handed out before a restart: the new process finds the layer in the registry on disk
+    from benchmarks import fake_ee
+    fake_ee.install()
+    from tile_cache import EETileSource
+
+    class OfflineSource(EETileSource):
+        # The tile fetch itself stands in for the Earth Engine tile endpoint
+        def _get(self, url_format, z, x, y):
+            return url_format.format(z=z, x=x, y=y).encode()
+
+    vis = {'min': -1, 'max': 1, 'palette': 'jet_r'}
+    image = fake_ee.Image({"SABI": 0.1}, {"system:index": "20250610"})
+    path = os.path.join(tmp, "layers")
+    key = OfflineSource(path=path).register("2025-06-10", "SABI", vis, image)
+    restarted = OfflineSource(path=path)
+    served = restarted(*key, 14, 8972, 5400) is not None
+    unknown = restarted("2025-06-10", "SABI", "0" * 12, 14, 8972, 5400) is None
+    print(f"layer served after a restart: {served}, unknown layer refused: {unknown}")
+    return served and unknown
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--views", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--max-mb", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    vhash = vis_hash({'min': -1, 'max': 1, 'palette': 'jet_r'})
+    views = [viewport_tiles(rng, ["2025-06-10", "2025-06-12", "2025-06-14"], ["SABI", "CDOM"], vhash)
+             for _ in range(args.views)]
+
+    source = FakeTileSource(args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = TileServer(TileCache(tmp, max_bytes=args.max_mb * 2 ** 20), source, port=0).start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(6) as pool:
+            for tiles in views:
+                urls = [f"{server.public_url}/tiles/{d}/{i}/{v}/{z}/{x}/{y}.png" for d, i, v, z, x, y in tiles]
+                list(pool.map(lambda url: urllib.request.urlopen(url).read(), urls))
+        cached_time = time.perf_counter() - start
+        stats = server.cache.stats()
+        server.stop()
+        restarted = restarted_layers(tmp)
+
+    requested = sum(len(tiles) for tiles in views)
+    uncached_time = requested * args.latency / 6
+    print(f"tiles requested: {requested}, source calls: {source.calls}")
+    print(f"hits: {stats['hits']}, misses: {stats['misses']}, hit ratio: {stats['hits'] / requested:.1%}")
+    print(f"wall time: {cached_time:.2f} s (uncached estimate: {uncached_time:.2f} s)")
+    return 0 if source.calls == stats["misses"] and restarted else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
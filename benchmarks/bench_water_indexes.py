@@ -0,0 +1,143 @@
+"""
+Compares the water index graph compiled from the index registry with the
+previous hand-written one (every formula as its own `image.expression`,
+built whether requested or not) against the fake `ee` backend: graph nodes
+with and without shared subexpressions (an `expression` call hides its
+formula's nodes in one call), Earth Engine calls per image and build time,
+for the indexes the app shows and for all of them. Also checks that the
+compiled graph never makes more calls than the previous one, for every
+single index as well, that both give the same values on random scenes and
+that the generated LaTeX matches the formulas the Home page used to spell
+out.
+
+    python -m benchmarks.bench_water_indexes --scenes 200
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import fake_ee
+
+WQ_INDEXES = ['SABI', 'CGI', 'CDOM', 'DOC', 'Cyanobacteria', 'Turbidity']
+
+# Formulas as the Home page wrote them before they were generated from the registry
+OLD_LATEX = {
+    "SABI": r'''SABI = \frac{NIR - Red}{Blue + Green} = \frac{B8 - B4}{B2 + B3}''',
+    "CGI": r'''CGI = \frac{SWIR}{Green}-1 = \frac{B9}{B3}-1''',
+    "CDOM": r'''CDOM = 537 \cdot \exp\left(-2.93 \cdot \frac{Green}{Red}\right) = 537 \cdot \exp\left(-2.93 \cdot \frac{B3}{B4}\right)''',
+    "DOC": r'''DOC = 432 \cdot \exp\left(-2.24 \cdot \frac{Green}{Red}\right) = 432 \cdot \exp\left(-2.24 \cdot \frac{B3}{B4}\right)''',
+    "Cyanobacteria": r'''Cyanobacteria = 115530.31 \cdot \left(\frac{Green \cdot Red}{Blue}\right)^{2.38} = 115530.31 \cdot \left(\frac{B3 \cdot B4}{B2}\right)^{2.38}''',
+    "Turbidity": r'''Turbidity = \frac{Red - Green}{Red + Green} = \frac{B4 - B3}{B4 + B3}''',
+}
+
+
+def old_water_indexes(image, only=None):
+    # The previous hand-written graph, kept as the reference
+    import ee
+
+    available = {
+        'NDWI': image.normalizedDifference(['B3', 'B8']).rename('NDWI'),
+        'NDVI': image.normalizedDifference(['B8', 'B4']).rename('NDVI'),
+        'NDSI': image.normalizedDifference(['B11', 'B12']).rename('NDSI'),
+        'SABI': image.expression('(NIR - RED) / (BLUE + GREEN)',
+                                 {'NIR': image.select('B8'), 'RED': image.select('B4'), 'BLUE': image.select('B2'), 'GREEN': image.select('B3')}).rename('SABI'),
+        'CGI': image.expression('((SWIR / GREEN) - 1)',
+                                {'SWIR': image.select('B9'), 'GREEN': image.select('B3')}).rename('CGI'),
+        'CDOM': image.expression('537 * exp(-2.93 * GREEN / RED)',
+                                 {'GREEN': image.select('B3'), 'RED': image.select('B4')}).rename('CDOM'),
+        'DOC': image.expression('432 * exp(-2.24 * GREEN / RED)',
+                                {'GREEN': image.select('B3'), 'RED': image.select('B4')}).rename('DOC'),
+        'Cyanobacteria': image.expression('115530.31 * (GREEN * RED / BLUE) ** 2.38',
+                                {'RED': image.select('B4'), 'BLUE': image.select('B2'), 'GREEN': image.select('B3')}).rename('Cyanobacteria'),
+        'Turbidity': image.normalizedDifference(['B4', 'B3']).rename('Turbidity'),
+        'AWEI': image.expression('4*(GREEN - SWIR1) - (0.25*NIR + 2.75*SWIR2)',
+                                 {'GREEN': image.select('B3'), 'NIR': image.select('B8'), 'SWIR1': image.select('B11'), 'SWIR2': image.select('B12')}).rename('AWEI')
+    }
+    if only is not None:
+        selected = [available[k] for k in only if k in available]
+    else:
+        selected = list(available.values())
+    return image.addBands(ee.Image.cat(selected))
+
+
+def random_scenes(n, seed=0):
+    # Surface reflectances of water and shore pixels
+    from water_indexes import BAND_NAMES
+
+    rng = np.random.default_rng(seed)
+    return [fake_ee.Image({b: float(v) for b, v in zip(BAND_NAMES, rng.uniform(0.005, 0.4, len(BAND_NAMES)))})
+            for _ in range(n)]
+
+
+def graph_calls(fn, image, names):
+    # Earth Engine calls made to build the graph of one image
+    fake_ee.stats.reset()
+    fn(image, names)
+    calls = dict(fake_ee.stats.calls)
+    return sum(calls.values()), calls
+
+
+def close(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenes", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    fake_ee.install()
+    from water_indexes import INDEXES, graph_nodes, index_latex, water_indexes
+
+    ok = True
+    scenes = random_scenes(args.scenes)
+    for label, names in (("app indexes", WQ_INDEXES), ("all indexes", list(INDEXES))):
+        trees = sum(INDEXES[name].formula.tree_size() for name in names)
+        dag = len(graph_nodes(names))
+        old_total, old_calls = graph_calls(old_water_indexes, scenes[0], names)
+        new_total, new_calls = graph_calls(water_indexes, scenes[0], names)
+        timings = []
+        for fn in (old_water_indexes, water_indexes):
+            start = time.perf_counter()
+            for image in scenes:
+                fn(image, names)
+            timings.append((time.perf_counter() - start) / len(scenes) * 1e6)
+        print(f"{label} ({len(names)}): {trees} nodes as separate formulas, {dag} shared")
+        print(f"  previous graph: {old_total:3d} ee calls, {timings[0]:7.1f} us/image; {old_calls}")
+        print(f"  compiled graph: {new_total:3d} ee calls, {timings[1]:7.1f} us/image; {new_calls}")
+        ok &= dag < trees and new_total <= old_total
+        if len(names) < len(INDEXES):
+            # Formulas that were not requested are no longer built
+            ok &= new_total < old_total
+
+        # Same band values on every scene, masked pixels included
+        same = all(
+            close(old._bands[name], new._bands[name])
+            for image in scenes
+            for old, new in [(old_water_indexes(image, names), water_indexes(image, names))]
+            for name in names
+        )
+        print(f"  same values on {len(scenes)} scenes: {same}")
+        ok &= same
+
+    # Never more calls than the previous graph, whichever index is requested alone
+    larger = [name for name in INDEXES
+              if graph_calls(water_indexes, scenes[0], [name])[0] > graph_calls(old_water_indexes, scenes[0], [name])[0]]
+    print(f"single indexes with a larger compiled graph: {larger}")
+    ok &= not larger
+
+    # Spaces do not change LaTeX math
+    latex = all("".join(index_latex(name).split()) == "".join(formula.split())
+                for name, formula in OLD_LATEX.items())
+    print(f"generated LaTeX matches the Home page formulas: {latex}")
+    ok &= latex
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
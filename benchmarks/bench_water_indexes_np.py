@@ -0,0 +1,131 @@
+"""
+Throughput and peak memory of the NumPy water index backend on memory-mapped
+Sentinel-2 tiles (uint16 digital numbers, float32 index outputs on disk).
+First checks every index against the Earth Engine graph of water_indexes
+(evaluated pixel by pixel on the fake `ee` backend) on a small random
+array with zero denominators, negative inputs and masked pixels.
+
+    python -m benchmarks.bench_water_indexes_np --size 10980 --chunk-rows 512
+
+A full 10980 x 10980 tile needs ~1.7 GB of band files and ~0.5 GB per index
+output in the temporary directory.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import fake_ee
+from water_indexes_np import INDEX_BANDS, water_indexes_array
+
+
+def make_tile(path, size, seed=0):
+    rng = np.random.default_rng(seed)
+    bands = {}
+    for band in sorted({b for names in INDEX_BANDS.values() for b in names}):
+        arr = np.lib.format.open_memmap(os.path.join(path, f"{band}.npy"), mode="w+", dtype=np.uint16, shape=(size, size))
+        for start in range(0, size, 1024):
+            arr[start:start + 1024] = rng.integers(1, 4000, size=arr[start:start + 1024].shape, dtype=np.uint16)
+        arr.flush()
+        bands[band] = np.load(os.path.join(path, f"{band}.npy"), mmap_mode="r")
+    return bands
+
+
+def reference(bands, names):
+    # The Earth Engine graph of water_indexes, one fake image per pixel
+    from water_indexes import water_indexes
+
+    shape = next(iter(bands.values())).shape
+    out = {name: np.full(shape, np.nan) for name in names}
+    for i, j in np.ndindex(shape):
+        values = water_indexes(fake_ee.Image({b: float(arr[i, j]) for b, arr in bands.items()}), names)._bands
+        for name in names:
+            if values[name] is not None:
+                out[name][i, j] = values[name]
+    return out
+
+
+def check_values(size=24, seed=1):
+    fake_ee.install()
+    rng = np.random.default_rng(seed)
+    bands = {b: rng.uniform(0.0, 0.4, (size, size)).astype(np.float32)
+             for b in sorted({b for names in INDEX_BANDS.values() for b in names})}
+    # Zero denominators (masked in Earth Engine) and negative inputs (masked by normalizedDifference)
+    bands['B4'][0] = 0
+    bands['B3'][1] = bands['B4'][1] = 0
+    bands['B2'][2] = 0
+    bands['B2'][3] = bands['B3'][3] = 0
+    bands['B8'][4] = -0.01
+    bands['B12'][5] = -0.01
+    mask = rng.random((size, size)) > 0.1
+
+    names = list(INDEX_BANDS)
+    got = water_indexes_array(bands, only=names, mask=mask, chunk_rows=7)
+    expected = reference(bands, names)
+    ok = True
+    for name in names:
+        expected[name][~mask] = np.nan
+        same = np.allclose(got[name], expected[name], rtol=1e-4, atol=1e-5, equal_nan=True)
+        ok &= same
+        if not same:
+            print(f"{name}: differs from the Earth Engine formula")
+    nan = sum(int(np.isnan(got[name][mask]).sum()) for name in names)
+    print(f"values match the Earth Engine formulas for {len(names)} indexes: {ok} ({nan} NaN pixels outside the mask)")
+    return ok
+
+
+def check_arguments():
+    bands = {'B3': np.ones((4, 4), dtype=np.float32)}
+    empty = water_indexes_array(bands, only=[]) == {}
+    try:
+        water_indexes_array(bands, only=['NDWI', 'NDXI'])
+        unknown = False
+    except ValueError:
+        unknown = True
+    print(f"no indexes requested gives no arrays: {empty}; unknown index names rejected: {unknown}")
+    return empty and unknown
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=10980)
+    parser.add_argument("--chunk-rows", type=int, default=512)
+    parser.add_argument("--indexes", nargs="+", default=['SABI', 'CGI', 'CDOM', 'DOC', 'Cyanobacteria', 'Turbidity'])
+    args = parser.parse_args(argv)
+
+    ok = check_values()
+    ok &= check_arguments()
+    with tempfile.TemporaryDirectory() as tmp:
+        bands = make_tile(tmp, args.size)
+        out = {
+            name: np.lib.format.open_memmap(os.path.join(tmp, f"{name}.out.npy"), mode="w+", dtype=np.float32, shape=(args.size, args.size))
+            for name in args.indexes
+        }
+        # Built block by block from the scaled bands (B3 > 100 digital numbers)
+        def mask(chunk):
+            return chunk['B3'] > 0.01
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        water_indexes_array(bands, only=args.indexes, mask=mask, out=out, scale=1 / 10000, chunk_rows=args.chunk_rows)
+        for arr in out.values():
+            arr.flush()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    pixels = args.size * args.size
+    print(f"tile: {args.size}x{args.size}, indexes: {len(args.indexes)}, chunk rows: {args.chunk_rows}")
+    print(f"time: {elapsed:.2f} s, throughput: {pixels / elapsed / 1e6:.1f} Mpx/s "
+          f"({pixels * len(args.indexes) / elapsed / 1e6:.1f} M index values/s)")
+    print(f"peak heap: {peak / 2 ** 20:.1f} MiB, max RSS incl. mapped pages: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Grouped zonal statistics (one sort-based pass over all zones) against a
+per-zone loop, for 10, 100 and 1000 zones on synthetic composites. Also
+checks the Earth Engine grouped reduction against the local one on a cube
+exported from the fake `ee` backend, and that overlapping zones are refused.
+
+    python -m benchmarks.bench_zonal_stats --height 1200 --width 1800
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import fake_ee
+from benchmarks.synthetic_rasters import synthetic_composite
+
+INDEXES = ['SABI', 'CGI', 'CDOM', 'DOC', 'Cyanobacteria', 'Turbidity']
+
+
+def zone_labels(shape, n_zones):
+    # Consecutive reaches along the river, as vertical strips
+    strip = np.minimum(np.arange(shape[1]) * n_zones // shape[1] + 1, n_zones)
+    return np.broadcast_to(strip, shape).astype(np.int32)
+
+
+def per_zone_loop(labels, values, n_zones):
+    medians = np.full((len(values), n_zones + 1), np.nan)
+    for zone in range(1, n_zones + 1):
+        inside = labels == zone
+        for i, band in enumerate(values):
+            v = band[inside]
+            if np.isfinite(v).any():
+                medians[i, zone] = np.nanmedian(v)
+    return medians
+
+
+def rectangle_zones(rects):
+    # FeatureCollection of (xmin, ymin, xmax, ymax) rectangles with zone ids 1, 2, ...
+    import ee
+
+    return ee.FeatureCollection([
+        ee.Feature(ee.Geometry.Rectangle(list(rect), "EPSG:32633", False), {"zone_id": i})
+        for i, rect in enumerate(rects, start=1)
+    ])
+
+
+def ee_check(n_dates=8):
+    # zonal_stats_ee against zonal_stats_local on the same composites, exported to a cube
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["WQ_DATA_DIR"] = tmp
+        os.environ["WQ_SHARED_CACHE"] = "off"
+        import batch
+        from gee_data import ImageryCatalog
+        from zonal_stats import export_zone_labels, zonal_stats_ee, zonal_stats_local
+
+        catalog = ImageryCatalog(INDEXES, min_coverage=0)
+        cube = batch.export_cube(end_date=catalog.dates[n_dates], root=os.path.join(tmp, "cube"), min_coverage=0,
+                                 log=lambda msg: None)
+
+        # Four reaches across the AOI (on the 10 m grid) and a bathing site inside the second one
+        x0, y0, x1, y1 = fake_ee.AOI_BOUNDS["EPSG:32633"]
+        reaches = [(x0 + i * 400, y0, x0 + (i + 1) * 400, y1) for i in range(4)]
+        site = (x0 + 500, y0 + 300, x0 + 700, y0 + 600)
+
+        zones = rectangle_zones(reaches)
+        labels = export_zone_labels(zones, cube.meta["grid"], os.path.join(tmp, "zones.npy"))
+        local = zonal_stats_local(cube, labels, INDEXES)
+        fake_ee.stats.reset()
+        remote = zonal_stats_ee(catalog.collection_for(cube.dates), zones, INDEXES)
+        trips = fake_ee.stats.round_trips
+
+        merged = local.merge(remote, on=["date", "zone", "index"], how="outer", suffixes=("_local", "_ee"))
+        medians = np.allclose(merged["median_local"].astype(float), merged["median_ee"].astype(float),
+                              rtol=1e-5, equal_nan=True)
+        counts = (merged["count_local"] == merged["count_ee"]).all()
+        print(f"earth engine grouped reduction: {len(remote)} rows in {trips} round trips; "
+              f"same medians as local: {medians}, same pixel counts: {counts}")
+
+        refused = []
+        for fn in (lambda z: zonal_stats_ee(catalog.collection_for(cube.dates), z, INDEXES),
+                   lambda z: export_zone_labels(z, cube.meta["grid"], os.path.join(tmp, "overlap.npy"))):
+            try:
+                fn(rectangle_zones(reaches + [site]))
+                refused.append(False)
+            except ValueError:
+                refused.append(True)
+        print(f"overlapping zones refused: {all(refused)}")
+    return medians and counts and len(merged) == len(local) == len(remote) and all(refused)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--width", type=int, default=1800)
+    args = parser.parse_args(argv)
+
+    fake_ee.install()
+    from zonal_stats import zonal_stats_array
+
+    shape = (args.height, args.width)
+    values = synthetic_composite("2025-06-14", INDEXES, shape)
+
+    ok = True
+    for n_zones in (10, 100, 1000):
+        labels = zone_labels(shape, n_zones)
+
+        start = time.perf_counter()
+        medians, counts = zonal_stats_array(labels, values, n_zones)
+        grouped = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = per_zone_loop(labels, values, n_zones)
+        looped = time.perf_counter() - start
+
+        match = np.allclose(medians, expected, equal_nan=True)
+        ok &= match
+        print(f"{n_zones:>5} zones: grouped {grouped * 1000:7.1f} ms, per-zone loop {looped * 1000:8.1f} ms, "
+              f"speedup {looped / grouped:5.1f}x, match: {match}")
+    ok &= ee_check()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,870 @@
+"""
+Offline stand-in for the `ee` module used by the benchmarks.
+
+Every image carries one scalar value per band, so reductions over the AOI are
+exact and cheap, while the call pattern of the app (map, reduceRegion,
+reduceColumns, getInfo, ...) is preserved. Each `getInfo()` / `getMapId()` is
+counted as one server round trip and sleeps for the configured latency.
+
+Every public method call is recorded: `stats.calls` counts calls per method,
+`stats.edges` counts (caller, callee) pairs, where the caller is the fake
+method running at the time (e.g. `ImageCollection.map` for the
+`Image.reduceRegion` calls of a mapped function) or "client" for app code,
+and `stats.trips` lists the round trips with the number of calls made since
+the previous one. `stats.dump(path)` writes the call graph as JSON.
+
+Pixel-level requests (`ee.data.computePixels`) see a band's scalar times a
+fixed smooth field over the pixel centres of the requested grid, so exported
+rasters vary in space while staying reproducible. The AOI is a rectangle of
+1.6 x 1.2 km (160 x 120 pixels at 10 m).
+"""
+import functools
+import json
+import math
+import random
+import statistics
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+
+class _Stats:
+    def __init__(self):
+        self.round_trips = 0
+        self.calls = Counter()
+        self.edges = Counter()
+        self.trips = []
+        # Simulated server latency of every round trip, in seconds, optionally per method
+        self.latency = 0.0
+        self.latencies = {}
+        # Extra seconds of a round trip that reduces at 10 m, scaled by pixel count ((10 / scale) ** 2)
+        # for the finest reduceRegion scale requested since the previous round trip
+        self.scale_cost = 0.0
+        self._finest_scale = None
+        self._since_trip = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.round_trips = 0
+            self.calls.clear()
+            self.edges.clear()
+            self.trips.clear()
+            self._since_trip = 0
+            self._finest_scale = None
+
+    def latency_for(self, method):
+        return self.latencies.get(method, self.latency)
+
+    def call_graph(self):
+        with self._lock:
+            return {
+                "round_trips": self.round_trips,
+                "calls": dict(self.calls),
+                "edges": [{"caller": a, "callee": b, "count": n} for (a, b), n in sorted(self.edges.items())],
+                "trips": list(self.trips),
+            }
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.call_graph(), f, indent=1)
+
+
+stats = _Stats()
+_stack = threading.local()
+
+# Scenes returned by ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+_catalog = []
+
+# Bounds (xmin, ymin, xmax, ymax) of the AOI asset in the projections the app asks for
+AOI_BOUNDS = {
+    "EPSG:32633": (642000.0, 5849000.0, 643600.0, 5850200.0),
+    "EPSG:4326": (17.0980, 52.7780, 17.1218, 52.7889),
+}
+
+
+def grid_centres(grid):
+    # Pixel centre coordinates (xs, ys) of a computePixels grid, in its CRS
+    t, dims = grid["affineTransform"], grid["dimensions"]
+    xs = t["translateX"] + (np.arange(dims["width"]) + 0.5) * t["scaleX"]
+    ys = t["translateY"] + (np.arange(dims["height"]) + 0.5) * t["scaleY"]
+    return xs, ys
+
+
+def pixel_field(xs, ys):
+    # Spatial pattern a scalar band is multiplied with at pixel level
+    return 1 + 0.25 * np.sin(xs / 170.0)[None, :] * np.cos(ys / 130.0)[:, None]
+
+
+class _Fill(float):
+    # A masked pixel filled by unmask(): the same value at every pixel
+    pass
+
+
+class _Raster:
+    # A band defined pixel by pixel (e.g. rasterized features): fn(xs, ys) -> array, NaN where masked
+    def __init__(self, fn):
+        self.fn = fn
+
+
+def _on_pixels(raster, fn):
+    # A pixel-level band transformed array-wise
+    return _Raster(lambda xs, ys: fn(raster.fn(xs, ys)))
+
+
+def _pixels(value, xs, ys):
+    # One band of an image as a (height, width) array on the pixel centres xs, ys
+    if isinstance(value, _Raster):
+        return np.asarray(value.fn(xs, ys), dtype=np.float64)
+    if value is None:
+        return np.full((len(ys), len(xs)), np.nan)
+    if isinstance(value, _Fill):
+        return np.full((len(ys), len(xs)), float(value))
+    return value * pixel_field(xs, ys)
+
+
+class EEException(Exception):
+    pass
+
+
+def _trace(cls_name, attr, fn, static=False):
+    @functools.wraps(fn)
+    def traced(*args, **kwargs):
+        owner = cls_name if static or not args else type(args[0]).__name__
+        name = f"{owner}.{attr}"
+        stack = _stack.__dict__.setdefault("calls", [])
+        with stats._lock:
+            stats.calls[attr] += 1
+            stats.edges[(stack[-1] if stack else "client", name)] += 1
+            stats._since_trip += 1
+        stack.append(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stack.pop()
+
+    return traced
+
+
+def _traced(cls):
+    # Records every call of the public methods of a fake class
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_"):
+            continue
+        if isinstance(value, staticmethod):
+            setattr(cls, attr, staticmethod(_trace(cls.__name__, attr, value.__func__, static=True)))
+        elif callable(value):
+            setattr(cls, attr, _trace(cls.__name__, attr, value))
+    return cls
+
+
+def _round_trip(method):
+    with stats._lock:
+        stats.round_trips += 1
+        stats.trips.append({"method": method, "client_calls": stats._since_trip})
+        stats._since_trip = 0
+        scale, stats._finest_scale = stats._finest_scale, None
+    work = stats.scale_cost * (10 / scale) ** 2 if scale else 0.0
+    time.sleep(stats.latency_for(method) + work)
+
+
+def _unwrap(value):
+    if isinstance(value, _ComputedObject):
+        return value._value()
+    if isinstance(value, (list, tuple)):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _unwrap(v) for k, v in value.items()}
+    return value
+
+
+@_traced
+class _ComputedObject:
+    def _value(self):
+        raise NotImplementedError
+
+    def getInfo(self):
+        _round_trip("getInfo")
+        return _unwrap(self._value())
+
+    def serialize(self):
+        serialized = json.dumps(_unwrap(self._value()), sort_keys=True, default=str)
+        if isinstance(self, Image):
+            # For deserializer.fromJSON: the fake's graphs do not carry the band values
+            _serialized[serialized] = self
+        return serialized
+
+
+# Images by their serialized graph, as this process serialized them
+_serialized = {}
+
+
+class deserializer:
+    # ee.deserializer
+    @staticmethod
+    def fromJSON(serialized):
+        return _serialized[serialized]
+
+
+def _to_datetime(value):
+    if isinstance(value, Date):
+        return value._dt
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+@_traced
+class Date(_ComputedObject):
+    def __init__(self, value):
+        self._dt = _to_datetime(value)
+
+    def format(self, fmt="YYYY-MM-dd"):
+        return self._dt.strftime(fmt.replace("YYYY", "%Y").replace("MM", "%m").replace("dd", "%d"))
+
+    def advance(self, delta, unit):
+        return Date(self._dt + timedelta(**{unit + "s": delta}))
+
+    def millis(self):
+        return int(self._dt.timestamp() * 1000)
+
+    def _value(self):
+        return {"type": "Date", "value": self.millis()}
+
+
+@_traced
+class Filter:
+    def __init__(self, test, fields=None):
+        self._test = test
+        # (leftField, rightField) of a join condition
+        self._fields = fields
+
+    @staticmethod
+    def calendarRange(start, end, field):
+        return Filter(lambda props: start <= _to_datetime(props["system:time_start"]).month <= end)
+
+    @staticmethod
+    def lt(name, value):
+        return Filter(lambda props: props.get(name) is not None and props[name] < value)
+
+    @staticmethod
+    def inList(name, values):
+        return Filter(lambda props: props.get(name) in list(values))
+
+    @staticmethod
+    def equals(leftField=None, rightValue=None, rightField=None, leftValue=None):
+        return Filter(lambda props: props.get(leftField) == rightValue, (leftField, rightField))
+
+
+@_traced
+class Join:
+    def __init__(self, matches_key):
+        self._matches_key = matches_key
+
+    @staticmethod
+    def saveAll(matchesKey, ordering=None, ascending=True, measureKey=None, outer=False):
+        return Join(matchesKey)
+
+    def apply(self, primary, secondary, condition):
+        # Hash join on an equals condition: each primary image gets the list of its matches
+        left, right = condition._fields
+        matches = {}
+        for img in secondary._images:
+            matches.setdefault(img._props.get(right), []).append(img)
+        return ImageCollection(
+            img._with(props={**img._props, self._matches_key: matches[img._props.get(left)]})
+            for img in primary._images if img._props.get(left) in matches
+        )
+
+
+@_traced
+class Reducer:
+    def __init__(self, kind, n=1, parts=(), group=None):
+        self.kind = kind
+        self.n = n
+        # Combined reducers, and the (groupField, groupName) of a grouped one
+        self.parts = list(parts)
+        self.group_by = group
+
+    @staticmethod
+    def median():
+        return Reducer("median")
+
+    @staticmethod
+    def first():
+        return Reducer("first")
+
+    @staticmethod
+    def max():
+        return Reducer("max")
+
+    @staticmethod
+    def mean():
+        return Reducer("mean")
+
+    @staticmethod
+    def count():
+        return Reducer("count")
+
+    @staticmethod
+    def toList(n=1):
+        return Reducer("toList", n)
+
+    def repeat(self, count):
+        return Reducer(self.kind, count)
+
+    def combine(self, reducer2, outputPrefix="", sharedInputs=False):
+        return Reducer("combine", self.n, parts=[self, reducer2])
+
+    def group(self, groupField=0, groupName="group"):
+        return Reducer("group", parts=[self], group=(groupField, groupName))
+
+    def _apply(self, values):
+        # Pixel arrays contribute their unmasked (non-NaN) pixels
+        flat = []
+        for v in values:
+            if isinstance(v, np.ndarray):
+                flat.extend(v[~np.isnan(v)].tolist())
+            elif v is not None:
+                flat.append(v)
+        values = flat
+        if self.kind == "count":
+            return len(values)
+        if not values:
+            return None
+        if self.kind == "mean":
+            return sum(values) / len(values)
+        if self.kind == "max":
+            return max(values)
+        return statistics.median(values)
+
+    def _grouped(self, arrays):
+        # Grouped reduction of pixel arrays: {"groups": [{groupName: value, output: [per input], ...}]}
+        field, name = self.group_by
+        groups = arrays[field]
+        inputs = arrays[:field] + arrays[field + 1:]
+        inner = self.parts[0]
+        reducers = inner.parts if inner.kind == "combine" else [inner]
+        out = []
+        for value in np.unique(groups[~np.isnan(groups)]):
+            inside = groups == value
+            group = {name: int(value) if float(value).is_integer() else float(value)}
+            for reducer in reducers:
+                group[reducer.kind] = [reducer._apply([arr[inside]]) for arr in inputs[:reducer.n]]
+            out.append(group)
+        return {"groups": out}
+
+
+@_traced
+class List(_ComputedObject):
+    def __init__(self, items):
+        self._items = list(items._items if isinstance(items, List) else items)
+
+    def map(self, fn):
+        return List([fn(item) for item in self._items])
+
+    def distinct(self):
+        return List(dict.fromkeys(self._items))
+
+    def filter(self, flt):
+        return List([item for item in self._items if flt._test({"item": item})])
+
+    def get(self, index):
+        item = self._items[_unwrap(index)]
+        return List(item) if isinstance(item, list) else item
+
+    def size(self):
+        return len(self._items)
+
+    def _value(self):
+        return self._items
+
+
+@_traced
+class Dictionary(_ComputedObject):
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+
+    def get(self, key):
+        return self._values.get(key)
+
+    def _value(self):
+        return self._values
+
+
+@_traced
+class Geometry(_ComputedObject):
+    def __init__(self, rect=None, crs="EPSG:32633"):
+        # Axis-aligned rectangle (xmin, ymin, xmax, ymax) in `crs`; the AOI by default
+        self._rect = tuple(rect or AOI_BOUNDS[crs])
+        self._crs = crs
+
+    def bounds(self, maxError=None, proj=None):
+        proj = proj or self._crs
+        if proj != self._crs:
+            if self._rect != AOI_BOUNDS[self._crs]:
+                raise EEException("the fake reprojects the AOI only")
+            return Geometry(AOI_BOUNDS[proj], proj)
+        return Geometry(self._rect, proj)
+
+    @staticmethod
+    def Rectangle(coords, proj="EPSG:32633", geodesic=None, evenOdd=None):
+        return Geometry(_unwrap(coords), proj)
+
+    def coordinates(self):
+        x0, y0, x1, y1 = self._rect
+        return List([[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]])
+
+    def _value(self):
+        return {"type": "Polygon", "crs": self._crs, "coordinates": self.coordinates()._value()}
+
+
+@_traced
+class Feature(_ComputedObject):
+    def __init__(self, geometry, properties=None):
+        self._geometry = geometry
+        self._props = dict(properties or {})
+
+    def geometry(self):
+        return self._geometry
+
+    def _value(self):
+        return {"type": "Feature", "geometry": self._geometry._value(), "properties": self._props}
+
+
+@_traced
+class FeatureCollection(_ComputedObject):
+    def __init__(self, source):
+        # An asset id (the AOI) or a list of rectangle Features in EPSG:32633
+        self.asset_id = source if isinstance(source, str) else None
+        self._features = [] if isinstance(source, str) else list(source)
+
+    def geometry(self):
+        if self.asset_id is not None:
+            return Geometry()
+        rects = [f.geometry()._rect for f in self._features]
+        return Geometry((min(r[0] for r in rects), min(r[1] for r in rects),
+                         max(r[2] for r in rects), max(r[3] for r in rects)))
+
+    def reduceToImage(self, properties, reducer):
+        # The features rasterized on pixel centres: the first feature's property, or the number of features
+        prop = _unwrap(properties)[0]
+        features = list(self._features)
+
+        def rasterize(xs, ys):
+            out = np.full((len(ys), len(xs)), np.nan)
+            hits = np.zeros(out.shape, dtype=int)
+            for feature in features:
+                x0, y0, x1, y1 = feature.geometry()._rect
+                inside = ((xs >= x0) & (xs < x1))[None, :] & ((ys >= y0) & (ys < y1))[:, None]
+                if reducer.kind == "first":
+                    out[inside & (hits == 0)] = feature._props[prop]
+                hits += inside
+            if reducer.kind == "count":
+                out[hits > 0] = hits[hits > 0]
+            return out
+
+        return Image({reducer.kind: _Raster(rasterize)})
+
+    def _value(self):
+        if self.asset_id is not None:
+            return {"type": "FeatureCollection", "id": self.asset_id}
+        return {"type": "FeatureCollection", "features": [f._value() for f in self._features]}
+
+
+@_traced
+class Image(_ComputedObject):
+    def __init__(self, value=None, props=None):
+        if isinstance(value, Image):
+            self._bands, self._props = dict(value._bands), dict(value._props)
+        else:
+            self._bands = dict(value or {})
+            self._props = dict(props or {})
+
+    def _with(self, bands=None, props=None):
+        return Image(self._bands if bands is None else bands, self._props if props is None else props)
+
+    def _first(self):
+        return next(iter(self._bands.values()))
+
+    @staticmethod
+    def cat(images):
+        bands = {}
+        for img in images:
+            bands.update(img._bands)
+        return Image(bands)
+
+    def select(self, names, new_names=None):
+        names = _unwrap(names)
+        names = [names] if isinstance(names, str) else list(names)
+        bands = {n: self._bands[n] for n in names}
+        if new_names is not None:
+            bands = dict(zip(new_names, bands.values()))
+        return self._with(bands)
+
+    def rename(self, *names):
+        names = list(names[0]) if len(names) == 1 and isinstance(names[0], (list, tuple)) else list(names)
+        return self._with(dict(zip(names, self._bands.values())))
+
+    def bandNames(self):
+        return List(self._bands)
+
+    def addBands(self, other):
+        return self._with({**self._bands, **other._bands})
+
+    def _map_bands(self, fn):
+        return self._with({k: None if v is None else fn(v) for k, v in self._bands.items()})
+
+    @staticmethod
+    def constant(value):
+        return Image({"constant": value})
+
+    def _binary(self, other, fn):
+        # Band-wise with a number or a single-band image; undefined results are masked (None)
+        value = other._first() if isinstance(other, Image) else other
+
+        def apply(v):
+            if value is None:
+                return None
+            try:
+                return fn(v, value)
+            except (ZeroDivisionError, OverflowError, ValueError):
+                return None
+
+        return self._map_bands(apply)
+
+    def add(self, other):
+        return self._binary(other, lambda a, b: a + b)
+
+    def subtract(self, other):
+        return self._binary(other, lambda a, b: a - b)
+
+    def multiply(self, other):
+        return self._binary(other, lambda a, b: a * b)
+
+    def divide(self, other):
+        return self._binary(other, lambda a, b: a / b)
+
+    def pow(self, other):
+        return self._binary(other, math.pow)
+
+    def exp(self):
+        return self._binary(0, lambda a, _: math.exp(a))
+
+    def bitwiseAnd(self, value):
+        return self._map_bands(lambda v: int(v) & value)
+
+    def eq(self, value):
+        return self._map_bands(lambda v: int(v == value))
+
+    def neq(self, value):
+        return self._map_bands(lambda v: _on_pixels(v, lambda a: np.where(np.isnan(a), np.nan, a != value))
+                               if isinstance(v, _Raster) else int(v != value))
+
+    def toInt(self):
+        return self._map_bands(lambda v: _on_pixels(v, np.trunc) if isinstance(v, _Raster) else int(v))
+
+    def remap(self, from_values, to_values, defaultValue=None):
+        mapping = dict(zip(from_values, to_values))
+        return self._map_bands(lambda v: mapping.get(int(v), defaultValue))
+
+    def And(self, other):
+        return self._with({"and": int(bool(self._first()) and bool(other._first()))})
+
+    def mask(self):
+        return self._map_bands(lambda v: 1)._with({k: int(v is not None) for k, v in self._bands.items()})
+
+    def updateMask(self, mask):
+        m = mask._first()
+        if isinstance(m, _Raster):
+            def masked(v):
+                def fn(xs, ys):
+                    keep = m.fn(xs, ys)
+                    return np.where(np.isnan(keep) | (keep == 0), np.nan, _pixels(v, xs, ys))
+                return _Raster(fn)
+
+            return self._with({k: masked(v) for k, v in self._bands.items()})
+        if m:
+            return self._with()
+        return self._with({k: None for k in self._bands})
+
+    def normalizedDifference(self, names):
+        a, b = (self._bands[n] for n in names)
+        # Negative inputs are masked, like in Earth Engine
+        if a is None or b is None or a + b == 0 or a < 0 or b < 0:
+            return Image({"nd": None})
+        return Image({"nd": (a - b) / (a + b)})
+
+    def expression(self, expr, variables):
+        values = {k: v._first() for k, v in variables.items()}
+        if any(v is None for v in values.values()):
+            return Image({"constant": None})
+        try:
+            return Image({"constant": eval(expr, {"exp": math.exp, "__builtins__": {}}, values)})
+        except (ZeroDivisionError, OverflowError, ValueError):
+            return Image({"constant": None})
+
+    def unmask(self, value=0):
+        def fill(v):
+            if isinstance(v, _Raster):
+                return _on_pixels(v, lambda a: np.where(np.isnan(a), value, a))
+            return _Fill(value) if v is None else v
+
+        return self._with({k: fill(v) for k, v in self._bands.items()})
+
+    def clip(self, geometry):
+        return self._with()
+
+    def set(self, key, value=None):
+        props = dict(self._props)
+        props.update(key if isinstance(key, dict) else {key: _unwrap(value)})
+        return self._with(props=props)
+
+    def setMulti(self, values):
+        return self.set(_unwrap(values))
+
+    def get(self, key):
+        return self._props.get(key)
+
+    def propertyNames(self):
+        return List(self._props)
+
+    def copyProperties(self, source, properties=None):
+        names = _unwrap(properties) if properties is not None else list(source._props)
+        return self._with(props={**self._props, **{k: source._props[k] for k in names}})
+
+    def date(self):
+        return Date(self._props["system:time_start"])
+
+    def getMapId(self, vis_params=None):
+        # One round trip; every call returns a new map id, like the real service
+        with stats._lock:
+            map_id = f"{stats.calls['getMapId']:08d}"
+        _round_trip("getMapId")
+        url_format = f"https://earthengine.invalid/v1/maps/{map_id}/tiles/{{z}}/{{x}}/{{y}}"
+        return {"mapid": map_id, "tile_fetcher": types.SimpleNamespace(url_format=url_format)}
+
+    def reduceRegion(self, reducer, geometry=None, scale=None, bestEffort=False, **kwargs):
+        if scale:
+            with stats._lock:
+                stats._finest_scale = min(scale, stats._finest_scale or scale)
+        if not any(isinstance(v, _Raster) for v in self._bands.values()):
+            return Dictionary({k: reducer._apply([v]) for k, v in self._bands.items()})
+        # Pixel-level bands: reduced over the pixel centres of the region at `scale`
+        x0, y0, x1, y1 = geometry.bounds()._rect
+        scale = scale or 10
+        xs = x0 + (np.arange(math.ceil((x1 - x0) / scale)) + 0.5) * scale
+        ys = y1 - (np.arange(math.ceil((y1 - y0) / scale)) + 0.5) * scale
+        arrays = [_pixels(v, xs, ys) for v in self._bands.values()]
+        if reducer.kind == "group":
+            return Dictionary(reducer._grouped(arrays))
+        return Dictionary({k: reducer._apply([a]) for k, a in zip(self._bands, arrays)})
+
+    def _value(self):
+        return {"bands": list(self._bands), "properties": self._props}
+
+
+@_traced
+class ImageCollection(_ComputedObject):
+    def __init__(self, source):
+        if isinstance(source, str):
+            self._images = list(_catalog)
+        elif isinstance(source, (List, ImageCollection)):
+            self._images = list(source._items if isinstance(source, List) else source._images)
+        else:
+            self._images = list(source)
+
+    @staticmethod
+    def fromImages(images):
+        return ImageCollection(images)
+
+    def filterBounds(self, geometry):
+        return ImageCollection(self._images)
+
+    def filterDate(self, start, end=None):
+        start = _to_datetime(start)
+        end = _to_datetime(end) if end is not None else datetime.max.replace(tzinfo=timezone.utc)
+        return ImageCollection(
+            img for img in self._images if start <= _to_datetime(img._props["system:time_start"]) < end
+        )
+
+    def filter(self, flt):
+        return ImageCollection(img for img in self._images if flt._test(img._props))
+
+    def sort(self, prop, ascending=True):
+        return ImageCollection(sorted(self._images, key=lambda img: img._props.get(prop), reverse=not ascending))
+
+    def map(self, fn):
+        return ImageCollection(fn(img) for img in self._images)
+
+    def aggregate_array(self, prop):
+        return List(img._props.get(prop) for img in self._images)
+
+    def distinct(self, prop):
+        # First image of every value of `prop`
+        first = {}
+        for img in self._images:
+            first.setdefault(img._props.get(prop), img)
+        return ImageCollection(first.values())
+
+    def select(self, names, new_names=None):
+        return ImageCollection(img.select(names, new_names) for img in self._images)
+
+    def mosaic(self):
+        # Last unmasked value of every band, like stacking the images in order
+        bands = {}
+        for img in self._images:
+            for name, value in img._bands.items():
+                if value is not None or name not in bands:
+                    bands[name] = value
+        return Image(bands)
+
+    def median(self):
+        if not self._images:
+            return Image()
+        reducer = Reducer.median()
+        names = list(self._images[0]._bands)
+        return Image({n: reducer._apply([img._bands.get(n) for img in self._images]) for n in names})
+
+    def size(self):
+        return len(self._images)
+
+    def toList(self, count):
+        return List(self._images[:_unwrap(count)])
+
+    def reduceColumns(self, reducer, selectors):
+        rows = [[img._props.get(s) for s in selectors] for img in self._images]
+        return Dictionary({"list": rows})
+
+    def _value(self):
+        return {"type": "ImageCollection", "features": [img._value() for img in self._images]}
+
+
+@_traced
+class data:
+    # ee.data: the REST calls behind the client library
+    @staticmethod
+    def computePixels(params):
+        # Structured array with one field per band, like fileFormat NUMPY_NDARRAY
+        if params.get("fileFormat") != "NUMPY_NDARRAY":
+            raise EEException("the fake computes NUMPY_NDARRAY pixels only")
+        image, grid = params["expression"], params["grid"]
+        if grid.get("crsCode", "EPSG:32633") != "EPSG:32633":
+            raise EEException("the fake computes pixels in EPSG:32633 only")
+        _round_trip("computePixels")
+        xs, ys = grid_centres(grid)
+        bands = {name: _pixels(value, xs, ys) for name, value in image._bands.items()}
+        out = np.empty((len(ys), len(xs)), dtype=[(name, arr.dtype) for name, arr in bands.items()])
+        for name, arr in bands.items():
+            out[name] = arr
+        return out
+
+
+def Initialize(*args, **kwargs):
+    pass
+
+
+def make_scenes(n_days=40, scenes_per_day=2, start="2023-04-01", step_days=5, seed=0):
+    """
+    Builds a synthetic Sentinel-2 archive of `n_days` acquisition days, each
+    with `scenes_per_day` tiles. Dates outside April-October are skipped so the
+    scenes survive the app's month filter.
+    """
+    rng = random.Random(seed)
+    # Separate stream, so adding the SCL band left the other values unchanged
+    scl_rng = random.Random(seed + 1)
+    scenes = []
+    day = _to_datetime(start)
+    while len(scenes) < n_days * scenes_per_day:
+        if 4 <= day.month <= 10:
+            for tile in range(scenes_per_day):
+                bands = {b: rng.uniform(200, 3000) for b in ("B2", "B3", "B4", "B8", "B9", "B11", "B12")}
+                bands["QA60"] = 0 if rng.random() > 0.1 else 1 << 10
+                bands["SCL"] = 6 if scl_rng.random() > 0.1 else scl_rng.choice([3, 8, 9, 10])
+                props = {
+                    "system:time_start": int((day + timedelta(minutes=tile)).timestamp() * 1000),
+                    "system:index": f"{day:%Y%m%d}_T{tile}",
+                    "CLOUDY_PIXEL_PERCENTAGE": rng.uniform(0, 30),
+                }
+                scenes.append(Image(bands, props))
+        day += timedelta(days=step_days)
+    return scenes
+
+
+def _missing(module, name):
+    raise AttributeError(f"module {module.__name__!r} has no attribute {name!r}")
+
+
+def _folium_map_class():
+    # geemap.foliumap.Map on plain folium: the page's map path runs, tiles are never fetched
+    import folium
+
+    class Map(folium.Map):
+        def __init__(self, basemap=None, layer_ctrl=False, **kwargs):
+            super().__init__(**kwargs)
+            self.ee_layers = []
+
+        def add_tile_layer(self, tiles, name, attribution, **kwargs):
+            folium.TileLayer(tiles=tiles, name=name, attr=attribution, **kwargs).add_to(self)
+            self.ee_layers.append(name)
+
+        def addLayer(self, ee_object, vis_params=None, name=None, shown=True, opacity=1.0):
+            map_id = ee_object.getMapId(vis_params or {})
+            self.add_tile_layer(map_id["tile_fetcher"].url_format, name, "Google Earth Engine")
+
+        def add_colormap(self, **kwargs):
+            # Named colormaps need the real geemap (matplotlib colorbar)
+            pass
+
+        def setCenter(self, lon, lat, zoom=None):
+            self.location = [lat, lon]
+            if zoom is not None:
+                self.options["zoom"] = zoom
+
+        def to_streamlit(self, height=600, **kwargs):
+            # Renders the HTML a real map would embed
+            return self.get_root().render()
+
+    return Map
+
+
+def quiet_streamlit():
+    # Benches call cached app functions outside a script run: no bare-mode warnings or `streamlit run` banner
+    from streamlit import config, logger
+
+    config.set_option("global.showWarningOnDirectExecution", False)
+    logger.set_log_level("error")
+
+
+def install(scenes=None, latency=0.0, latencies=None, scale_cost=0.0):
+    """
+    Registers this module as `ee` (and a minimal `geemap.foliumap`) in
+    `sys.modules` so app modules import against the fake backend.
+    Parameters:
+        latency: Simulated seconds per round trip.
+        latencies: Per-method overrides, e.g. {"getMapId": 0.5}.
+        scale_cost: Extra seconds of a round trip reducing at 10 m (less at coarser scales).
+    """
+    _catalog[:] = make_scenes() if scenes is None else scenes
+    stats.reset()
+    stats.latency = latency
+    stats.latencies = dict(latencies or {})
+    stats.scale_cost = scale_cost
+
+    module = sys.modules[__name__]
+    sys.modules["ee"] = module
+
+    foliumap = types.ModuleType("geemap.foliumap")
+    foliumap.ee_initialize = lambda token_name=None, **kwargs: None
+    # Map imports folium, so only when a page draws one (module __getattr__)
+    foliumap.__getattr__ = lambda name: _folium_map_class() if name == "Map" else _missing(foliumap, name)
+    geemap = types.ModuleType("geemap")
+    geemap.foliumap = foliumap
+    sys.modules["geemap"] = geemap
+    sys.modules["geemap.foliumap"] = foliumap
+    return module
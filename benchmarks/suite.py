@@ -0,0 +1,194 @@
+"""
+Offline benchmark suite: the catalog, the statistics and full page renders
+(Streamlit AppTest) against the recording fake `ee` backend, each case in a
+fresh process with its own data directory.
+
+Every case reports Earth Engine round trips, wall time and peak RSS, and the
+suite fails when a case exceeds its entry in benchmarks/thresholds.json.
+
+    python -m benchmarks.suite                      # run and check thresholds
+    python -m benchmarks.suite --record graphs/     # also dump each case's call graph
+    python -m benchmarks.suite --update-thresholds  # rewrite thresholds from this run
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THRESHOLDS_PATH = os.path.join(ROOT, "benchmarks", "thresholds.json")
+PAGES = {"Home": "Home.py", "Water Quality": "pages/0_💧 Water Quality.py", "Charts": "pages/1_📈 Charts.py"}
+
+
+def case_get_s2_imagery():
+    from gee_data import get_s2_imagery
+
+    catalog = get_s2_imagery()
+    catalog.image(catalog.dates[-1])
+
+
+def case_stats_imagery():
+    import stats
+    from gee_data import get_s2_imagery
+
+    ic = get_s2_imagery().collection
+    for name in stats.STATS_INDEXES:
+        stats.stats_imagery(ic, name)
+
+
+def case_stats_all_indexes():
+    import stats
+    from gee_data import get_s2_imagery
+
+    stats.stats_all_indexes(get_s2_imagery().collection, stats.STATS_INDEXES)
+
+
+def case_refresh_snapshot():
+    import stats
+
+    stats.refresh_snapshot()
+
+
+def page_case(page, warm, cube=False):
+    def setup():
+        if warm:
+            # The once-per-process background refresh and catalog build, finished before the page runs
+            import stats
+            from gee_data import get_s2_imagery
+            stats.start_background_refresh().join()
+            get_s2_imagery()
+        if cube:
+            # The catalog exported to the local raster cube (python -m batch --cube)
+            import batch
+            batch.export_cube(log=lambda msg: None)
+
+    def run():
+        from streamlit.testing.v1 import AppTest
+
+        app = AppTest.from_file(os.path.join(ROOT, PAGES[page]), default_timeout=120).run()
+        if app.exception:
+            raise RuntimeError(f"{page}: {[e.value for e in app.exception]}")
+        # Pages catch their own errors and show them with st.error
+        if app.error:
+            raise RuntimeError(f"{page}: {[e.value for e in app.error]}")
+        # Progressive statistics and layer prefetching go on in the background; count their round trips too
+        for thread in threading.enumerate():
+            if thread.name in ("progressive", "layer-prefetch"):
+                thread.join()
+
+    return setup, run
+
+
+CASES = {
+    "get_s2_imagery": (None, case_get_s2_imagery),
+    "stats_imagery": (None, case_stats_imagery),
+    "stats_all_indexes": (None, case_stats_all_indexes),
+    "refresh_snapshot": (None, case_refresh_snapshot),
+    **{f"page {page} {state}": page_case(page, state == "warm") for page in PAGES for state in ("cold", "warm")},
+    "page Water Quality cube": page_case("Water Quality", False, cube=True),
+}
+
+
+def child(name, latency, latencies, record):
+    from benchmarks import fake_ee
+    fake_ee.install(latency=latency, latencies=latencies)
+
+    setup, run = CASES[name]
+    if setup is not None:
+        setup()
+    fake_ee.stats.reset()
+
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    if record:
+        fake_ee.stats.dump(record)
+    return {
+        "seconds": round(elapsed, 3),
+        "round_trips": fake_ee.stats.round_trips,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "calls": sum(fake_ee.stats.calls.values()),
+    }
+
+
+def run_case(name, args):
+    record = os.path.join(args.record, name.replace(" ", "_") + ".json") if args.record else ""
+    with tempfile.TemporaryDirectory(prefix="wq-bench-") as data_dir:
+        env = dict(os.environ, WQ_DATA_DIR=data_dir, PYTHONPATH=ROOT)
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "--child", name, "--latency", str(args.latency),
+             "--latencies", json.dumps(args.latencies), "--record", record],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check(result, limits):
+    # Names of the metrics above their threshold
+    return [metric for metric, limit in limits.items() if result.get(metric, 0) > limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("cases", nargs="*", help="Cases to run (default: all)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per round trip")
+    parser.add_argument("--latencies", type=json.loads, default={},
+                        help='Per-method latency overrides as JSON, e.g. \'{"getMapId": 0.5}\'')
+    parser.add_argument("--record", default="", help="Directory for the recorded call graphs")
+    parser.add_argument("--update-thresholds", action="store_true")
+    parser.add_argument("--child")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child, args.latency, args.latencies, args.record)))
+        return 0
+
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+    thresholds = {}
+    if os.path.exists(THRESHOLDS_PATH):
+        with open(THRESHOLDS_PATH) as f:
+            thresholds = json.load(f)
+
+    results, failed = {}, []
+    print(f"{'case':<26} {'trips':>5} {'calls':>6} {'wall [s]':>9} {'rss [MB]':>9}")
+    for name in args.cases or CASES:
+        result = results[name] = run_case(name, args)
+        if "error" in result:
+            print(f"{name:<26} ERROR {result['error']}")
+            failed.append(name)
+            continue
+        over = check(result, thresholds.get(name, {}))
+        print(f"{name:<26} {result['round_trips']:>5} {result['calls']:>6} {result['seconds']:>9.2f} "
+              f"{result['peak_rss_mb']:>9.1f}" + (f"  REGRESSION: {', '.join(over)}" if over else ""))
+        if over:
+            failed.append(name)
+
+    if args.update_thresholds:
+        # Round trips are deterministic; time and memory get headroom for slower machines
+        for name, result in results.items():
+            if "error" not in result:
+                thresholds[name] = {
+                    "round_trips": result["round_trips"],
+                    "seconds": round(result["seconds"] * 2 + 1, 1),
+                    "peak_rss_mb": round(result["peak_rss_mb"] * 1.3),
+                }
+        with open(THRESHOLDS_PATH, "w") as f:
+            json.dump(thresholds, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Thresholds written to {THRESHOLDS_PATH}")
+        return 0
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+Synthetic stand-in for composites exported from Earth Engine: a meandering
+river mask with seasonal, noisy index values and random cloud gaps.
+"""
+from datetime import date
+
+import numpy as np
+
+# Typical value ranges of the app's indexes (see create_map.vis_params)
+INDEX_RANGES = {
+    'SABI': (-0.5, 3.5),
+    'CGI': (1, 5),
+    'CDOM': (5, 50),
+    'DOC': (10, 70),
+    'Cyanobacteria': (100, 1000),
+    'Turbidity': (-0.3, 0.2),
+}
+
+
+def river_mask(shape, width=12):
+    height, w = shape
+    rows = np.arange(height)[:, None]
+    centre = height / 2 + height / 4 * np.sin(np.arange(w) / w * 3 * np.pi)
+    return np.abs(rows - centre[None, :]) < width
+
+
+def synthetic_composite(date_str, indexes, shape, seed=0, cloud_fraction=0.1):
+    """
+    Returns a (len(indexes), height, width) float32 composite, NaN outside the river and under clouds.
+    """
+    day = date.fromisoformat(date_str)
+    rng = np.random.default_rng([seed, day.toordinal()])
+    season = np.sin((day.timetuple().tm_yday - 90) / 365 * 2 * np.pi)
+
+    valid = river_mask(shape)
+    if cloud_fraction:
+        cy, cx = rng.integers(0, shape[0]), rng.integers(0, shape[1])
+        radius = np.sqrt(cloud_fraction * shape[0] * shape[1] / np.pi)
+        yy, xx = np.ogrid[:shape[0], :shape[1]]
+        valid &= (yy - cy) ** 2 + (xx - cx) ** 2 > radius ** 2
+
+    data = np.full((len(indexes), *shape), np.nan, dtype=np.float32)
+    for i, name in enumerate(indexes):
+        low, high = INDEX_RANGES.get(name, (-1, 1))
+        mid, spread = (low + high) / 2, (high - low) / 4
+        values = mid + spread * season + rng.normal(0, spread / 3, size=shape)
+        data[i][valid] = values[valid]
+    return data
@@ -0,0 +1,4 @@
+import os
+
+# Root of the local stores (statistics, snapshot, tiles, raster cube); override with WQ_DATA_DIR
+DATA_DIR = os.environ.get("WQ_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
@@ -1,45 +1,113 @@
+import os
+import re
+import numpy as np
 import streamlit as st
-import geemap.foliumap as geemap
-from folium import plugins
-
-colorScaleHex = [
-    '#496FF2',
-    '#82D35F',
-    '#FEFD05',
-    '#FD0004',
-    '#8E2026',
-    '#D97CF5'
-]
-
-vis_params = {
-    'NDWI': {'min': -1, 'max': 1, 'palette': 'ndwi', 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
-    'NDVI': {'min': -1, 'max': 1, 'palette': 'ndvi', 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
-    'NDSI': {'min': -1, 'max': 1, 'palette': 'RdYlBu_r', 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
-    'SABI': {'min': -1, 'max': 1, 'palette': 'jet_r', 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
-    'CGI': {'min': 1, 'max': 5, 'palette': 'PuBuGn'},
-    'CDOM': {'min': 5, 'max': 50, 'palette': colorScaleHex},
-    'DOC': {'min': 10, 'max': 70, 'palette': colorScaleHex},
-    'Cyanobacteria': {'min': 100, 'max': 1000, 'palette': colorScaleHex},
-    'Turbidity': {'min': -1, 'max': 1, 'palette': ['blue', 'green', 'yellow', 'orange', 'red']},
-    'AWEI': {'min': -1, 'max': 1, 'palette': ['#f5f5dc', '#ffffcc', '#a1dab4', '#41b6c4', '#225ea8'], 'breaks': [-2.0, -1.5, -1.0, -0.5, 0.0, 0.5, 1.0, 1.5, 2.0]}
-}
-
-
-def show_map(cache_image, layer_name, index_name):
+from lazy_import import LazyModule
+from tile_cache import EETileSource, MapIdCache, TileCache, TileServer, palette_colors
+from metrics import cached
+from water_indexes import INDEXES
+
+# Heavy map dependencies, imported when the first map is drawn
+geemap = LazyModule("geemap.foliumap")
+plugins = LazyModule("folium.plugins")
+raster_layers = LazyModule("folium.raster_layers")
+
+# Serve index layers through the local tile cache (the port must be reachable from the browser)
+TILE_CACHE_ENABLED = os.environ.get("WQ_TILE_CACHE", "0") == "1"
+
+# Local layers are drawn from the cube overview of this factor: at the initial zoom (13) a screen
+# pixel covers about 19 m, so the 20 m overview looks the same as 10 m with a quarter of the pixels
+LOCAL_LAYER_OVERVIEW = int(os.environ.get("WQ_LOCAL_LAYER_OVERVIEW", "2"))
+
+# Map styling of every index, from the index registry
+vis_params = {name: index.vis for name, index in INDEXES.items()}
+
+
+@cached(st.cache_resource)
+def get_map_id_cache():
+    # Tile URL templates shared by all sessions; Earth Engine map IDs are not valid forever
+    return MapIdCache(
+        ttl=float(os.environ.get("WQ_MAPID_TTL", str(2 * 3600))),
+        refresh_margin=float(os.environ.get("WQ_MAPID_REFRESH_MARGIN", "600")),
+    )
+
+
+@cached(st.cache_resource)
+def get_tile_server():
+    cache = TileCache(max_bytes=int(os.environ.get("WQ_TILE_CACHE_MB", "512")) * 2 ** 20)
+    server = TileServer(
+        cache,
+        EETileSource(map_ids=get_map_id_cache()),
+        host=os.environ.get("WQ_TILE_HOST", "127.0.0.1"),
+        port=int(os.environ.get("WQ_TILE_PORT", "8765")),
+        public_url=os.environ.get("WQ_TILE_PUBLIC_URL"),
+    )
+    return server.start()
+
+
+def add_index_layer(Map, image, layer_name, index_name):
+    name = f"{index_name} - {layer_name}"
+    if not TILE_CACHE_ENABLED:
+        # Plain tile layer from the cached template instead of addLayer's getMapId on every rerun
+        url_format = get_map_id_cache().url_format(layer_name, index_name, vis_params[index_name], image.select(index_name))
+        Map.add_tile_layer(tiles=url_format, name=name, attribution="Google Earth Engine", max_zoom=24)
+        return
+
+    server = get_tile_server()
+    key = server.source.register(layer_name, index_name, vis_params[index_name], image.select(index_name))
+    Map.add_tile_layer(tiles=server.url_template(key), name=name, attribution="Google Earth Engine")
+
+
+def warm_index_layer(catalog, layer_name, index_name, cube=None, map_ids=None):
+    # Builds the composite and requests its tile URL template ahead of show_map (see prefetch.py)
+    if cube is not None and layer_name in cube:
+        return
+    image = catalog.image(layer_name).select(index_name)
+    (map_ids or get_map_id_cache()).url_format(layer_name, index_name, vis_params[index_name], image)
+
+
+def colorize(arr, vis):
+    # RGBA rendering of a local index array with the same palette as the EE layer
+    from matplotlib.colors import to_rgba
+
+    colors = [f"#{c}" if re.fullmatch(r"[0-9A-Fa-f]{6}", c) else c for c in palette_colors(vis['palette'])]
+    stops = np.array([to_rgba(c) for c in colors])
+    scaled = np.clip((arr - vis['min']) / (vis['max'] - vis['min']), 0, 1) * (len(stops) - 1)
+    positions = np.arange(len(stops))
+    rgba = np.stack([np.interp(scaled, positions, stops[:, i]) for i in range(4)], axis=-1)
+    rgba[~np.isfinite(arr)] = 0
+    return (rgba * 255).astype(np.uint8)
+
+
+def add_local_index_layer(Map, cube, layer_name, index_name, factor=LOCAL_LAYER_OVERVIEW):
+    # Index layer rendered from the local raster cube (an overview level), no Earth Engine request
+    arr = cube.read(layer_name, index_name, factor)
+    (south, west), (north, east) = cube.meta["bounds"]
+    height, width = cube.meta["shape"]
+    # Overview edge blocks reach past the grid; stretch the bounds to match
+    south = north - (north - south) * arr.shape[0] * factor / height
+    east = west + (east - west) * arr.shape[1] * factor / width
+    raster_layers.ImageOverlay(
+        image=colorize(arr, vis_params[index_name]),
+        bounds=[[south, west], [north, east]],
+        name=f"{index_name} - {layer_name}",
+    ).add_to(Map)
+
+
+def show_map(cache_image, layer_name, index_name, cube=None):
     Map = geemap.Map(
         layer_ctrl=True, basemap="HYBRID", control_scale=True
     )
     minimap = plugins.MiniMap()
     Map.add_child(minimap)
     #Map.addLayer(cache_image, {'min': 0, 'max': 0.3, 'bands': ['B4', 'B3', 'B2'], 'gamma': 1.3}, f"RGB - {layer_name}")
-    Map.addLayer(cache_image.select(index_name), vis_params[index_name], f"{index_name} - {layer_name}")
-
-    if index_name in ['CDOM', 'DOC']:
-        label_name = f"{index_name} Colorbar [mg/l]"
-    elif index_name == 'Cyanobacteria':
-        label_name = f"{index_name} Colorbar [10^3 cell/ml]"
+    if cube is not None and layer_name in cube:
+        add_local_index_layer(Map, cube, layer_name, index_name)
     else:
-        label_name = f"{index_name} Colorbar"
+        add_index_layer(Map, cache_image, layer_name, index_name)
+
+    units = INDEXES[index_name].units
+    label_name = f"{index_name} Colorbar [{units}]" if units else f"{index_name} Colorbar"
 
     #Map.add_colorbar(vis_params[index_name], label=label_name)
 
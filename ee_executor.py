@@ -0,0 +1,169 @@
+import os
+import time
+import random
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from metrics import metrics
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` requests per second on average, bursts up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_quota_error(exc):
+    # Earth Engine reports throttling as EEException messages rather than dedicated types
+    message = str(exc).lower()
+    return any(s in message for s in ("quota", "rate limit", "too many", "429", "resource exhausted"))
+
+
+class RequestExecutor:
+    """
+    Shared executor for blocking Earth Engine requests (getInfo, getMapId, ...).
+
+    - at most `max_workers` requests run concurrently,
+    - requests start at no more than `rate` per second (token bucket),
+    - quota errors are retried with exponential backoff and jitter,
+    - identical in-flight requests (same `key`) share one Future.
+
+    Requests made from inside a worker run inline, so nested calls cannot
+    deadlock the pool. Every request that makes no nested request (an actual
+    round trip, not a wrapper around others) is timed as an `ee_request`
+    metrics span labelled with the function name and the submitting page.
+    """
+
+    def __init__(self, max_workers=4, rate=10.0, burst=None, max_retries=5, backoff=1.0, max_backoff=32.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._bucket = TokenBucket(rate, burst)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ee-request")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.retries = 0
+        self.deduplicated = 0
+
+    def _call(self, fn, args, kwargs):
+        attempt = 0
+        while True:
+            self._bucket.acquire()
+            try:
+                return self._timed(fn, args, kwargs)
+            except Exception as e:
+                if not is_quota_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                metrics.inc("ee_retries_total")
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _timed(self, fn, args, kwargs):
+        # Only leaf calls are recorded, so a wrapper and the requests it makes are not counted twice
+        self._local.nested = False
+        start = time.perf_counter()
+        error = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            if not self._local.nested:
+                kind = getattr(fn, "__name__", type(fn).__name__)
+                metrics.record("ee_request", time.perf_counter() - start, error, kind=kind)
+            # Tells an enclosing call that it made a nested request
+            self._local.nested = True
+
+    def _worker(self, fn, args, kwargs):
+        self._local.in_worker = True
+        try:
+            return self._call(fn, args, kwargs)
+        finally:
+            self._local.in_worker = False
+
+    def submit(self, fn, *args, key=None, **kwargs):
+        if getattr(self._local, "in_worker", False):
+            future = Future()
+            try:
+                future.set_result(self._call(fn, args, kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        # Workers run in the submitter's context, so their metrics carry its page label
+        context = contextvars.copy_context()
+        if key is None:
+            return self._pool.submit(context.run, self._worker, fn, args, kwargs)
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+            future = self._pool.submit(context.run, self._worker, fn, args, kwargs)
+            self._in_flight[key] = future
+
+        def forget(done, key=key):
+            with self._lock:
+                if self._in_flight.get(key) is done:
+                    del self._in_flight[key]
+
+        future.add_done_callback(forget)
+        return future
+
+    def run(self, fn, *args, key=None, **kwargs):
+        return self.submit(fn, *args, key=key, **kwargs).result()
+
+    def map(self, fn, items):
+        futures = [self.submit(fn, item) for item in items]
+        return [f.result() for f in futures]
+
+    def get_info(self, obj):
+        return self.run(obj.getInfo, key=obj.serialize())
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = RequestExecutor(
+                max_workers=int(os.environ.get("WQ_EE_MAX_WORKERS", "4")),
+                rate=float(os.environ.get("WQ_EE_RATE", "10")),
+            )
+        return _executor
+
+
+def get_info(obj):
+    # getInfo() routed through the shared executor
+    return get_executor().get_info(obj)
@@ -0,0 +1,21 @@
+import threading
+from lazy_import import LazyModule
+
+geemap = LazyModule("geemap.foliumap")
+
+_initialized = False
+_lock = threading.Lock()
+
+
+def ensure_ee(token_name="EARTHENGINE_TOKEN"):
+    """
+    Initializes the Earth Engine session once per process, on first use.
+    Safe to call from any thread and on every request.
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _lock:
+        if not _initialized:
+            geemap.ee_initialize(token_name=token_name)
+            _initialized = True
@@ -1,78 +1,529 @@
 import ee
-import geemap.foliumap as geemap
-import streamlit as st
 from water_indexes import water_indexes
-from datetime import date
+from ee_executor import get_executor, get_info
+from ee_session import ensure_ee
+from metrics import cached
+from shared_cache import shared
+from aoi_coverage import COVERAGE_PATH, CoverageCache, load_coverage
+from config import DATA_DIR
+from datetime import date, datetime, timedelta, timezone
+from collections import OrderedDict
+import os
+import json
+import time
+import threading
+import warnings
+import math
+import numpy as np
+from raster_cube import CUBE_DIR, RasterCube, open_cube
 
 
-@st.cache_data
-def ee_authenticate(token_name="EARTHENGINE_TOKEN"):
-    geemap.ee_initialize(token_name=token_name)
+# Area of interest
+AOI_ASSET = "projects/jakub-hempel/assets/water_welna"
 
+_aoi = None
 
-ee_authenticate(token_name="EARTHENGINE_TOKEN")
 
+def get_aoi():
+    # Built on first use, after the Earth Engine session is initialized
+    global _aoi
+    if _aoi is None:
+        ensure_ee()
+        _aoi = ee.FeatureCollection(AOI_ASSET)
+    return _aoi
 
-# Area of interest
-aoi = ee.FeatureCollection("projects/jakub-hempel/assets/water_welna")
 
+def set_aoi(asset_id):
+    # Switches the area of interest (e.g. a batch run over another reach); set before building catalogs
+    global AOI_ASSET, _aoi
+    AOI_ASSET = asset_id
+    _aoi = None
 
-@st.cache_resource(max_entries=1)
-def get_s2_imagery(indexes=None):
-    """
-    Downloads and processes Sentinel-2 imagery with selected water indexes.
-    Parameters:
-        indexes: List of water index band names to compute (e.g., ['CDOM', 'SABI']).
-                 If None, compute all available.
-    Returns:
-        A dict with imagery by date and list of available dates.
-    """
 
-    indexes = ['Turbidity', 'CDOM', 'DOC', 'Cyanobacteria', 'SABI', 'CGI']
+# Fill value for masked pixels in exported composites
+NODATA = -9999
+
+# First date of the archive processed by the app
+START_DATE = "2023-03-01"
+
+WQ_INDEXES = ['Turbidity', 'CDOM', 'DOC', 'Cyanobacteria', 'SABI', 'CGI']
+
+# Dates with a smaller valid (cloud-free) fraction of the AOI are dropped from the catalog; 0 disables
+MIN_COVERAGE = float(os.environ.get("WQ_MIN_COVERAGE", "0.2"))
+# Also mask with the Scene Classification Layer (WQ_SCL_MASK=1)
+SCL_MASK = os.environ.get("WQ_SCL_MASK", "0") == "1"
+# SCL classes masked: cloud shadow, cloud medium/high probability, thin cirrus
+SCL_CLOUD_CLASSES = [3, 8, 9, 10]
+# Band whose mask measures the coverage (all bands share the cloud mask) and its scale
+COVERAGE_BAND = "B3"
+COVERAGE_SCALE = 20
+
+# The served imagery catalog is rebuilt in the background after this many seconds (failed rebuilds retried sooner)
+CATALOG_MAX_AGE = float(os.environ.get("WQ_CATALOG_MAX_AGE", "21600"))
+CATALOG_RETRY = 300
+CATALOG_PATH = os.path.join(DATA_DIR, "catalog.json")
+
 
-    start_date = "2023-03-01"
-    end_date = str(date.today())
+def mask_clouds(image, scl=False):
+    # Mask opaque clouds (bit 10) and cirrus (bit 11) from the QA60 band, optionally SCL cloud classes too
+    qa = image.select('QA60')
+    cloud_mask = qa.bitwiseAnd(1 << 10).eq(0).And(qa.bitwiseAnd(1 << 11).eq(0))
+    if scl:
+        clear = image.select('SCL').remap(SCL_CLOUD_CLASSES, [0] * len(SCL_CLOUD_CLASSES), 1)
+        cloud_mask = cloud_mask.And(clear)
+    return image.updateMask(cloud_mask).copyProperties(image, image.propertyNames())
+
+
+def s2_masked_collection(start_date=START_DATE, end_date=None, scl=False):
+    ensure_ee()
+    if end_date is None:
+        end_date = str(date.today())
 
     # Base S2 collection, filtered to AOI, date range, month range, and cloud cover
     s2_collection = (
         ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-        .filterBounds(aoi)
+        .filterBounds(get_aoi())
         .filterDate(start_date, end_date)
         .filter(ee.Filter.calendarRange(4, 10, 'month'))  # April–October only
         .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
         .sort('system:time_start')
     )
+    return s2_collection.map(lambda img: mask_clouds(img, scl))
+
+
+def composite_scenes(scenes, date_str, indexes):
+    # Median composite of one day's scenes with the selected index bands, clipped to the AOI
+    date_obj = ee.Date(date_str)
+    median_img = scenes.median().divide(10000).set("date", date_str)
+    image_with_indexes = water_indexes(median_img, only=indexes).set("system:time_start", date_obj.millis())
+    index_bands = image_with_indexes.bandNames().filter(ee.Filter.inList("item", indexes))
+    return image_with_indexes.select(index_bands).clip(get_aoi())
+
+
+def compute_median_by_date(s2_masked, date_str, indexes):
+    # Daily median composite of a single date (one filterDate scan of the collection)
+    date_obj = ee.Date(date_str)
+    return composite_scenes(s2_masked.filterDate(date_obj, date_obj.advance(1, 'day')), date_str, indexes)
+
 
-    # Mask clouds
-    def mask_clouds(image):
-        qa = image.select('QA60')
-        cloud_mask = qa.bitwiseAnd(1 << 10).eq(0).And(qa.bitwiseAnd(1 << 11).eq(0))
-        return image.updateMask(cloud_mask).copyProperties(image, image.propertyNames())
-
-    s2_masked = s2_collection.map(mask_clouds)
-
-    # Generate unique dates for filtered images
-    date_list = ee.List(
-        s2_masked.aggregate_array("system:time_start")
-        .map(lambda t: ee.Date(t).format("YYYY-MM-dd"))
-    ).distinct()
-
-    # Compute daily median images
-    def compute_median_by_date(date_str):
-        date_obj = ee.Date(date_str)
-        filtered = s2_masked.filterDate(date_obj, date_obj.advance(1, 'day'))
-        median_img = filtered.median().divide(10000).set("date", date_str)
-        image_with_indexes = water_indexes(median_img, only=indexes).set("system:time_start", date_obj.millis())
-        index_bands = image_with_indexes.bandNames().filter(ee.Filter.inList("item", indexes))
-        return image_with_indexes.select(index_bands).clip(aoi)
-
-    median_images_ic = ee.ImageCollection(date_list.map(compute_median_by_date))
-    median_images_list = median_images_ic.toList(median_images_ic.size())
-    dates = date_list.getInfo()
-
-    median_images_dict = {
-        dates[i]: ee.Image(median_images_list.get(i)) for i in range(len(dates))
+def daily_groups(s2_masked, dates=None):
+    """
+    Groups the scenes by acquisition day (UTC) in a single join instead of one
+    filterDate scan per date.
+    Parameters:
+        dates: Days (YYYY-MM-dd) to keep; all days if None.
+    Returns:
+        An ImageCollection with one image per day carrying the day ("day",
+        YYYY-MM-dd) and the list of its scenes ("scenes").
+    """
+    if dates is not None:
+        dates = sorted(dates)
+        if not dates:
+            return ee.ImageCollection([])
+        # Only the scenes of the requested date range take part in the join
+        end = str(date.fromisoformat(dates[-1]) + timedelta(days=1))
+        s2_masked = s2_masked.filterDate(dates[0], end)
+    dated = s2_masked.map(lambda img: img.set("day", img.date().format("YYYY-MM-dd")))
+    groups = ee.ImageCollection(ee.Join.saveAll("scenes").apply(
+        primary=dated.distinct("day"),
+        secondary=dated,
+        condition=ee.Filter.equals(leftField="day", rightField="day")
+    ))
+    if dates is not None:
+        groups = groups.filter(ee.Filter.inList("day", dates))
+    return groups
+
+
+def daily_composites(s2_masked, indexes, dates=None):
+    """
+    Daily median composites of all days, or of `dates` only, from one grouping pass.
+    Same images as compute_median_by_date for every date, sorted by date.
+    """
+    return daily_groups(s2_masked, dates).map(
+        lambda group: composite_scenes(ee.ImageCollection.fromImages(group.get("scenes")), group.get("day"), indexes)
+    ).sort("system:time_start")
+
+
+def day_index(time_starts):
+    """
+    Local counterpart of daily_groups: buckets scene timestamps (ms since epoch)
+    by UTC day with a dict as hash index, in one pass.
+    Returns:
+        {YYYY-MM-dd: [positions in time_starts]}, days in order of first appearance.
+    """
+    index = {}
+    for i, millis in enumerate(time_starts):
+        day = datetime.fromtimestamp(millis / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+        index.setdefault(day, []).append(i)
+    return index
+
+
+def daily_medians_local(values, time_starts):
+    """
+    Per-day medians of local scene values grouped with day_index.
+    Parameters:
+        values: Array of shape (n_scenes, ...) (bands, pixels, ...); NaN marks masked values.
+        time_starts: Acquisition time of every scene, ms since epoch.
+    Returns:
+        The days and an array of shape (n_days, ...) of nan-medians.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = day_index(time_starts)
+    medians = np.full((len(index), *values.shape[1:]), np.nan)
+    with warnings.catch_warnings():
+        # Values masked in all scenes of a day stay NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for i, positions in enumerate(index.values()):
+            medians[i] = np.nanmedian(values[positions], axis=0)
+    return list(index), medians
+
+
+def day_coverage(s2_masked, days, scale=COVERAGE_SCALE):
+    """
+    Valid (unmasked) fraction of the AOI on each of `days`, over the union of
+    the day's scenes, in a single batched reduction and round trip.
+    Returns:
+        {day: fraction between 0 and 1} for every day of `days`
+    """
+    def set_coverage(group):
+        valid = ee.ImageCollection.fromImages(group.get("scenes")).select(COVERAGE_BAND).mosaic().mask()
+        fraction = valid.reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=get_aoi(),
+            scale=scale,
+            bestEffort=True
+        ).get(COVERAGE_BAND)
+        return group.set("coverage", fraction)
+
+    data = get_info(daily_groups(s2_masked, days).map(set_coverage).reduceColumns(
+        reducer=ee.Reducer.toList(2),
+        selectors=["day", "coverage"]
+    ))
+    # A day without any pixel in the AOI has no mean, and reduceColumns drops rows with a null value:
+    # both mean no valid pixel
+    coverage = {day: 0.0 for day in days}
+    coverage.update({day: fraction or 0.0 for day, fraction in (data or {}).get("list", []) if day in coverage})
+    return coverage
+
+
+def covered_dates(s2_masked, scenes_by_day, min_coverage, cache, path=COVERAGE_PATH):
+    """
+    Drops the days whose valid fraction of the AOI is below `min_coverage`,
+    before any composite or index is computed for them. Only days missing
+    from `cache` are reduced (in one batch); the cache is updated and saved.
+    Parameters:
+        scenes_by_day: {day: scene ids}, in catalog order.
+    Returns:
+        The kept days in order and the {day: fraction} of all days.
+    """
+    missing = cache.missing(scenes_by_day)
+    if missing:
+        for day, fraction in day_coverage(s2_masked, missing).items():
+            cache.put(day, scenes_by_day[day], fraction)
+        cache.save(path)
+    coverage = {day: cache.get(day, scenes) for day, scenes in scenes_by_day.items()}
+    # Days without valid pixels have coverage 0 (cached like any other) and are pruned
+    kept = [day for day, fraction in coverage.items() if fraction >= min_coverage]
+    return kept, coverage
+
+
+class ImageryCatalog:
+    """
+    Date catalog of daily Sentinel-2 composites.
+
+    Only the list of acquisition dates is fetched up front. The composite for a
+    date is built when first requested and kept in a small LRU, so pages that
+    show one date at a time never construct the others. With known `dates`
+    (e.g. from a persisted descriptor) nothing is fetched at all.
+    """
+
+    def __init__(self, indexes=None, start_date=START_DATE, end_date=None, max_images=8,
+                 min_coverage=MIN_COVERAGE, scl=SCL_MASK, coverage_path=COVERAGE_PATH, dates=None):
+        self.indexes = list(indexes) if indexes is not None else WQ_INDEXES
+        self.start_date = start_date
+        self.end_date = end_date if end_date is not None else str(date.today())
+        self.max_images = max_images
+        self.min_coverage = min_coverage
+        self._s2_masked = s2_masked_collection(self.start_date, self.end_date, scl=scl)
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.coverage = {}
+        if dates is not None:
+            self.dates = list(dates)
+            return
+
+        # Timestamps and ids of all scenes in one request, grouped locally by acquisition day
+        scenes = get_info(self._s2_masked.reduceColumns(
+            reducer=ee.Reducer.toList(2),
+            selectors=["system:time_start", "system:index"]
+        ))
+        rows = (scenes or {}).get("list", [])
+        scenes_by_day = {
+            day: [rows[i][1] for i in positions] for day, positions in day_index([row[0] for row in rows]).items()
+        }
+
+        # Cloud-covered dates are pruned up front; the coverage of a day is computed once
+        self.dates = list(scenes_by_day)
+        if min_coverage > 0:
+            settings = {"aoi": AOI_ASSET, "scl": scl, "band": COVERAGE_BAND, "scale": COVERAGE_SCALE}
+            cache = load_coverage(coverage_path, settings) or CoverageCache(settings)
+            self.dates, self.coverage = covered_dates(
+                self._s2_masked, scenes_by_day, min_coverage, cache, coverage_path
+            )
+
+    def image(self, date_str):
+        with self._lock:
+            if date_str in self._images:
+                self._images.move_to_end(date_str)
+                return self._images[date_str]
+
+        image = compute_median_by_date(self._s2_masked, date_str, self.indexes)
+
+        with self._lock:
+            self._images[date_str] = image
+            self._images.move_to_end(date_str)
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return image
+
+    @property
+    def collection(self):
+        return self.collection_for(self.dates)
+
+    def collection_for(self, dates):
+        # Composites of a subset of the catalog dates as one ImageCollection, from one grouping pass
+        return daily_composites(self._s2_masked, self.indexes, dates)
+
+    def descriptor(self):
+        # Plain, picklable summary for st.cache_data layers
+        return {
+            "dates": list(self.dates),
+            "indexes": list(self.indexes),
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "min_coverage": self.min_coverage,
+        }
+
+    @classmethod
+    def from_descriptor(cls, descriptor, scl=SCL_MASK):
+        # The catalog a descriptor() was taken from, without any Earth Engine request
+        return cls(descriptor["indexes"], descriptor["start_date"], descriptor["end_date"],
+                   min_coverage=descriptor["min_coverage"], scl=scl, dates=descriptor["dates"])
+
+
+class CatalogService:
+    """
+    Stale-while-revalidate holder of the imagery catalog.
+
+    get() answers at once from the last good catalog: the one in memory or,
+    after a restart, the one persisted at `path`. A daemon thread rebuilds
+    it every `max_age` seconds; the new catalog is swapped in whole and
+    persisted, and a failed rebuild keeps the previous one. Only without any
+    catalog does get() wait for a build. Builds are serialized and a caller
+    that waited for another caller's build takes its result, so concurrent
+    sessions never rebuild twice.
+    """
+
+    def __init__(self, indexes=None, max_age=CATALOG_MAX_AGE, path=CATALOG_PATH, scl=SCL_MASK):
+        self.indexes = list(indexes) if indexes is not None else WQ_INDEXES
+        self.max_age = max_age
+        self.path = path
+        self.scl = scl
+        self.builds = 0
+        self.error = None
+        self._settings = {"aoi": AOI_ASSET, "indexes": self.indexes, "start_date": START_DATE,
+                          "min_coverage": MIN_COVERAGE, "scl": scl}
+        self._build_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # (catalog, version, built as a Unix time), replaced as a whole
+        self._current = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            if state["settings"] != self._settings:
+                return None
+            return ImageryCatalog.from_descriptor(state["catalog"], self.scl), state["version"], state["built"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _save(self, current):
+        # Written atomically (one temporary file per writer); another process reads either the previous or the new catalog
+        catalog, version, built = current
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"settings": self._settings, "version": version, "built": built,
+                       "catalog": catalog.descriptor()}, f)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def version(self):
+        # Increases with every swapped-in catalog; None before the first
+        current = self._current
+        return current[1] if current is not None else None
+
+    @property
+    def age(self):
+        # Seconds since the served catalog was built; None before the first
+        current = self._current
+        return time.time() - current[2] if current is not None else None
+
+    def get(self):
+        current = self._current
+        if current is None:
+            current = self.revalidate(None)
+        self.start()
+        return current[0]
+
+    def revalidate(self, seen=False):
+        """
+        Builds a new catalog and swaps it in, unless another build finished
+        while waiting for the lock (then its result is returned).
+        Parameters:
+            seen: The entry the caller wants replaced (default: the current one).
+        Returns:
+            The (catalog, version, built) entry served afterwards.
+        """
+        if seen is False:
+            seen = self._current
+        with self._build_lock:
+            if self._current is not seen:
+                return self._current
+            try:
+                # Workers sharing the result cache build the catalog once per period between them
+                period = int(time.time() // self.max_age) if self.max_age > 0 else time.time()
+                catalog = ImageryCatalog.from_descriptor(catalog_descriptor(self._settings, period), self.scl)
+            except Exception as e:
+                self.error = e
+                if seen is None:
+                    raise
+                return seen
+            current = catalog, (seen[1] if seen is not None else 0) + 1, time.time()
+            self._current = current
+            self.builds += 1
+            self.error = None
+            try:
+                self._save(current)
+            except OSError:
+                # Persisting only speeds up the next start
+                pass
+            return current
+
+    def start(self):
+        # Starts the revalidation schedule; without a catalog the first build starts at once
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="catalog-revalidate", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        age = self.age
+        delay = max(0.0, self.max_age - age) if age is not None else 0.0
+        while not self._stop.wait(delay):
+            try:
+                self.revalidate()
+            except Exception:
+                # The first build failed (recorded in self.error); get() will try again
+                pass
+            # Failed rebuilds are retried sooner than the schedule
+            delay = self.max_age if self.error is None else min(self.max_age, CATALOG_RETRY)
+
+    def stop(self):
+        # Ends the revalidation schedule, after a rebuild in progress
+        self._stop.set()
+        with self._thread_lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+
+@shared()
+def catalog_descriptor(settings, period):
+    # Descriptor of a freshly built catalog; `period` only keys the shared cache entry
+    catalog = ImageryCatalog(settings["indexes"], start_date=settings["start_date"],
+                             min_coverage=settings["min_coverage"], scl=settings["scl"])
+    return catalog.descriptor()
+
+
+@cached("cache_resource", max_entries=1)
+def get_catalog_service(indexes=None):
+    return CatalogService(indexes)
+
+
+def get_s2_imagery(indexes=None):
+    """
+    Sentinel-2 imagery with selected water indexes, from the last good catalog
+    (revalidated in the background, see CatalogService).
+    Parameters:
+        indexes: List of water index band names to compute (e.g., ['CDOM', 'SABI']).
+                 If None, compute all available.
+    Returns:
+        An ImageryCatalog with the available dates and lazily built composites.
+    """
+    return get_catalog_service(indexes).get()
+
+
+def catalog_version():
+    # Version of the served catalog, for cache keys (None before the first build)
+    return get_catalog_service().version
+
+
+def aoi_grid(scale=10, crs="EPSG:32633"):
+    """
+    Fixed pixel grid covering the AOI, shared by every exported composite.
+    Returns:
+        A computePixels grid dict and the AOI bounds in lat/lon ([[south, west], [north, east]]).
+    """
+    xs, ys = zip(*get_info(get_aoi().geometry().bounds(1, crs).coordinates().get(0)))
+    lons, lats = zip(*get_info(get_aoi().geometry().bounds(1, "EPSG:4326").coordinates().get(0)))
+    width = math.ceil((max(xs) - min(xs)) / scale)
+    height = math.ceil((max(ys) - min(ys)) / scale)
+    grid = {
+        "dimensions": {"width": width, "height": height},
+        "affineTransform": {
+            "scaleX": scale, "shearX": 0, "translateX": min(xs),
+            "shearY": 0, "scaleY": -scale, "translateY": max(ys),
+        },
+        "crsCode": crs,
     }
+    return grid, [[min(lats), min(lons)], [max(lats), max(lons)]]
 
-    return {"layers": median_images_dict, "dates": dates, "collection": median_images_ic}
 
+def export_composite(image, indexes, grid):
+    # Index bands of one composite as a (len(indexes), height, width) float32 array
+    pixels = get_executor().run(ee.data.computePixels, {
+        "expression": image.select(indexes).unmask(NODATA),
+        "fileFormat": "NUMPY_NDARRAY",
+        "grid": grid,
+    })
+    data = np.stack([pixels[name] for name in indexes]).astype(np.float32)
+    data[data == NODATA] = np.nan
+    return data
+
+
+def export_to_cube(catalog, root=CUBE_DIR, scale=10, chunk_dates=16):
+    """
+    Exports the catalog composites that are not yet in the local raster cube.
+    Returns:
+        The RasterCube with the new dates appended.
+    """
+    cube = open_cube(root)
+    if cube is None:
+        grid, bounds = aoi_grid(scale)
+        shape = (grid["dimensions"]["height"], grid["dimensions"]["width"])
+        cube = RasterCube.create(root, catalog.indexes, shape, chunk_dates=chunk_dates, grid=grid, bounds=bounds)
+
+    last = cube.dates[-1] if cube.dates else ""
+    new_dates = [d for d in catalog.dates if d > last]
+    futures = [
+        get_executor().submit(export_composite, catalog.image(d), cube.indexes, cube.meta["grid"])
+        for d in new_dates
+    ]
+    for date_str, future in zip(new_dates, futures):
+        cube.append(date_str, future.result())
+    return cube
@@ -0,0 +1,263 @@
+"""
+In-process instrumentation of the app: counters, latency histograms and
+timing spans, shared by all sessions of the process.
+
+- every Earth Engine round trip made through ee_executor is an `ee_request` span,
+- functions decorated with `cached(st.cache_data)` / `cached(st.cache_resource)`
+  (or `cached("cache_data")` without importing Streamlit) count their calls
+  and misses (`cache_call` / `cache_miss` spans),
+- pages call `track_page(name)` at the top and `finish_page()` at the bottom
+  (`page_render` span); spans inside a page run are labelled with the page.
+
+Spans are appended to a JSON-lines log when WQ_METRICS_LOG is set, and
+`prometheus()` renders everything in the Prometheus text format (served on
+/metrics when WQ_METRICS_PORT is set).
+"""
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "wq_"
+
+_page = contextvars.ContextVar("wq_page", default=None)
+_page_start = contextvars.ContextVar("wq_page_start", default=None)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts for export plus the last `window` samples for p50/p95.
+    """
+
+    def __init__(self, buckets=BUCKETS, window=1024):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        if not self.recent:
+            return float("nan")
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Metrics:
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Times the block as `<name>_seconds` and counts it in `<name>_total` (and
+        `<name>_errors_total` when it raises), labelled with the current page.
+        """
+        error = False
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, error, **labels)
+
+    def record(self, name, seconds, error=False, **labels):
+        # A finished span measured by the caller
+        page = _page.get()
+        if page is not None:
+            labels.setdefault("page", page)
+        self.observe(f"{name}_seconds", seconds, **labels)
+        self.inc(f"{name}_total", **labels)
+        if error:
+            self.inc(f"{name}_errors_total", **labels)
+        if self.log_path:
+            self._log({"ts": time.time(), "span": name, "seconds": round(seconds, 6), "error": error, **labels})
+
+    def _log(self, event):
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock:
+            with open(self.log_path, "a") as f:
+                f.write(line)
+
+    def counter(self, name, **labels):
+        # Sum of a counter over all label sets matching `labels`
+        with self._lock:
+            return sum(v for (n, l), v in self.counters.items() if n == name and labels.items() <= dict(l).items())
+
+    def series(self, name):
+        # [(labels, Histogram)] of a histogram, one entry per label set
+        with self._lock:
+            return [(dict(l), h) for (n, l), h in self.histograms.items() if n == name]
+
+    def prometheus(self):
+        def fmt(labels):
+            escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for k, v in labels)
+            return "{" + ",".join(escaped) + "}" if labels else ""
+
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{PREFIX}{name}{fmt(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (n, labels), h in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}{name}_bucket{fmt(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{fmt(labels)} {h.sum}")
+                    lines.append(f"{PREFIX}{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+metrics = Metrics(os.environ.get("WQ_METRICS_LOG"))
+
+
+def span(name, **labels):
+    return metrics.span(name, **labels)
+
+
+def cached(cache_decorator, **cache_kwargs):
+    """
+    Drop-in for `@st.cache_data` / `@st.cache_resource` (passed in as
+    `cache_decorator`, with its keyword arguments) that also counts calls
+    and misses: the inner wrapper only runs when the cache misses.
+
+    Modules that must stay importable without Streamlit (the batch pipeline)
+    pass the decorator by name, e.g. `cached("cache_resource")`; Streamlit is
+    then imported on the first call.
+    """
+    def decorate(fn):
+        name = fn.__name__
+        lock = threading.Lock()
+        cached_fn = None
+
+        @wraps(fn)
+        def miss(*args, **kwargs):
+            with span("cache_miss", function=name):
+                return fn(*args, **kwargs)
+
+        def resolve():
+            nonlocal cached_fn
+            with lock:
+                if cached_fn is None:
+                    decorator = cache_decorator
+                    if isinstance(decorator, str):
+                        import streamlit as st
+                        decorator = getattr(st, decorator)
+                    cached_fn = decorator(**cache_kwargs)(miss) if cache_kwargs else decorator(miss)
+            return cached_fn
+
+        if not isinstance(cache_decorator, str):
+            resolve()
+
+        @wraps(fn)
+        def call(*args, **kwargs):
+            with span("cache_call", function=name):
+                return (cached_fn or resolve())(*args, **kwargs)
+
+        call.clear = lambda: resolve().clear()
+        return call
+
+    return decorate
+
+
+def track_page(name):
+    # Labels the spans of this script run with the page and starts its render timer
+    _page.set(name)
+    _page_start.set(time.perf_counter())
+    metrics.inc("page_runs_total", page=name)
+    serve_from_env()
+
+    # The Diagnostics page is reached by URL only
+    import streamlit as st
+    st.markdown(
+        "<style>[data-testid='stSidebarNav'] li:has(a[href$='Diagnostics']) {display: none;}</style>",
+        unsafe_allow_html=True
+    )
+
+
+def finish_page():
+    # Records the page_render span of the run started by track_page (runs that raise are not recorded)
+    page, start = _page.get(), _page_start.get()
+    if page is None or start is None:
+        return
+    metrics.record("page_render", time.perf_counter() - start)
+    _page_start.set(None)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(host="127.0.0.1", port=9108):
+    # Prometheus text endpoint on /metrics in a daemon thread, once per process
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
+
+
+def serve_from_env():
+    port = os.environ.get("WQ_METRICS_PORT")
+    if port:
+        serve(os.environ.get("WQ_METRICS_HOST", "127.0.0.1"), int(port))
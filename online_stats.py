@@ -0,0 +1,188 @@
+import os
+import json
+import bisect
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from config import DATA_DIR
+
+ONLINE_STATS_PATH = os.path.join(DATA_DIR, "online_stats.json")
+
+
+class OnlineStats:
+    """
+    Running sufficient statistics of the per-date index medians, updated one
+    date at a time so the history never has to be rescanned:
+
+    - per index: count, Welford mean and sum of squared deviations,
+    - over dates with all indexes present: mean vector and co-moment matrix
+      (the rows `merged.dropna().corr()` uses on the Charts page),
+    - per year-month ("YYYY-MM") and index: a sorted buffer of values for exact monthly medians.
+
+    Folding in one date costs O(len(indexes) ** 2). States built on disjoint
+    sets of dates can be merged (Chan et al. pairwise update).
+    """
+
+    def __init__(self, indexes):
+        k = len(indexes)
+        self.indexes = list(indexes)
+        self.dates = set()
+        self.n = np.zeros(k, dtype=np.int64)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.pair_n = 0
+        self.pair_mean = np.zeros(k)
+        self.comoment = np.zeros((k, k))
+        self.months = {}
+
+    def update(self, date_str, values):
+        """
+        Folds in the medians of one date.
+        Parameters:
+            values: Sequence aligned with `indexes`, NaN (or None) where an index has no value.
+        Returns:
+            False when the date was already folded in, True otherwise.
+        """
+        date_str = str(date_str)
+        if date_str in self.dates:
+            return False
+        self.dates.add(date_str)
+
+        x = np.array(values, dtype=np.float64)
+        valid = ~np.isnan(x)
+
+        # Welford, per index
+        self.n[valid] += 1
+        delta = x[valid] - self.mean[valid]
+        self.mean[valid] += delta / self.n[valid]
+        self.m2[valid] += delta * (x[valid] - self.mean[valid])
+
+        # Co-moments over complete dates
+        if valid.all():
+            self.pair_n += 1
+            delta = x - self.pair_mean
+            self.pair_mean += delta / self.pair_n
+            self.comoment += np.outer(delta, x - self.pair_mean)
+
+        buffers = self.months.setdefault(date_str[:7], [[] for _ in self.indexes])
+        for i in np.flatnonzero(valid):
+            bisect.insort(buffers[i], float(x[i]))
+        return True
+
+    def update_frame(self, df):
+        # Folds in every row of a wide table (date index, one column per index) not seen yet
+        new = [d for d in df.index if str(d) not in self.dates]
+        values = df.loc[new].reindex(columns=self.indexes).to_numpy(dtype=np.float64, na_value=np.nan)
+        for date_str, row in zip(new, values):
+            self.update(date_str, row)
+        return len(new)
+
+    def merge(self, other):
+        """
+        Merges the state of another OnlineStats over a disjoint set of dates into this one.
+        """
+        if other.indexes != self.indexes:
+            raise ValueError(f"Cannot merge statistics of {other.indexes} into {self.indexes}")
+        if self.dates & other.dates:
+            raise ValueError("Cannot merge statistics with overlapping dates")
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(n > 0, other.n / n, 0.0)
+            self.m2 = self.m2 + other.m2 + delta ** 2 * np.where(n > 0, self.n * other.n / n, 0.0)
+        self.mean = self.mean + delta * weight
+        self.n = n
+
+        pair_n = self.pair_n + other.pair_n
+        if pair_n:
+            delta = other.pair_mean - self.pair_mean
+            self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * self.pair_n * other.pair_n / pair_n
+            self.pair_mean = self.pair_mean + delta * other.pair_n / pair_n
+        self.pair_n = pair_n
+
+        for month, buffers in other.months.items():
+            mine = self.months.setdefault(month, [[] for _ in self.indexes])
+            for i, values in enumerate(buffers):
+                mine[i] = sorted(mine[i] + values)
+        self.dates |= other.dates
+        return self
+
+    @property
+    def variance(self):
+        # Sample variance per index, NaN with fewer than two values
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > 1, self.m2 / (self.n - 1), np.nan)
+
+    def correlation(self):
+        # Pearson correlation matrix over the complete dates, as a DataFrame
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(np.diag(self.comoment))
+            corr = self.comoment / np.outer(std, std) if self.pair_n > 1 else np.full(self.comoment.shape, np.nan)
+        return pd.DataFrame(corr, index=self.indexes, columns=self.indexes)
+
+    def monthly_medians(self):
+        """
+        Exact median of every index per year-month (the same month of different years is kept apart).
+        Returns:
+            A DataFrame indexed by month ("YYYY-MM", chronological) with one column per index.
+        """
+        months = sorted(self.months)
+        values = np.full((len(months), len(self.indexes)), np.nan)
+        for row, month in enumerate(months):
+            for i, buffer in enumerate(self.months[month]):
+                if buffer:
+                    mid = len(buffer) // 2
+                    values[row, i] = buffer[mid] if len(buffer) % 2 else (buffer[mid - 1] + buffer[mid]) / 2
+        return pd.DataFrame(values, index=pd.Index(months, name="month"), columns=self.indexes)
+
+    def to_dict(self):
+        return {
+            "indexes": self.indexes,
+            "dates": sorted(self.dates),
+            "n": self.n.tolist(),
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "pair_n": self.pair_n,
+            "pair_mean": self.pair_mean.tolist(),
+            "comoment": self.comoment.tolist(),
+            "months": self.months,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data["indexes"])
+        state.dates = set(data["dates"])
+        state.n = np.array(data["n"], dtype=np.int64)
+        state.mean = np.array(data["mean"], dtype=np.float64)
+        state.m2 = np.array(data["m2"], dtype=np.float64)
+        state.pair_n = data["pair_n"]
+        state.pair_mean = np.array(data["pair_mean"], dtype=np.float64)
+        state.comoment = np.array(data["comoment"], dtype=np.float64).reshape(len(state.indexes), len(state.indexes))
+        state.months = data["months"]
+        return state
+
+    def save(self, path=ONLINE_STATS_PATH):
+        # Written atomically (one temporary file per process); readers see either the previous or the new state
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+def load_online_stats(path=ONLINE_STATS_PATH, indexes=None):
+    # The persisted state, or None when missing, unreadable or kept for other indexes
+    try:
+        with open(path) as f:
+            state = OnlineStats.from_dict(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if indexes is not None and state.indexes != list(indexes):
+        return None
+    return state
+
+
+def month_name(month):
+    # "2023-07" -> "July", the labels of the monthly trend charts
+    return datetime.strptime(month, "%Y-%m").strftime("%B")
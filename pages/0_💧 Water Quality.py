@@ -1,10 +1,19 @@
 import streamlit as st
 st.set_page_config(layout="wide", page_title="Water Quality | Wisła-WQ 💧🛰️")
 
-from create_map import show_map
-from gee_data import get_s2_imagery
-from stats import get_images_stats
-from water_indexes import indices_description
+import os
+import math
+from functools import partial
+from create_map import get_map_id_cache, show_map, warm_index_layer
+from gee_data import catalog_version, get_s2_imagery
+from snapshot import load_snapshot, snapshot_version
+from raster_cube import open_cube
+from stats import PROGRESSIVE_SCALES, STATS_INDEXES, get_imagery_cache, get_images_stats, progressive_date_stats
+from prefetch import PrefetchScheduler, neighbour_dates
+from metrics import cached, finish_page, track_page
+from water_indexes import INDEXES, indices_description
+
+track_page("Water Quality")
 
 st.markdown("""
 <style>
@@ -26,21 +35,68 @@ li {
 """, unsafe_allow_html=True)
 
 
-# Cache imagery and stats
-@st.cache_data
-def get_imagery_cache():
-    return get_s2_imagery()
-
-
-@st.cache_data
+# Cache stats
+@cached(st.cache_data)
 def get_stats_cache():
     return get_images_stats()
 
 
+# Local raster cube of exported composites (None until exported)
+@cached(st.cache_resource, ttl=600)
+def get_local_cube():
+    return open_cube()
+
+
+# Seconds before the AOI statistics of a date that failed are requested again
+STATS_RETRY = 30
+
+
+# AOI medians of one date, coarse to fine, shared by all sessions; the finer
+# levels only once the date is shown (refine()), not when prefetched
+@cached(st.cache_resource, max_entries=32)
+def get_date_stats(date_str):
+    return progressive_date_stats(get_s2_imagery(), date_str, cube=get_local_cube(), until=PROGRESSIVE_SCALES[0])
+
+
+def warm_date(date_str, index_name, catalog, cube, map_ids, snapshot_dates):
+    # Layer and coarse AOI statistics of a date behind the Previous/Next buttons (see prefetch.py)
+    warm_index_layer(catalog, date_str, index_name, cube=cube, map_ids=map_ids)
+    if date_str not in snapshot_dates:
+        get_date_stats(date_str).retry(STATS_RETRY).wait(timeout=10)
+
+
+def date_stats_panel(date_str, index_name):
+    # Exact median from the statistics snapshot when it has the date; otherwise the finest level so far
+    snapshot = load_snapshot()
+    job = None
+    if snapshot is not None and date_str in snapshot.dates:
+        level, table = PROGRESSIVE_SCALES[-1], snapshot.to_frame(STATS_INDEXES)
+    else:
+        job = get_date_stats(date_str)
+        # The coarse level is quick; wait for it rather than show an empty panel
+        level, table = job.wait(timeout=5)
+        if job.error is not None and st.session_state.get("polling_stats") == date_str:
+            # Failed while this fragment polled: rerun the page once, which stops the polling
+            st.session_state["polling_stats"] = None
+            st.rerun()
+        if table is None:
+            st.caption(f"AOI statistics unavailable: {job.error}" if job.error else "⏳ Computing AOI statistics ...")
+            return
+
+    value = table[index_name].get(date_str, math.nan)
+    col1, col2 = st.columns((1, 1), vertical_alignment="center")
+    units = INDEXES[index_name].units
+    col1.metric(f"AOI median of {index_name}", "–" if math.isnan(value) else f"{value:.2f} {units or ''}".strip())
+    if level == PROGRESSIVE_SCALES[-1]:
+        col2.badge(f"{level} m", color="green")
+    elif job is not None and job.error is not None:
+        col2.badge(f"Approximate · {level} m, refining failed", icon=":material/error:", color="gray")
+    else:
+        col2.badge(f"Approximate · {level} m, refining", icon=":material/hourglass_top:", color="orange")
+
+
 # Load imagery
-temp = get_imagery_cache()
-s2_imagery = temp['layers']
-dates = temp['dates']
+dates = get_imagery_cache(snapshot_version(), catalog_version())['dates']
 
 with st.sidebar.container():
     st.markdown("### 🗓️ Available Image Dates")
@@ -145,9 +201,28 @@ with content_container:
             )
             try:
                 show_map(
-                    s2_imagery[current_date],
+                    get_s2_imagery().image(current_date),
                     current_date,
-                    selected_index
+                    selected_index,
+                    cube=get_local_cube()
                 )
             except Exception as e:
                 st.error(f"Map display error: {e}")
+
+        # Polls for the finer levels until the exact value is in or the job failed (retried after STATS_RETRY)
+        snapshot = load_snapshot()
+        refining = ((snapshot is None or current_date not in snapshot.dates)
+                    and not get_date_stats(current_date).retry(STATS_RETRY).refine().done)
+        st.session_state["polling_stats"] = current_date if refining else None
+        st.fragment(date_stats_panel, run_every=1.0 if refining else None)(current_date, selected_index)
+
+# Warm the layers and statistics behind the Previous/Next buttons while the user looks at this one
+if "prefetcher" not in st.session_state:
+    st.session_state["prefetcher"] = PrefetchScheduler(budget=int(os.environ.get("WQ_PREFETCH_BUDGET", "60")))
+st.session_state["prefetcher"].schedule(
+    [(d, selected_index) for d in neighbour_dates(dates, current_date)],
+    partial(warm_date, catalog=get_s2_imagery(), cube=get_local_cube(), map_ids=get_map_id_cache(),
+            snapshot_dates=set(snapshot.dates) if snapshot is not None else set())
+)
+
+finish_page()
@@ -1,27 +1,22 @@
 import streamlit as st
 st.set_page_config(layout="wide", page_title="Charts | Wisła-WQ 💧🛰️")
 
-import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-from stats import (
-    get_sabi_stats, get_cgi_stats, get_cdom_stats,
-    get_doc_stats, get_cyanobacteria_stats, get_turbidity_stats
-)
+from datetime import date, timedelta
+from lazy_import import LazyModule
+from stats import STATS_INDEXES, get_alerts, get_analytics
+from snapshot import snapshot_version
+from metrics import finish_page, track_page
 
+track_page("Charts")
 
-tab1, tab2, tab3 = st.tabs(["📊 Water Index Medians Over Time", "📈 Monthly Median Trends", "🔗 Correlation Matrix"])
+go = LazyModule("plotly.graph_objects")
 
-# Short and full names
-index_funcs = {
-    'SABI': get_sabi_stats,
-    'CGI': get_cgi_stats,
-    'CDOM': get_cdom_stats,
-    'DOC': get_doc_stats,
-    'Cyanobacteria': get_cyanobacteria_stats,
-    'Turbidity': get_turbidity_stats,
-}
+# All tables and aggregates below are computed once per data version
+version = snapshot_version()
+analytics = get_analytics(version)
+alerts = get_alerts(version)
 
+# Short and full names
 full_names = {
     'SABI': '🦠 Surface Algal Bloom Index',
     'CGI': '🦠 Chlorophyll Green Index',
@@ -31,11 +26,47 @@ full_names = {
     'Turbidity': '💦 Turbidity',
 }
 
+
+def alerts_strip(alerts):
+    # One marker per alert on the date axis, one row per index
+    colors = {"bloom": "#2ca02c", "anomaly": "#ff7f0e"}
+    fig = go.Figure()
+    for kind, group in alerts.groupby("kind"):
+        fig.add_trace(go.Scatter(
+            x=group["date"],
+            y=group["index"],
+            mode="markers",
+            name=kind,
+            marker=dict(size=11, symbol="diamond", color=colors.get(kind)),
+            customdata=group[["value", "median", "z"]],
+            hovertemplate="%{y} on %{x}<br>value %{customdata[0]}, seasonal median %{customdata[1]}, "
+                          "z %{customdata[2]}<extra></extra>"
+        ))
+    fig.update_layout(
+        height=90 + 30 * alerts["index"].nunique(),
+        margin=dict(l=10, r=10, t=10, b=30),
+        legend=dict(orientation="h", y=1.15)
+    )
+    return fig
+
+
+# Alerts strip, above the tabs
+st.markdown("#### 🚨 Bloom and anomaly alerts")
+if alerts.empty:
+    st.caption("No alerts: every date is within its seasonal baseline, or the history is still too short.")
+else:
+    recent = alerts[alerts["date"] >= str(date.today() - timedelta(days=30))]
+    st.caption(f"{len(alerts)} alerts on {alerts['date'].nunique()} dates, {len(recent)} in the last 30 days. "
+               "Dates far above (blooms) or away from (anomalies) the medians of the same weeks in earlier dates.")
+    st.plotly_chart(alerts_strip(alerts), use_container_width=True)
+
+tab1, tab2, tab3 = st.tabs(["📊 Water Index Medians Over Time", "📈 Monthly Median Trends", "🔗 Correlation Matrix"])
+
 with tab1:
-    for index, get_func in index_funcs.items():
+    for index in STATS_INDEXES:
         st.markdown(f"### {full_names[index]}")
         with st.spinner(f"Generating line chart ..."):
-            stats_df = get_func()
+            stats_df = analytics.index_frame(index)
             col1, col2 = st.columns((3, 1))
             with col1:
                 st.line_chart(stats_df)
@@ -49,7 +80,7 @@ def plot_line_with_labels(df, title):
         x=df.index,
         y=df['median'],
         mode='lines+markers+text',
-        text=df['median'].round(2),
+        text=df['median'],
         textposition='top center',
         line=dict(width=2),
         marker=dict(size=7)
@@ -66,29 +97,21 @@ def plot_line_with_labels(df, title):
 with tab2:
     # Trend section
     cols = st.columns(2)
-    for i, (abbr, get_func) in enumerate(index_funcs.items()):
+    for i, abbr in enumerate(STATS_INDEXES):
         with st.spinner(f"Loading {abbr}..."):
-            df = get_func()
-            df.index = pd.to_datetime(df.index)
-            monthly = df.resample("M").median().dropna()
-            monthly.index = monthly.index.strftime("%B")  # Full month names
+            monthly = analytics.monthly_medians(abbr)  # Indexed by full month names
             with cols[i % 2]:
                 st.plotly_chart(plot_line_with_labels(monthly, full_names[abbr]), use_container_width=True)
 
 with tab3:
     # Correlation matrix with Streamlit DataFrame
     with st.spinner("Calculating correlation..."):
-        merged = pd.concat(
-            [get_func().rename(columns={'median': abbr}) for abbr, get_func in index_funcs.items()],
-            axis=1
-        ).dropna()
-
-        corr = merged.corr().round(2)
-        mask = np.triu(np.ones_like(corr, dtype=bool))
-        corr_lower = corr.mask(mask)
+        corr_lower = analytics.correlation()
 
         st.dataframe(
             corr_lower.style
             .background_gradient(cmap='coolwarm', axis=None)
             .format("{:.2f}")
         )
+
+finish_page()
@@ -0,0 +1,76 @@
+import streamlit as st
+st.set_page_config(layout="wide", page_title="Diagnostics | Wisła-WQ 💧🛰️")
+
+import pandas as pd
+from create_map import TILE_CACHE_ENABLED, get_map_id_cache, get_tile_server
+from ee_executor import get_executor
+from metrics import metrics
+
+# Not listed in the sidebar (see metrics.track_page); open /Diagnostics directly
+st.subheader("📊 Diagnostics")
+st.caption("Metrics of this server process since it started, over all sessions; p50/p95 over the last 1024 samples.")
+
+
+def latency_table(histogram_name, label):
+    # One row per value of `label`, merging the series of all other labels (e.g. pages)
+    groups = {}
+    for labels, h in metrics.series(histogram_name):
+        groups.setdefault(labels.get(label), []).append(h)
+    rows = []
+    for value, histograms in groups.items():
+        samples = sorted(v for h in histograms for v in h.recent)
+        rows.append({
+            label: value,
+            "count": sum(h.count for h in histograms),
+            "p50 [ms]": round(samples[len(samples) // 2] * 1000, 1),
+            "p95 [ms]": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000, 1),
+            "total [s]": round(sum(h.sum for h in histograms), 2),
+        })
+    return pd.DataFrame(rows, columns=[label, "count", "p50 [ms]", "p95 [ms]", "total [s]"]).sort_values(
+        "total [s]", ascending=False)
+
+
+# Page renders with the Earth Engine requests they triggered
+pages = latency_table("page_render_seconds", "page")
+pages["EE requests"] = [int(metrics.counter("ee_request_total", page=p)) for p in pages["page"]]
+pages["getInfo"] = [int(metrics.counter("ee_request_total", page=p, kind="getInfo")) for p in pages["page"]]
+st.markdown("#### Pages")
+st.dataframe(pages, hide_index=True)
+
+col1, col2 = st.columns(2)
+with col1:
+    st.markdown("#### Earth Engine requests")
+    st.dataframe(latency_table("ee_request_seconds", "kind"), hide_index=True)
+    executor = get_executor()
+    st.markdown(
+        f"Errors: **{int(metrics.counter('ee_request_errors_total'))}**, "
+        f"quota retries: **{executor.retries}**, deduplicated in flight: **{executor.deduplicated}**"
+    )
+
+with col2:
+    st.markdown("#### Cached functions")
+    rows = []
+    # Series are labelled per page too; merge them per function
+    for name in sorted({labels["function"] for labels, _ in metrics.series("cache_call_seconds")}):
+        calls = int(metrics.counter("cache_call_total", function=name))
+        misses = int(metrics.counter("cache_miss_total", function=name))
+        miss_times = [h for labels, h in metrics.series("cache_miss_seconds") if labels["function"] == name]
+        rows.append({
+            "function": name,
+            "calls": calls,
+            "misses": misses,
+            "hit ratio": round(1 - misses / calls, 3) if calls else None,
+            "p95 miss [ms]": round(max(h.quantile(0.95) for h in miss_times) * 1000, 1) if miss_times else None,
+        })
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+
+    st.markdown("#### Map layers")
+    st.json({"map_ids": get_map_id_cache().stats(),
+             "tiles": get_tile_server().cache.stats() if TILE_CACHE_ENABLED else "disabled",
+             "prefetch (this session)": st.session_state["prefetcher"].stats()
+             if "prefetcher" in st.session_state else "inactive"})
+
+with st.expander("Prometheus text"):
+    text = metrics.prometheus()
+    st.download_button("Download", text, file_name="wq_metrics.txt")
+    st.code(text, language="text")
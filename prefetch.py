@@ -0,0 +1,97 @@
+import threading
+from collections import deque
+
+
+def neighbour_dates(dates, current, radius=1):
+    """
+    Dates reached from `current` with the Next/Previous layer buttons (wrapping around),
+    nearest first, next before previous.
+    """
+    if current not in dates or len(dates) < 2:
+        return []
+    idx = dates.index(current)
+    result = []
+    for step in range(1, radius + 1):
+        for d in (dates[(idx + step) % len(dates)], dates[(idx - step) % len(dates)]):
+            if d != current and d not in result:
+                result.append(d)
+    return result
+
+
+class PrefetchScheduler:
+    """
+    Per-session background warm-up of map layers the user is likely to open next.
+
+    `schedule` replaces the queued work, so tasks queued for a position the
+    user already left are cancelled (a task already running completes). At
+    most `max_queue` tasks are queued and at most `budget` are started over
+    the scheduler's lifetime; layers already warmed are not queued again.
+    Tasks run one at a time on a daemon thread that exits when the queue is empty.
+    """
+
+    def __init__(self, max_queue=4, budget=60):
+        self.max_queue = max_queue
+        self.budget = budget
+        self._queue = deque()
+        self._warmed = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def schedule(self, keys, warm):
+        """
+        Queues `warm(*key)` for every key not warmed yet, replacing the queued work.
+        Parameters:
+            keys: (date, index) pairs, most likely first.
+            warm: Callable that makes the layer of a key cheap to show.
+        """
+        with self._lock:
+            self.cancelled += len(self._queue)
+            self._queue.clear()
+            for key in keys:
+                if len(self._queue) >= min(self.max_queue, self.budget - self.started):
+                    break
+                if key not in self._warmed:
+                    self._queue.append((key, warm))
+            if self._queue and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="layer-prefetch", daemon=True)
+                self._thread.start()
+        return len(self._queue)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled += len(self._queue)
+            self._queue.clear()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._queue or self.started >= self.budget:
+                    self._thread = None
+                    return
+                key, warm = self._queue.popleft()
+                self._warmed.add(key)
+                self.started += 1
+            try:
+                warm(*key)
+                with self._lock:
+                    self.completed += 1
+            except Exception:
+                # Prefetching is best effort; the page will request the layer itself
+                with self._lock:
+                    self.failed += 1
+                    self._warmed.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "started": self.started,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "budget_left": self.budget - self.started,
+            }
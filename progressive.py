@@ -0,0 +1,104 @@
+import time
+import threading
+import contextvars
+
+
+class Progressive:
+    """
+    A result refined level by level: `compute(level)` runs for each of
+    `levels` in order (coarsest first) on a daemon thread, and `current()`
+    returns the finest result finished so far without waiting, so a page can
+    show the coarse result at once and swap in the finer ones as they come.
+    A failing level stops the refinement; earlier results stay available.
+    With `until`, the refinement stops after that level (e.g. a prefetched
+    quick look) and goes on to the last one when `refine()` is called.
+    `retry()` starts a failed refinement again from the level that failed.
+    """
+
+    def __init__(self, compute, levels, until=None):
+        self.levels = list(levels)
+        self.error = None
+        # Seconds from the start to each finished level
+        self.timings = {}
+        self._compute = compute
+        self._results = {}
+        self._until = len(self.levels) if until is None else self.levels.index(until) + 1
+        self._failed = None
+        self._cond = threading.Condition()
+        self._start = time.perf_counter()
+        # Runs in the creator's context, so its metrics carry the page label
+        self._context = contextvars.copy_context()
+        self._thread = None
+        self._spawn()
+
+    def _spawn(self):
+        self._thread = threading.Thread(target=self._context.copy().run, args=(self._run,), name="progressive",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self.error is not None or len(self._results) >= self._until:
+                    self._thread = None
+                    return
+                level = self.levels[len(self._results)]
+            try:
+                result = self._compute(level)
+            except Exception as e:
+                with self._cond:
+                    self.error = e
+                    self._failed = time.perf_counter()
+                    self._cond.notify_all()
+                continue
+            with self._cond:
+                self._results[level] = result
+                self.timings[level] = time.perf_counter() - self._start
+                self._cond.notify_all()
+
+    def refine(self):
+        # Goes on to the last level after stopping at `until`; returns self
+        with self._cond:
+            self._until = len(self.levels)
+            if self._thread is None and not self.done:
+                self._spawn()
+        return self
+
+    def retry(self, after=0.0):
+        # Starts a failed refinement again once `after` seconds passed since the failure; returns self
+        with self._cond:
+            if self.error is not None and self._thread is None and time.perf_counter() - self._failed >= after:
+                self.error = None
+                self._spawn()
+        return self
+
+    def current(self):
+        # (level, result) of the finest finished level, or (None, None) before the first
+        with self._cond:
+            for level in reversed(self.levels):
+                if level in self._results:
+                    return level, self._results[level]
+        return None, None
+
+    @property
+    def final(self):
+        # The last level is finished
+        with self._cond:
+            return self.levels[-1] in self._results
+
+    @property
+    def done(self):
+        # Nothing more will come: finished or failed
+        with self._cond:
+            return self.error is not None or len(self._results) == len(self.levels)
+
+    def wait(self, level=None, timeout=None):
+        """
+        Waits until `level` (default: the first) is finished, the refinement failed or `timeout` passed.
+        Returns:
+            current()
+        """
+        target = self.levels[0] if level is None else level
+        with self._cond:
+            self._cond.wait_for(lambda: target in self._results or self.error is not None, timeout)
+        return self.current()
@@ -0,0 +1,196 @@
+import os
+import json
+import threading
+import warnings
+import numpy as np
+from quantile_sketch import quantiles_npy
+from config import DATA_DIR
+
+# Default on-disk location of the local composite cube
+CUBE_DIR = os.path.join(DATA_DIR, "cube")
+
+# Overview (pyramid) levels written with every date, as block sizes over the 10 m grid: 20 m and 60 m
+OVERVIEWS = (2, 6)
+
+
+def block_mean(arr, factor):
+    """
+    Downsamples the last two axes by `factor`: the mean of the valid pixels of
+    every factor x factor block, NaN where a block has none. Edge blocks
+    extend past the array and average the pixels they cover.
+    """
+    if factor == 1:
+        return arr
+    *lead, h, w = arr.shape
+    padded = np.full((*lead, -(-h // factor) * factor, -(-w // factor) * factor), np.nan, dtype=np.float32)
+    padded[..., :h, :w] = arr
+    blocks = padded.reshape(*lead, padded.shape[-2] // factor, factor, padded.shape[-1] // factor, factor)
+    with warnings.catch_warnings():
+        # Blocks without valid pixels stay NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmean(blocks, axis=(-3, -1))
+
+
+class RasterCube:
+    """
+    Local date x index x y x x cube of daily index composites.
+
+    Data lives in .npy chunk files of `chunk_dates` dates each, opened as
+    memory maps. New dates are written into the free slots of the last chunk
+    or into a new chunk, so full chunks are never rewritten. `meta.json` is
+    replaced atomically after the data is flushed, so readers only ever see
+    complete dates.
+
+    Every date is also written at the coarser `overviews` levels (block means,
+    in chunk files of their own), so quick looks read far fewer pixels.
+    """
+
+    def __init__(self, root=CUBE_DIR):
+        self.root = root
+        self._chunks = {}
+        self._lock = threading.Lock()
+        with open(os.path.join(root, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._slots = {d: i for i, d in enumerate(self.meta["dates"])}
+
+    @classmethod
+    def create(cls, root, indexes, shape, chunk_dates=16, dtype="float32", overviews=OVERVIEWS, **attrs):
+        """
+        Creates an empty cube.
+        Parameters:
+            indexes: Index band names stored for each date.
+            shape: (height, width) of every composite.
+            chunk_dates: Number of dates per chunk file.
+            overviews: Downsampling factors of the overview levels.
+            attrs: Extra metadata such as "transform", "crs" or "bounds" (lat/lon).
+        """
+        os.makedirs(root, exist_ok=True)
+        meta = {
+            "indexes": list(indexes),
+            "shape": list(shape),
+            "dtype": dtype,
+            "chunk_dates": chunk_dates,
+            "overviews": list(overviews),
+            "dates": [],
+            **attrs,
+        }
+        _write_json(os.path.join(root, "meta.json"), meta)
+        return cls(root)
+
+    @property
+    def dates(self):
+        return list(self.meta["dates"])
+
+    @property
+    def indexes(self):
+        return list(self.meta["indexes"])
+
+    def __contains__(self, date_str):
+        return date_str in self._slots
+
+    @property
+    def overviews(self):
+        # Cubes created before overviews existed have none
+        return list(self.meta.get("overviews", []))
+
+    def _chunk_path(self, chunk, factor=1):
+        prefix = "chunk" if factor == 1 else f"overview{factor}-chunk"
+        return os.path.join(self.root, f"{prefix}-{chunk:05d}.npy")
+
+    def _chunk(self, chunk, mode="r", factor=1):
+        key = (chunk, mode, factor)
+        with self._lock:
+            if key not in self._chunks:
+                self._chunks[key] = np.load(self._chunk_path(chunk, factor), mmap_mode=mode)
+            return self._chunks[key]
+
+    def _write_slot(self, chunk, slot, data, factor=1):
+        if slot == 0:
+            shape = (self.meta["chunk_dates"], *data.shape)
+            arr = np.lib.format.open_memmap(self._chunk_path(chunk, factor), mode="w+",
+                                            dtype=self.meta["dtype"], shape=shape)
+            arr[...] = np.nan
+        else:
+            arr = self._chunk(chunk, "r+", factor)
+        arr[slot] = data
+        arr.flush()
+
+    def append(self, date_str, data):
+        """
+        Appends the composite of a date newer than all stored ones.
+        Parameters:
+            data: Array of shape (len(indexes), height, width) or dict of 2-D arrays keyed by index.
+        """
+        if self.meta["dates"] and date_str <= self.meta["dates"][-1]:
+            raise ValueError(f"Dates must be appended in order: {date_str} <= {self.meta['dates'][-1]}")
+        if isinstance(data, dict):
+            data = np.stack([data[name] for name in self.meta["indexes"]])
+
+        n_dates = len(self.meta["dates"])
+        chunk, slot = divmod(n_dates, self.meta["chunk_dates"])
+        data = np.asarray(data, dtype=self.meta["dtype"])
+        self._write_slot(chunk, slot, data)
+        for factor in self.overviews:
+            self._write_slot(chunk, slot, block_mean(data, factor), factor)
+
+        meta = dict(self.meta, dates=self.meta["dates"] + [date_str])
+        _write_json(os.path.join(self.root, "meta.json"), meta)
+        self.meta = meta
+        self._slots[date_str] = n_dates
+
+    def read(self, date_str, index_name=None, factor=1):
+        """
+        Returns a read-only memory-mapped view (no copy) of one date, or of one (date, index) slice.
+        With `factor` > 1, the overview downsampled by that factor (computed on
+        the fly when the cube has no such overview level).
+        """
+        chunk, slot = divmod(self._slots[date_str], self.meta["chunk_dates"])
+        stored = factor if factor == 1 or factor in self.overviews else 1
+        arr = self._chunk(chunk, factor=stored)[slot]
+        if index_name is not None:
+            arr = arr[self.meta["indexes"].index(index_name)]
+        return arr if stored == factor else block_mean(arr, factor)
+
+    def slice_location(self, date_str, index_name):
+        # (.npy path, key) of a (date, index) slice, for readers in other processes
+        chunk, slot = divmod(self._slots[date_str], self.meta["chunk_dates"])
+        return self._chunk_path(chunk), (slot, self.meta["indexes"].index(index_name))
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def open_cube(root=CUBE_DIR):
+    # The local cube, or None when it has not been exported yet
+    if not os.path.exists(os.path.join(root, "meta.json")):
+        return None
+    return RasterCube(root)
+
+
+def cube_medians(cube, indexes, dates=None, exact_limit=4_000_000, k=200, workers=None, factor=1):
+    """
+    AOI medians per date from the local cube, at full resolution or from the
+    overview downsampled by `factor`.
+    Slices up to `exact_limit` pixels are reduced exactly; larger ones are
+    streamed window by window through a mergeable KLL sketch (see
+    quantile_sketch.KLLSketch for the error bound), split over `workers` processes.
+    Returns:
+        A dict {date: {index: median}}.
+    """
+    result = {}
+    for date_str in (dates if dates is not None else cube.dates):
+        values = {}
+        for name in indexes:
+            arr = cube.read(date_str, name, factor)
+            if arr.size > exact_limit and factor == 1:
+                path, key = cube.slice_location(date_str, name)
+                median = quantiles_npy(path, [0.5], key=key, k=k, workers=workers)[0]
+            else:
+                median = np.nanmedian(arr) if np.isfinite(arr).any() else np.nan
+            values[name] = None if np.isnan(median) else float(median)
+        result[date_str] = values
+    return result
@@ -0,0 +1,399 @@
+"""
+Result cache shared by all app processes (Streamlit replicas, batch runs),
+in front of the Earth Engine work of `stats.py` and `gee_data.py`.
+
+Functions decorated with `@shared()` are keyed by their content: the
+function's name and bytecode and its bound arguments, Earth Engine objects
+by their serialized graph. A missing entry is computed by one process only;
+the others wait for its result (single flight). Entries expire after their
+TTL and the least recently used ones are evicted beyond a size budget.
+
+The backend is chosen with WQ_SHARED_CACHE:
+    sqlite (default)        SQLite file in the data directory, for replicas on one host
+    sqlite:///path/to.db    SQLite file elsewhere (a local disk, not a network share)
+    redis://host:6379/0     Redis (needs the `redis` package); eviction by Redis' maxmemory policy
+    off                     no shared cache
+"""
+import os
+import time
+import uuid
+import json
+import pickle
+import sqlite3
+import hashlib
+import inspect
+import threading
+from functools import wraps
+from config import DATA_DIR
+from metrics import metrics
+
+SHARED_CACHE_URL = os.environ.get("WQ_SHARED_CACHE", "sqlite")
+SHARED_CACHE_PATH = os.path.join(DATA_DIR, "shared_cache.sqlite")
+# Default entry lifetime (s) and size budget of the SQLite backend
+SHARED_CACHE_TTL = float(os.environ.get("WQ_SHARED_CACHE_TTL", "86400"))
+SHARED_CACHE_MAX_BYTES = int(float(os.environ.get("WQ_SHARED_CACHE_MAX_MB", "256")) * 2 ** 20)
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """
+    Storage of a SharedCache: opaque byte values under string keys, plus
+    leased locks. A store shared over the network (e.g. Redis) implements
+    these five methods; see RedisBackend.
+    """
+
+    def get(self, key):
+        # The value, or None when missing or expired
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def acquire(self, key, ttl):
+        # A token when the lock was free (held until released or `ttl` seconds passed), else None
+        raise NotImplementedError
+
+    def release(self, key, token):
+        # Frees the lock if `token` still holds it
+        raise NotImplementedError
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite file shared by the processes of one host (WAL mode, so readers do
+    not block the writer). Reads take no write lock: expired entries are
+    dropped by the next write, and the read times that order the eviction
+    are kept in memory and written with this process's next `set` (best
+    effort across processes). Beyond `max_bytes` the least recently read
+    entries are evicted first.
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH, max_bytes=SHARED_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._local = threading.local()
+        # {key: last read time} not written yet
+        self._touched = {}
+        self._touched_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT NOT NULL, expires REAL)")
+
+    def _conn(self):
+        # One connection per thread; sqlite3 connections are not shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = _Transaction(conn)
+        return self._local.conn
+
+    def get(self, key):
+        now = time.time()
+        # A single statement outside a transaction: a deferred read, no write lock
+        row = self._conn().conn.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        with self._touched_lock:
+            self._touched[key] = now
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._touched_lock:
+            touched, self._touched = self._touched, {}
+        with self._conn() as conn:
+            conn.executemany("UPDATE entries SET accessed = MAX(accessed, ?) WHERE key = ?",
+                             [(at, k) for k, at in touched.items()])
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl if ttl else None, now)
+            )
+            conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute("SELECT key, size FROM entries WHERE key != ? ORDER BY accessed", (key,))
+                for old_key, size in rows.fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                    total -= size
+                    self.evictions += 1
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def acquire(self, key, ttl):
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires <= ?", (key, now))
+            inserted = conn.execute("INSERT OR IGNORE INTO locks VALUES (?, ?, ?)", (key, token, now + ttl)).rowcount
+        return token if inserted else None
+
+    def release(self, key, token):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+    def stats(self):
+        now = time.time()
+        entries, size = self._conn().conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE expires IS NULL OR expires > ?", (now,)
+        ).fetchone()
+        return {"entries": entries, "bytes": size, "evictions": self.evictions}
+
+
+class _Transaction:
+    # `with` block as one immediate (write-locking) transaction, so check-then-write steps are atomic;
+    # single reads go to `.conn` directly
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class RedisBackend(CacheBackend):
+    # Redis (or a compatible store): TTLs by EXPIRE, locks by SET NX PX, eviction by the server's maxmemory policy
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, client, prefix="wq:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def acquire(self, key, ttl):
+        token = uuid.uuid4().hex
+        return token if self.client.set(f"{self.prefix}lock:{key}", token, nx=True, px=int(ttl * 1000)) else None
+
+    def release(self, key, token):
+        self.client.eval(self._RELEASE, 1, f"{self.prefix}lock:{key}", token)
+
+
+class SharedCache:
+    """
+    Pickled results in a CacheBackend with single-flight computation.
+
+    Backend failures never fail the caller: the result is then computed
+    locally (and counted in `errors`).
+    Parameters:
+        lock_ttl: Lease of the computing process's lock; waiters take over a
+            key whose lock expired (its holder died) and give up waiting after it.
+    """
+
+    def __init__(self, backend, ttl=SHARED_CACHE_TTL, lock_ttl=600, poll=0.05):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.poll = poll
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.errors = 0
+
+    def _backend(self, method, *args):
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception:
+            self.errors += 1
+            return _MISSING
+
+    def get(self, key, default=None):
+        data = self._backend("get", key)
+        if data is None or data is _MISSING:
+            return default
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # Written by another version of the code
+            self.errors += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            self.errors += 1
+            return
+        self._backend("set", key, data, self.ttl if ttl is None else ttl)
+
+    def get_or_compute(self, key, compute, ttl=None, name=None):
+        """
+        The value of `key`, computed with `compute()` by exactly one of the
+        callers (in any process) that miss it at the same time.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("hit", name)
+            return value
+
+        delay, waited = self.poll, False
+        deadline = time.monotonic() + self.lock_ttl
+        while True:
+            token = self._backend("acquire", key, self.lock_ttl)
+            if token is _MISSING:
+                # No backend: compute locally
+                self._count("miss", name)
+                return compute()
+            if token is not None:
+                try:
+                    # Another process may have stored it between the read and the lock
+                    value = self.get(key, _MISSING)
+                    if value is _MISSING:
+                        self._count("miss", name)
+                        value = compute()
+                        self.set(key, value, ttl)
+                    else:
+                        self._count("wait" if waited else "hit", name)
+                    return value
+                finally:
+                    self._backend("release", key, token)
+
+            # Another process computes it: wait for its result
+            waited = True
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                self._count("wait", name)
+                return value
+            if time.monotonic() > deadline:
+                self._count("miss", name)
+                return compute()
+
+    def _count(self, result, name):
+        if result == "hit":
+            self.hits += 1
+        elif result == "miss":
+            self.misses += 1
+        else:
+            self.waits += 1
+        metrics.inc("shared_cache_total", result=result, function=name)
+
+
+def _code_digest(code):
+    # Bytecode and constants of a function and its nested functions; changes when the function's code does
+    h = hashlib.sha256(code.co_code)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            const = _code_digest(const)
+        elif isinstance(const, frozenset):
+            # Set order varies between processes (string hash randomization)
+            const = sorted(map(repr, const))
+        h.update(repr(const).encode())
+    return h.hexdigest()
+
+
+def _key_part(value):
+    # JSON-able form of an argument; TypeError for values without a stable content
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_key_part(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _key_part(v) for k, v in sorted(value.items())}
+    if hasattr(value, "serialize"):
+        # Earth Engine objects: the computation graph
+        return {"ee": value.serialize()}
+    raise TypeError(f"No content key for {type(value).__name__}")
+
+
+def content_key(name, digest, arguments):
+    payload = json.dumps([name, digest, _key_part(dict(arguments))], sort_keys=True)
+    return f"{name}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+def open_shared_cache(url=SHARED_CACHE_URL):
+    # SharedCache of a WQ_SHARED_CACHE url, or None for "off"
+    if url in ("", "off", "0"):
+        return None
+    if url == "sqlite":
+        return SharedCache(SQLiteBackend())
+    if url.startswith("sqlite:///"):
+        return SharedCache(SQLiteBackend(url[len("sqlite:///"):]))
+    if url.startswith(("redis://", "rediss://")):
+        return SharedCache(RedisBackend.from_url(url))
+    raise ValueError(f"Unknown WQ_SHARED_CACHE {url!r}")
+
+
+_shared_cache = _MISSING
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    # The process's shared cache, opened on first use (None when disabled)
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is _MISSING:
+            _shared_cache = open_shared_cache()
+        return _shared_cache
+
+
+def set_shared_cache(cache):
+    # Replaces the process's shared cache (e.g. another backend); None disables it
+    global _shared_cache
+    with _shared_cache_lock:
+        _shared_cache = cache
+
+
+def shared(ttl=None, name=None):
+    """
+    Caches the results of the decorated function in the shared cache, keyed
+    by content (see module docstring). Calls whose arguments have no stable
+    content (e.g. open files) are not cached. `fn.uncached` is the plain function.
+    Parameters:
+        ttl: Lifetime of the entries in seconds (default: WQ_SHARED_CACHE_TTL).
+    """
+    def decorate(fn):
+        fn_name = name or f"{fn.__module__}.{fn.__qualname__}"
+        digest = _code_digest(fn.__code__)
+        signature = inspect.signature(fn)
+
+        @wraps(fn)
+        def call(*args, **kwargs):
+            cache = get_shared_cache()
+            if cache is None:
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            try:
+                key = content_key(fn_name, digest, bound.arguments)
+            except TypeError:
+                return fn(*args, **kwargs)
+            return cache.get_or_compute(key, lambda: fn(*args, **kwargs), ttl, fn_name)
+
+        call.uncached = fn
+        return call
+
+    return decorate
@@ -0,0 +1,114 @@
+"""
+Versioned binary snapshot of the date catalog and the per-date/per-index
+statistics table, written by the refresh job and memory-mapped at startup.
+
+Layout:
+    8 bytes   magic b"WQSNAP\\0\\0"
+    4 bytes   format version (little-endian uint32)
+    4 bytes   header length (little-endian uint32)
+    header    UTF-8 JSON: dates, indexes, catalog, created, data_offset
+    padding   up to a 64-byte boundary
+    data      float64 matrix of shape (len(dates), len(indexes)), C order, NaN = no value
+
+Run `python -m snapshot` to refresh the statistics and rewrite the snapshot.
+"""
+import os
+import json
+import struct
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from config import DATA_DIR
+
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "snapshot.wqs")
+
+MAGIC = b"WQSNAP\0\0"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 64
+
+
+class Snapshot:
+    def __init__(self, path, header, values):
+        self.path = path
+        self.dates = header["dates"]
+        self.indexes = header["indexes"]
+        self.catalog = header.get("catalog", {})
+        self.created = header["created"]
+        self.values = values
+
+    def to_frame(self, indexes=None):
+        # Wide table in the layout of stats.stats_all_indexes
+        df = pd.DataFrame(np.asarray(self.values, dtype=np.float64), index=self.dates, columns=self.indexes).round(2)
+        df.index.name = "date"
+        if indexes is not None:
+            df = df.reindex(columns=list(indexes))
+        return df
+
+
+def write_snapshot(df, catalog=None, path=SNAPSHOT_PATH):
+    """
+    Writes the wide statistics table (date index, one column per index) atomically.
+    Parameters:
+        catalog: Extra JSON-serializable catalog metadata (start date, indexes, ...).
+    """
+    values = np.ascontiguousarray(df.to_numpy(dtype=np.float64, na_value=np.nan))
+    header = {
+        "dates": [str(d) for d in df.index],
+        "indexes": [str(c) for c in df.columns],
+        "catalog": catalog or {},
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+    # data_offset depends on the header length, which depends on data_offset
+    header["data_offset"] = 0
+    while True:
+        header_bytes = json.dumps(header).encode()
+        offset = -(-(_PREFIX.size + len(header_bytes)) // _ALIGN) * _ALIGN
+        if offset == header["data_offset"]:
+            break
+        header["data_offset"] = offset
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # One temporary file per process, as every replica refreshes the snapshot
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (offset - _PREFIX.size - len(header_bytes)))
+        f.write(values.tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    # The snapshot memory-mapped, or None when missing or written by another format version
+    try:
+        with open(path, "rb") as f:
+            magic, version, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            header = json.loads(f.read(header_len))
+    except (FileNotFoundError, struct.error, ValueError):
+        return None
+
+    shape = (len(header["dates"]), len(header["indexes"]))
+    if 0 in shape:
+        values = np.empty(shape, dtype=np.float64)
+    else:
+        values = np.memmap(path, dtype=np.float64, mode="r", offset=header["data_offset"], shape=shape)
+    return Snapshot(path, header, values)
+
+
+def snapshot_version(path=SNAPSHOT_PATH):
+    # Changes whenever the snapshot is rewritten; used as a cache key by the pages
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == "__main__":
+    from stats import refresh_snapshot
+
+    refreshed = refresh_snapshot()
+    print(f"Snapshot written to {SNAPSHOT_PATH}: {len(refreshed)} dates")
@@ -1,22 +1,35 @@
-import streamlit as st
+import os
 import ee
-from gee_data import aoi
 import pandas as pd
-from gee_data import get_s2_imagery
+from datetime import date, timedelta
+import threading
+import time
+from gee_data import START_DATE, WQ_INDEXES, ImageryCatalog, get_aoi, get_catalog_service
+from timeseries_store import TimeSeriesStore
+from raster_cube import cube_medians, open_cube
+from ee_executor import get_executor, get_info
+from snapshot import load_snapshot, snapshot_version, write_snapshot
+from analytics import analytics_frame
+from online_stats import OnlineStats, load_online_stats
+from alerts import SeasonalBaseline, default_sinks, load_alerts, load_baseline
+from metrics import cached
+from shared_cache import shared
+from progressive import Progressive
 
+STATS_INDEXES = ['SABI', 'CGI', 'CDOM', 'DOC', 'Cyanobacteria', 'Turbidity']
 
-@st.cache_data
-def get_imagery_cache():
-    return get_s2_imagery()
+# Reduction scales (m) of the progressive quick look, coarsest first; the last is the exact one
+PROGRESSIVE_SCALES = (60, 20, 10)
 
 
-def stats_imagery(ic, index_name):
+@shared()
+def stats_imagery(ic, index_name, scale=10):
     # Apply median value to each image and tag it with its acquisition date
     def set_median(img):
         median = img.select(index_name).reduceRegion(
             reducer=ee.Reducer.median(),
-            geometry=aoi,
-            scale=10,
+            geometry=get_aoi(),
+            scale=scale,
             bestEffort=True
         ).get(index_name)
         return img.set('date', img.date().format('YYYY-MM-dd')).set(index_name, median)
@@ -24,10 +37,10 @@ def stats_imagery(ic, index_name):
     with_values = ic.map(set_median)
 
     # Extract data (date + index median)
-    data = with_values.reduceColumns(
+    data = get_info(with_values.reduceColumns(
         reducer=ee.Reducer.toList(2),
         selectors=['date', index_name]
-    ).getInfo()
+    ))
 
     if not data or 'list' not in data or not data['list']:
         return pd.DataFrame(columns=["median"])
@@ -38,161 +51,269 @@ def stats_imagery(ic, index_name):
     return df
 
 
-ic_s2 = get_imagery_cache()["collection"]
+@shared()
+def stats_all_indexes(ic, indexes, scale=10):
+    """
+    Computes AOI medians of several index bands in a single Earth Engine round trip.
+    Parameters:
+        ic: ImageCollection with one image per date containing the index bands.
+        indexes: List of index band names (e.g., ['SABI', 'CGI']).
+        scale: Reduction scale in meters; coarser scales are faster and approximate.
+    Returns:
+        A wide DataFrame indexed by date with one column per index.
+    """
+    indexes = list(indexes)
+
+    # One multi-band reduceRegion per image instead of one pass per index
+    def set_medians(img):
+        medians = img.select(indexes).reduceRegion(
+            reducer=ee.Reducer.median(),
+            geometry=get_aoi(),
+            scale=scale,
+            bestEffort=True
+        )
+        return img.set('date', img.date().format('YYYY-MM-dd')).setMulti(medians)
+
+    with_values = ic.map(set_medians)
+
+    data = get_info(with_values.reduceColumns(
+        reducer=ee.Reducer.toList(len(indexes) + 1),
+        selectors=['date'] + indexes
+    ))
+
+    if not data or 'list' not in data or not data['list']:
+        return pd.DataFrame(columns=indexes)
+
+    df = pd.DataFrame(data['list'], columns=['date'] + indexes)
+    df[indexes] = df[indexes].apply(pd.to_numeric, errors='coerce').round(2)
+    df.set_index("date", inplace=True)
+    return df
+
+
+def stats_from_cube(cube, indexes, dates=None, scale=10):
+    # Same table as stats_all_indexes, reduced from the local raster cube (coarser scales from its overviews)
+    indexes = list(indexes)
+    medians = cube_medians(cube, indexes, dates, factor=scale // 10)
+    df = pd.DataFrame.from_dict(medians, orient="index", columns=indexes).round(2)
+    df.index.name = "date"
+    return df
+
+
+def progressive_date_stats(catalog, date_str, indexes=STATS_INDEXES, cube=None, scales=PROGRESSIVE_SCALES, until=None):
+    """
+    AOI medians of one date computed coarse to fine in the background (one
+    round trip per scale, or the local cube's overviews when it has the date).
+    Parameters:
+        until: Scale to stop at until the job's refine() is called (e.g. when prefetched).
+    Returns:
+        A Progressive whose results are one-row wide tables like stats_all_indexes.
+    """
+    if cube is not None and date_str in cube:
+        return Progressive(lambda scale: stats_from_cube(cube, indexes, [date_str], scale), scales, until)
+    ic = catalog.collection_for([date_str])
+    return Progressive(lambda scale: stats_all_indexes(ic, indexes, scale), scales, until)
+
+
+def index_stats(all_stats, index_name):
+    # Single-index view in the legacy one-column "median" layout
+    return all_stats[[index_name]].rename(columns={index_name: "median"})
+
+
+def refresh_stats_store(store=None, indexes=STATS_INDEXES, batch_size=20, cube=None):
+    """
+    Computes statistics only for acquisition dates newer than the latest stored one.
+    Dates present in the local raster cube are reduced locally; the others
+    in batches of `batch_size`, evaluated concurrently on Earth Engine.
+    Returns:
+        Number of (date, index) rows appended to the store.
+    """
+    store = store or TimeSeriesStore()
+    latest = store.latest_date()
+    if latest is None:
+        start_date = START_DATE
+    else:
+        start_date = str(date.fromisoformat(latest) + timedelta(days=1))
+
+    if start_date >= str(date.today()):
+        return 0
+
+    catalog = ImageryCatalog(indexes, start_date=start_date)
+    if not catalog.dates:
+        return 0
+
+    cube = cube or open_cube()
+    local_dates = [d for d in catalog.dates if cube is not None and d in cube]
+    remote_dates = [d for d in catalog.dates if d not in local_dates]
+
+    batches = [remote_dates[i:i + batch_size] for i in range(0, len(remote_dates), batch_size)]
+    frames = get_executor().map(
+        lambda batch: stats_all_indexes(catalog.collection_for(batch), indexes), batches
+    )
+    if local_dates:
+        frames.append(stats_from_cube(cube, indexes, local_dates))
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return 0
+    return store.append(pd.concat(frames).sort_index())
+
+
+def refresh_snapshot(store=None):
+    """
+    Refresh job: appends new dates to the store, folds them into the online
+    statistics and rewrites the startup snapshot.
+    Returns:
+        The refreshed wide statistics table.
+    """
+    store = store or TimeSeriesStore()
+    refresh_stats_store(store)
+    return publish_snapshot(store)
+
+
+def publish_snapshot(store=None):
+    """
+    Folds the stored statistics into the online statistics, scores the new
+    dates for bloom/anomaly alerts and rewrites the startup snapshot the
+    pages read (also used by the batch pipeline).
+    Returns:
+        The wide statistics table.
+    """
+    store = store or TimeSeriesStore()
+    df = store.to_wide(STATS_INDEXES)
+    online = load_online_stats(indexes=STATS_INDEXES) or OnlineStats(STATS_INDEXES)
+    if online.update_frame(df):
+        online.save()
+    baseline = load_baseline(indexes=STATS_INDEXES) or SeasonalBaseline(STATS_INDEXES)
+    seen = len(baseline.dates)
+    alerts = baseline.update_frame(df)
+    if len(baseline.dates) > seen:
+        for sink in default_sinks():
+            sink.emit(alerts)
+        baseline.save()
+    write_snapshot(df, {"start_date": START_DATE, "indexes": WQ_INDEXES})
+    return df
+
+
+# WQ_APP_REFRESH=0 when a scheduled batch run publishes the statistics: the app then only reads them
+APP_REFRESH = os.environ.get("WQ_APP_REFRESH", "1") != "0"
+# Seconds between the in-app reconciliations of the snapshot with Earth Engine
+REFRESH_INTERVAL = float(os.environ.get("WQ_REFRESH_INTERVAL", "21600"))
+
+_refresh_thread = None
+_refresh_scheduled = False
+_refresh_lock = threading.Lock()
+
+
+def _start_refresh():
+    # A new run unless the previous one is still going; the caller holds _refresh_lock
+    global _refresh_thread
+    if _refresh_thread is None or not _refresh_thread.is_alive():
+        # Without in-app refresh the thread has nothing to do, so callers can still join it
+        target = refresh_snapshot if APP_REFRESH else (lambda: None)
+        _refresh_thread = threading.Thread(target=target, name="snapshot-refresh", daemon=True)
+        _refresh_thread.start()
+    return _refresh_thread
+
+
+def _refresh_schedule(interval):
+    while True:
+        time.sleep(interval)
+        with _refresh_lock:
+            _start_refresh()
+
+
+def start_background_refresh(interval=REFRESH_INTERVAL):
+    """
+    Reconciles the snapshot with Earth Engine off the script thread: at once,
+    then every `interval` seconds for the life of the process (a run still
+    going when the next is due is not doubled; a failed run is retried then).
+    Returns:
+        The thread of the latest run.
+    """
+    global _refresh_scheduled
+    with _refresh_lock:
+        if not _refresh_scheduled:
+            _refresh_scheduled = True
+            _start_refresh()
+            if APP_REFRESH:
+                threading.Thread(target=_refresh_schedule, args=(interval,), name="snapshot-refresh-schedule",
+                                 daemon=True).start()
+        return _refresh_thread
+
+
+@cached("cache_data")
+def get_all_stats(version=None):
+    """
+    Wide statistics table, served from the startup snapshot when there is one.
+    Parameters:
+        version: snapshot_version(), so a rewritten snapshot invalidates the cache.
+    """
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        start_background_refresh()
+        return snapshot.to_frame(STATS_INDEXES)
+    return refresh_snapshot()
+
+
+@cached("cache_data")
+def get_imagery_cache(version=None, catalog=None):
+    """
+    Imagery catalog descriptor of the pages (dates, ...), from the revalidated
+    catalog (see gee_data.CatalogService). On a cold start without any
+    catalog yet, the startup snapshot answers without touching Earth Engine
+    while the catalog is built in the background.
+    Parameters:
+        version, catalog: snapshot_version() and catalog_version(), so either one swapped in refreshes it.
+    """
+    service = get_catalog_service()
+    if service.version is None:
+        snapshot = load_snapshot()
+        if snapshot is not None:
+            service.start()
+            start_background_refresh()
+            return {**snapshot.catalog, "dates": snapshot.dates}
+    return service.get().descriptor()
+
+
+@cached("cache_resource", max_entries=2)
+def get_analytics(version=None):
+    """
+    AnalyticsFrame of the statistics table: one float32 frame per data version
+    with memoized monthly medians, correlation and summaries, shared by all sessions.
+    """
+    return analytics_frame(get_all_stats(version), load_online_stats(indexes=STATS_INDEXES))
+
+
+@cached("cache_data")
+def get_alerts(version=None):
+    # Alert log, re-read whenever the snapshot (written after new alerts) changes
+    return load_alerts()
 
 
-@st.cache_data
 def get_sabi_stats():
-    return stats_imagery(ic_s2, 'SABI')
+    return index_stats(get_all_stats(snapshot_version()), 'SABI')
 
 
-@st.cache_data
 def get_cgi_stats():
-    return stats_imagery(ic_s2, 'CGI')
+    return index_stats(get_all_stats(snapshot_version()), 'CGI')
 
 
-@st.cache_data
 def get_cdom_stats():
-    return stats_imagery(ic_s2, 'CDOM')
+    return index_stats(get_all_stats(snapshot_version()), 'CDOM')
 
 
-@st.cache_data
 def get_doc_stats():
-    return stats_imagery(ic_s2, 'DOC')
+    return index_stats(get_all_stats(snapshot_version()), 'DOC')
 
 
-@st.cache_data
 def get_cyanobacteria_stats():
-    return stats_imagery(ic_s2, 'Cyanobacteria')
+    return index_stats(get_all_stats(snapshot_version()), 'Cyanobacteria')
 
 
-@st.cache_data
 def get_turbidity_stats():
-    return stats_imagery(ic_s2, 'Turbidity')
+    return index_stats(get_all_stats(snapshot_version()), 'Turbidity')
 
 
-@st.cache_data
 def get_images_stats():
-    stats = {'Turbidity': {'2025-03-17': {'median': 0.04},
-                      '2025-03-19': {'median': 0.1},
-                      '2025-03-22': {'median': 0.06},
-                      '2025-03-26': {'median': 0.02},
-                      '2025-04-03': {'median': 0.03},
-                      '2025-04-13': {'median': 0.01},
-                      '2025-04-16': {'median': -0.02},
-                      '2025-04-23': {'median': -0.1},
-                      '2025-04-26': {'median': -0.17},
-                      '2025-04-28': {'median': -0.14},
-                      '2025-05-03': {'median': -0.13},
-                      '2025-06-10': {'median': -0.24},
-                      '2025-06-12': {'median': -0.21},
-                      '2025-06-14': {'median': -0.12},
-                      '2025-06-15': {'median': -0.21},
-                      '2025-06-22': {'median': -0.14},
-                      '2025-06-30': {'median': -0.07},
-                      '2025-07-02': {'median': -0.04},
-                      '2025-07-05': {'median': -0.03}},
-            'CDOM': {'2025-03-17': {'median': 36.45},
-                      '2025-03-19': {'median': 47.77},
-                      '2025-03-22': {'median': 41.25},
-                      '2025-03-26': {'median': 32.24},
-                      '2025-04-03': {'median': 34.21},
-                      '2025-04-13': {'median': 31.2},
-                      '2025-04-16': {'median': 25.18},
-                      '2025-04-23': {'median': 15.24},
-                      '2025-04-26': {'median': 8.25},
-                      '2025-04-28': {'median': 10.67},
-                      '2025-05-03': {'median': 12.26},
-                      '2025-06-10': {'median': 4.76},
-                      '2025-06-12': {'median': 6.26},
-                      '2025-06-14': {'median': 13.23},
-                      '2025-06-15': {'median': 6.25},
-                      '2025-06-22': {'median': 11.2},
-                      '2025-06-30': {'median': 18.27},
-                      '2025-07-02': {'median': 23.21},
-                      '2025-07-05': {'median': 24.71}},
-            'DOC': {'2025-03-17': {'median': 55.52},
-                    '2025-03-19': {'median': 67.53},
-                    '2025-03-22': {'median': 60.76},
-                    '2025-03-26': {'median': 50.24},
-                    '2025-04-03': {'median': 52.34},
-                    '2025-04-13': {'median': 48.82},
-                    '2025-04-16': {'median': 41.67},
-                    '2025-04-23': {'median': 28.18},
-                    '2025-04-26': {'median': 17.67},
-                    '2025-04-28': {'median': 21.72},
-                    '2025-05-03': {'median': 24.22},
-                    '2025-06-10': {'median': 11.21},
-                    '2025-06-12': {'median': 14.24},
-                    '2025-06-14': {'median': 25.2},
-                    '2025-06-15': {'median': 13.75},
-                    '2025-06-22': {'median': 22.23},
-                    '2025-06-30': {'median': 32.69},
-                    '2025-07-02': {'median': 38.77},
-                    '2025-07-05': {'median': 40.73}},
-            'Cyanobacteria': {'2025-03-17': {'median': 223.87},
-                    '2025-03-19': {'median': 813.52},
-                    '2025-03-22': {'median': 653.83},
-                    '2025-03-26': {'median': 656.1},
-                    '2025-04-03': {'median': 751.2},
-                    '2025-04-13': {'median': 861.99},
-                    '2025-04-16': {'median': 529.52},
-                    '2025-04-23': {'median': 540.25},
-                    '2025-04-26': {'median': 297.0},
-                    '2025-04-28': {'median': 414.2},
-                    '2025-05-03': {'median': 671.26},
-                    '2025-06-10': {'median': 237.01},
-                    '2025-06-12': {'median': 366.23},
-                    '2025-06-14': {'median': 829.47},
-                    '2025-06-15': {'median': 290.5},
-                    '2025-06-22': {'median': 479.31},
-                    '2025-06-30': {'median': 479.1},
-                    '2025-07-02': {'median': 985.67},
-                    '2025-07-05': {'median': 860.23}},
-            'SABI': {'2025-03-17': {'median': 0.84},
-                     '2025-03-19': {'median': 1.08},
-                     '2025-03-22': {'median': 0.85},
-                     '2025-03-26': {'median': 0.85},
-                     '2025-04-03': {'median': 1.24},
-                     '2025-04-13': {'median': 1.33},
-                     '2025-04-16': {'median': 1.74},
-                     '2025-04-23': {'median': 2.2},
-                     '2025-04-26': {'median': 2.85},
-                     '2025-04-28': {'median': 2.72},
-                     '2025-05-03': {'median': 2.26},
-                     '2025-06-10': {'median': 2.99},
-                     '2025-06-12': {'median': 3.01},
-                     '2025-06-14': {'median': 1.71},
-                     '2025-06-15': {'median': 3.29},
-                     '2025-06-22': {'median': 2.49},
-                     '2025-06-30': {'median': 2.11},
-                     '2025-07-02': {'median': 1.89},
-                     '2025-07-05': {'median': 1.86}},
-            'CGI': {'2025-03-17': {'median': 1.41},
-                    '2025-03-19': {'median': 1.92},
-                    '2025-03-22': {'median': 1.73},
-                    '2025-03-26': {'median': 1.68},
-                    '2025-04-03': {'median': 2.24},
-                    '2025-04-13': {'median': 2.33},
-                    '2025-04-16': {'median': 2.91},
-                    '2025-04-23': {'median': 3.41},
-                    '2025-04-26': {'median': 4.03},
-                    '2025-04-28': {'median': 3.85},
-                    '2025-05-03': {'median': 3.41},
-                    '2025-06-10': {'median': 4.47},
-                    '2025-06-12': {'median': 4.41},
-                    '2025-06-14': {'median': 2.7},
-                    '2025-06-15': {'median': 4.72},
-                    '2025-06-22': {'median': 3.91},
-                    '2025-06-30': {'median': 3.47},
-                    '2025-07-02': {'median': 3.16},
-                    '2025-07-05': {'median': 3.09}}}
-
-    chart_data = {}
-
-    for key, value in stats.items():
-        df = pd.DataFrame.from_dict(value).transpose()
-        df = df[["median"]]
-        chart_data[key] = df
-
-    return chart_data
+    # Per-index tables with a "median" column, keyed by index name
+    all_stats = get_all_stats(snapshot_version())
+    return {name: index_stats(all_stats, name) for name in STATS_INDEXES}
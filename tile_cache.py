@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import DATA_DIR
+
+# Default on-disk location of rendered map tiles
+TILE_CACHE_DIR = os.path.join(DATA_DIR, "tiles")
+# Registered layers (serialized image and vis params per layer key), so tile URLs outlive the process
+LAYERS_DIR = os.path.join(DATA_DIR, "tile_layers")
+
+
+def vis_hash(vis):
+    # Short stable hash of a vis_params entry, part of every tile key
+    return hashlib.sha1(json.dumps(vis, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+class TileCache:
+    """
+    Size-bounded, disk-backed LRU of XYZ tiles keyed by (date, index, vis hash, z, x, y).
+
+    Tiles of a given date, index and vis_params never change, so they are kept
+    until the cache exceeds `max_bytes`; the least recently used tiles are
+    evicted first. Recency survives restarts through the files' mtime.
+    """
+
+    def __init__(self, root=TILE_CACHE_DIR, max_bytes=512 * 2 ** 20):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._load_index()
+
+    def _load_index(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".png"):
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._size += size
+
+    def _path(self, key):
+        date_str, index_name, vhash, z, x, y = key
+        return os.path.join(self.root, date_str, index_name, vhash, str(z), str(x), f"{y}.png")
+
+    def get(self, key):
+        path = self._path(key)
+        with self._lock:
+            if path not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+        try:
+            os.utime(path)
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._entries.pop(path, 0)
+            return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+
+    def fetch(self, key, source):
+        """
+        Returns the tile for `key`, calling `source(*key)` and storing its bytes on a miss.
+        """
+        data = self.get(key)
+        if data is None:
+            data = source(*key)
+            if data is not None:
+                self.put(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "tiles": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+def palette_colors(palette):
+    # Colours of a vis_params palette: a list as is, a matplotlib colormap name sampled over its lookup table
+    if isinstance(palette, str):
+        import matplotlib
+        from matplotlib.colors import to_hex
+
+        cmap = matplotlib.colormaps[palette]
+        return [to_hex(cmap(i)) for i in range(cmap.N)]
+    return list(palette)
+
+
+def ee_tile_url_format(image, vis):
+    from ee_executor import get_executor
+
+    params = dict(vis)
+    if "palette" in params:
+        params["palette"] = palette_colors(params["palette"])
+    map_id = get_executor().run(image.getMapId, params, key=(image.serialize(), vis_hash(vis)))
+    return map_id["tile_fetcher"].url_format
+
+
+class MapIdCache:
+    """
+    Earth Engine tile URL templates per (date, index, vis hash).
+
+    Map IDs expire on the server after a while, so a template is reused for
+    `ttl` seconds: during the last `refresh_margin` seconds it is still served
+    while a new one is requested in the background, once expired it is
+    requested again before returning. `invalidate` drops a template the
+    server already rejected.
+    """
+
+    def __init__(self, ttl=2 * 3600, refresh_margin=600, max_entries=256):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def key(date_str, index_name, vis):
+        return (date_str, index_name, vis_hash(vis))
+
+    def url_format(self, date_str, index_name, vis, image):
+        key = self.key(date_str, index_name, vis)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[1]:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                refresh = now >= entry[1] - self.refresh_margin and key not in self._refreshing
+                if refresh:
+                    self._refreshing.add(key)
+            else:
+                entry, refresh = None, False
+                self.misses += 1
+
+        if entry is None:
+            return self._fetch(key, image, vis)
+        if refresh:
+            from ee_executor import get_executor
+            get_executor().submit(self._refresh, key, image, vis)
+        return entry[0]
+
+    def _fetch(self, key, image, vis):
+        url_format = ee_tile_url_format(image, vis)
+        with self._lock:
+            self._entries[key] = (url_format, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url_format
+
+    def _refresh(self, key, image, vis):
+        try:
+            self._fetch(key, image, vis)
+            with self._lock:
+                self.refreshes += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "getmapid_calls": self.misses + self.refreshes,
+                # Lookups served without a blocking getMapId request
+                "getmapid_saved": self.hits,
+                "templates": len(self._entries),
+            }
+
+
+class EETileSource:
+    """
+    Tile source backed by Earth Engine. Images are registered per (date, index, vis hash)
+    by the map code; their tile URL template comes from a MapIdCache on the first tile miss.
+    Registrations are also written under `path` (the serialized image graph and
+    vis params), so the tile URLs handed out stay valid after a restart and on
+    the other replicas sharing the data directory.
+    """
+
+    def __init__(self, timeout=30, map_ids=None, path=LAYERS_DIR):
+        self.timeout = timeout
+        self.map_ids = map_ids or MapIdCache()
+        self.path = path
+        self._layers = {}
+        self._lock = threading.Lock()
+
+    def _layer_path(self, key):
+        date_str, index_name, vhash = key
+        return os.path.join(self.path, date_str, index_name, f"{vhash}.json")
+
+    def register(self, date_str, index_name, vis, image):
+        key = (date_str, index_name, vis_hash(vis))
+        with self._lock:
+            if key in self._layers:
+                return key
+            self._layers[key] = (image, vis)
+        path = self._layer_path(key)
+        if not os.path.exists(path):
+            # Written atomically; a date's composite and its vis params do not change
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"image": image.serialize(), "vis": vis}, f)
+            os.replace(tmp_path, path)
+        return key
+
+    def _load(self, key):
+        # (image, vis) of a layer registered by an earlier or another process, or None
+        import ee
+
+        try:
+            with open(self._layer_path(key)) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        layer = ee.deserializer.fromJSON(state["image"]), state["vis"]
+        with self._lock:
+            return self._layers.setdefault(key, layer)
+
+    def __call__(self, date_str, index_name, vhash, z, x, y):
+        key = (date_str, index_name, vhash)
+        with self._lock:
+            layer = self._layers.get(key)
+        if layer is None:
+            layer = self._load(key)
+            if layer is None:
+                return None
+        image, vis = layer
+        try:
+            return self._get(self.map_ids.url_format(date_str, index_name, vis, image), z, x, y)
+        except urllib.error.HTTPError as e:
+            if e.code not in (401, 403, 404):
+                raise
+            # Expired or revoked map ID: request a new template once
+            self.map_ids.invalidate(key)
+            return self._get(self.map_ids.url_format(date_str, index_name, vis, image), z, x, y)
+
+    def _get(self, url_format, z, x, y):
+        with urllib.request.urlopen(url_format.format(z=z, x=x, y=y), timeout=self.timeout) as response:
+            return response.read()
+
+
+class TileServer:
+    """
+    Small local XYZ endpoint in a daemon thread:
+
+        /tiles/<date>/<index>/<vis hash>/<z>/<x>/<y>.png   tile from the cache or the source
+        /stats                                             cache counters as JSON
+    """
+
+    def __init__(self, cache, source, host="127.0.0.1", port=8765, public_url=None):
+        self.cache = cache
+        self.source = source
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self.public_url = (public_url or f"http://{host}:{self.port}").rstrip("/")
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="tile-server", daemon=True)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if parts == ["stats"]:
+                    return self._send(200, "application/json", json.dumps(server.cache.stats()).encode())
+                if (len(parts) != 7 or parts[0] != "tiles" or not parts[6].endswith(".png")
+                        or any(part in ("", ".", "..") for part in parts)):
+                    return self._send(404, "text/plain", b"Not found")
+                try:
+                    z, x, y = int(parts[4]), int(parts[5]), int(parts[6][:-4])
+                except ValueError:
+                    return self._send(404, "text/plain", b"Not found")
+                try:
+                    data = server.cache.fetch((parts[1], parts[2], parts[3], z, x, y), server.source)
+                except Exception as e:
+                    return self._send(502, "text/plain", str(e).encode())
+                if data is None:
+                    return self._send(404, "text/plain", b"Unknown layer")
+                self._send(200, "image/png", data)
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def url_template(self, key):
+        date_str, index_name, vhash = key
+        return f"{self.public_url}/tiles/{date_str}/{index_name}/{vhash}/{{z}}/{{x}}/{{y}}.png"
@@ -0,0 +1,79 @@
+import os
+import glob
+import pandas as pd
+from config import DATA_DIR
+
+# Default on-disk location of the per-date index statistics
+STORE_DIR = os.path.join(DATA_DIR, "timeseries")
+
+
+class TimeSeriesStore:
+    """
+    Columnar store of AOI statistics, one row per date x index.
+
+    Each refresh is written as a new Parquet part file, so existing parts are
+    never rewritten. A date is considered computed once any row for it exists,
+    even if its value is missing (e.g. fully clouded over the AOI). Should two
+    parts hold the same (date, index) (e.g. concurrent refreshes), the part
+    written last wins.
+    """
+
+    columns = ["date", "index", "median"]
+
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+
+    def _parts(self):
+        # In write order
+        parts = glob.glob(os.path.join(self.path, "part-*.parquet"))
+        return sorted(parts, key=lambda p: (os.path.getmtime(p), p))
+
+    def load(self):
+        parts = self._parts()
+        if not parts:
+            return pd.DataFrame(columns=self.columns)
+        long_df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+        return long_df.drop_duplicates(["date", "index"], keep="last").reset_index(drop=True)
+
+    def dates(self):
+        return sorted(self.load()["date"].unique())
+
+    def latest_date(self):
+        dates = self.dates()
+        return dates[-1] if dates else None
+
+    def append(self, wide_df):
+        """
+        Appends a wide DataFrame (date index, one column per index) as a new part.
+        Dates already present in the store are skipped.
+        Returns:
+            Number of rows written.
+        """
+        if wide_df.empty:
+            return 0
+
+        long_df = (
+            wide_df.rename_axis("date")
+            .reset_index()
+            .melt(id_vars="date", var_name="index", value_name="median")
+        )
+        long_df = long_df[~long_df["date"].isin(self.dates())]
+        if long_df.empty:
+            return 0
+
+        long_df["median"] = pd.to_numeric(long_df["median"], errors="coerce").astype("float64")
+        os.makedirs(self.path, exist_ok=True)
+        name = f"part-{long_df['date'].min()}_{long_df['date'].max()}.parquet"
+        tmp_path = os.path.join(self.path, f".{name}.tmp")
+        long_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        return len(long_df)
+
+    def to_wide(self, indexes=None):
+        long_df = self.load()
+        wide = long_df.pivot(index="date", columns="index", values="median").sort_index()
+        if indexes is not None:
+            wide = wide.reindex(columns=list(indexes))
+        wide.columns.name = None
+        wide.index.name = "date"
+        return wide
@@ -1,95 +1,394 @@
-import ee
+"""
+Declarative registry of the water indexes: each index's formula over the
+Sentinel-2 bands, units, map vis params and description, in one place.
 
-indices_description = {
-    "SABI": {
-        "name": "🦠 SABI – Surface Algal Bloom Index",
-        "description": "It was developed by (Alawadi 2010) to identify the presence of biomass in water, using the NIR band, which is sensitive to green plants, Blue band (responsive to pure water), and Green band, which detect algal blooms within the water column. "
-        "Algae bloom phenomenon are most likely to happen when the suitable conditions of sunlight, high water temperature and high level of nutrients exists. "
-        "Moreover, highly eutrophic waters can help algae feed due to their high nitrogen and phosphorus content (Caballero et al. 2020). "
-        "The range of index values for water is from -0.1 to 0 and approximately -0.2 and lower for microalgae (Kulawiak 2016).",
-        "formula": r'''SABI = \frac{NIR - Red}{Blue + Green} = \frac{B8 - B4}{B2 + B3}''',
-        "ref": """<ul><li>F. Alawadi, 2010 <i>"Detection of surface algal blooms using the newly developed algorithm surface algal bloom index (SABI)"</i>, SPIE Proceedings: Remote Sensing of the Ocean, Sea Ice, and Large Water Regions 2010, t. 7825, n. 782506. doi:10.1117/12.862096.</li>
+Formulas are written with Python operators on band symbols (GREEN / RED,
+exp(...), ...). Each formula of a requested subset is compiled to one Earth
+Engine `expression`; the band selections, normalized differences and
+subexpressions used by more than one of them (e.g. GREEN / RED, shared by
+CDOM and DOC) are built once and passed in as its inputs. The LaTeX of the
+pages and create_map.vis_params are generated from the same formulas.
+"""
+from lazy_import import LazyModule
+
+ee = LazyModule("ee")
+
+# Symbolic names of the Sentinel-2 bands in the formulas and their LaTeX
+BAND_NAMES = {
+    'B2': 'Blue',
+    'B3': 'Green',
+    'B4': 'Red',
+    'B8': 'NIR',
+    'B9': 'SWIR',
+    'B11': 'SWIR1',
+    'B12': 'SWIR2',
+}
+
+# geemap's named 'ndwi' and 'ndvi' palettes, spelled out
+ndwiPalette = [
+    '#ece7f2',
+    '#d0d1e6',
+    '#a6bddb',
+    '#74a9cf',
+    '#3690c0',
+    '#0570b0',
+    '#045a8d',
+    '#023858',
+]
+
+ndviPalette = [
+    '#FFFFFF',
+    '#CE7E45',
+    '#DF923D',
+    '#F1B555',
+    '#FCD163',
+    '#99B718',
+    '#74A901',
+    '#66A000',
+    '#529400',
+    '#3E8601',
+    '#207401',
+    '#056201',
+    '#004C00',
+    '#023B01',
+    '#012E01',
+    '#011D01',
+    '#011301',
+]
+
+colorScaleHex = [
+    '#496FF2',
+    '#82D35F',
+    '#FEFD05',
+    '#FD0004',
+    '#8E2026',
+    '#D97CF5'
+]
+
+# Operators whose arguments can be swapped without changing the result
+_COMMUTATIVE = {'add', 'mul'}
+# Earth Engine expression operators of the binary operators
+_EE_OPERATORS = {'add': '+', 'sub': '-', 'mul': '*', 'div': '/', 'pow': '**'}
+# LaTeX binding strength; arguments of a weaker-binding operator are parenthesized
+_PRECEDENCE = {'add': 1, 'sub': 1, 'mul': 2, 'div': 3, 'nd': 3, 'pow': 4, 'exp': 5, 'band': 5, 'const': 5}
+
+
+class Expr:
+    """
+    Node of an index formula. Its `key` identifies the computation: equal
+    subexpressions have equal keys (also `a + b` and `b + a`), so a graph
+    built from several formulas keeps one node per key.
+    """
+
+    def __init__(self, op, args=(), value=None):
+        self.op = op
+        self.args = tuple(args)
+        self.value = value
+        if op in ('band', 'const'):
+            self.key = (op, value)
+        else:
+            keys = [a.key for a in self.args]
+            self.key = (op, *(sorted(keys, key=repr) if op in _COMMUTATIVE else keys))
+
+    def _binary(self, op, other, reverse=False):
+        other = other if isinstance(other, Expr) else Expr('const', value=float(other))
+        return Expr(op, (other, self) if reverse else (self, other))
+
+    def __add__(self, other):
+        return self._binary('add', other)
+
+    def __radd__(self, other):
+        return self._binary('add', other, reverse=True)
+
+    def __sub__(self, other):
+        return self._binary('sub', other)
+
+    def __rsub__(self, other):
+        return self._binary('sub', other, reverse=True)
+
+    def __mul__(self, other):
+        return self._binary('mul', other)
+
+    def __rmul__(self, other):
+        return self._binary('mul', other, reverse=True)
+
+    def __truediv__(self, other):
+        return self._binary('div', other)
+
+    def __rtruediv__(self, other):
+        return self._binary('div', other, reverse=True)
+
+    def __pow__(self, other):
+        return self._binary('pow', other)
+
+    def bands(self):
+        # Bands read by the formula, in order of first use
+        if self.op == 'band':
+            return [self.value]
+        return list(dict.fromkeys(band for arg in self.args for band in arg.bands()))
+
+    def nodes(self):
+        # {key: node} of the formula's distinct subexpressions (constants excluded)
+        found = {}
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.op != 'const' and node.key not in found:
+                found[node.key] = node
+                # normalizedDifference reads its bands itself
+                if node.op != 'nd':
+                    stack.extend(node.args)
+        return found
+
+    def tree_size(self):
+        # Operations of the formula written out without sharing (constants excluded)
+        if self.op in ('const', 'nd'):
+            return int(self.op == 'nd')
+        return 1 + sum(arg.tree_size() for arg in self.args)
+
+    def expression(self, variables):
+        # Earth Engine expression of the formula; nodes in `variables` ({key: name}) are read as inputs
+        if self.key in variables:
+            return variables[self.key]
+        if self.op == 'const':
+            return f'({self.value!r})' if self.value < 0 else repr(self.value)
+        if self.op == 'exp':
+            return f'exp({self.args[0].expression(variables)})'
+        a, b = self.args
+        return f'({a.expression(variables)} {_EE_OPERATORS[self.op]} {b.expression(variables)})'
+
+    def latex(self, bands=False):
+        # LaTeX of the formula with symbolic band names, or with band ids (B3, ...) when `bands`
+        def wrap(node, weaker_than):
+            text = node.latex(bands)
+            return rf'\left({text}\right)' if _PRECEDENCE[node.op] < weaker_than else text
+
+        if self.op == 'band':
+            return self.value if bands else BAND_NAMES[self.value]
+        if self.op == 'const':
+            return str(int(self.value)) if self.value == int(self.value) else repr(self.value)
+        if self.op == 'exp':
+            return rf'\exp\left({self.args[0].latex(bands)}\right)'
+        a, b = self.args
+        if self.op == 'nd':
+            return rf'\frac{{{a.latex(bands)} - {b.latex(bands)}}}{{{a.latex(bands)} + {b.latex(bands)}}}'
+        if self.op == 'div':
+            return rf'\frac{{{a.latex(bands)}}}{{{b.latex(bands)}}}'
+        if self.op == 'pow':
+            return f'{wrap(a, 5)}^{{{b.latex(bands)}}}'
+        if self.op == 'mul':
+            return rf'{wrap(a, 2)} \cdot {wrap(b, 2)}'
+        if self.op == 'add':
+            return f'{a.latex(bands)} + {b.latex(bands)}'
+        return f'{a.latex(bands)} - {wrap(b, 2)}'
+
+
+def band(name):
+    return Expr('band', value=name)
+
+
+def exp(x):
+    return Expr('exp', (x,))
+
+
+def normalized_difference(a, b):
+    # (a - b) / (a + b) of two bands, as one Earth Engine normalizedDifference
+    return Expr('nd', (a, b))
+
+
+BLUE, GREEN, RED, NIR = band('B2'), band('B3'), band('B4'), band('B8')
+SWIR, SWIR1, SWIR2 = band('B9'), band('B11'), band('B12')
+
+
+class WaterIndex:
+    """
+    One index of the registry.
+    Parameters:
+        formula: Expr over the band symbols.
+        vis: Map vis params (min, max, palette, optional legend breaks).
+        units: Units of the values, None for dimensionless indexes.
+        title, description, ref: Texts of the Water Quality page (indexes without a title are map-only).
+    """
+
+    def __init__(self, formula, vis, units=None, title=None, description=None, ref=""):
+        self.formula = formula
+        self.vis = vis
+        self.units = units
+        self.title = title
+        self.description = description
+        self.ref = ref
+
+    @property
+    def bands(self):
+        return self.formula.bands()
+
+
+INDEXES = {
+    "NDWI": WaterIndex(
+        normalized_difference(GREEN, NIR),
+        vis={'min': -1, 'max': 1, 'palette': ndwiPalette, 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+    ),
+    "NDVI": WaterIndex(
+        normalized_difference(NIR, RED),
+        vis={'min': -1, 'max': 1, 'palette': ndviPalette, 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+    ),
+    "NDSI": WaterIndex(
+        normalized_difference(SWIR1, SWIR2),
+        vis={'min': -1, 'max': 1, 'palette': 'RdYlBu_r', 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+    ),
+    "SABI": WaterIndex(
+        (NIR - RED) / (BLUE + GREEN),
+        vis={'min': -1, 'max': 1, 'palette': 'jet_r', 'breaks': [-1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+        title="🦠 SABI – Surface Algal Bloom Index",
+        description="It was developed by (Alawadi 2010) to identify the presence of biomass in water, using the NIR band, which is sensitive to green plants, Blue band (responsive to pure water), and Green band, which detect algal blooms within the water column. "
+            "Algae bloom phenomenon are most likely to happen when the suitable conditions of sunlight, high water temperature and high level of nutrients exists. "
+            "Moreover, highly eutrophic waters can help algae feed due to their high nitrogen and phosphorus content (Caballero et al. 2020). "
+            "The range of index values for water is from -0.1 to 0 and approximately -0.2 and lower for microalgae (Kulawiak 2016).",
+        ref="""<ul><li>F. Alawadi, 2010 <i>"Detection of surface algal blooms using the newly developed algorithm surface algal bloom index (SABI)"</i>, SPIE Proceedings: Remote Sensing of the Ocean, Sea Ice, and Large Water Regions 2010, t. 7825, n. 782506. doi:10.1117/12.862096.</li>
                       <li>I. Caballero, R. Fernández, O. M. Escalante, L. Maman, G. Navarro, 2020 <i>"New capabilities of Sentinel-2A/B satellites combined with in situ data for monitoring small harmful algal blooms in complex coastal waters."</i>, Sci Rep, t. 10, n. 8743. doi:10.1038/s41598-020-65600-1.</li>
                       <li>M. Kulawiak, 2016 <i>"Operational algae bloom detection in the Baltic Sea using GIS and AVHRR data."</i>, BALTICA, t. 29, n. 1, s. 3-18. doi:10.5200/baltica.2016.29.02.</li>
-                  </ul>"""
-    },
-    "CGI": {
-        "name": "🦠 CGI – Chlorophyll Green Index",
-        "description": "In general, the chlorophyll index is applied to determine the total amount of chlorophyll in plants. "
-                       "This variation uses the SWIR (resolution 60 meters and central wavelength at 945 nm) and Green channels in calculations.",
-        "formula": r'''CGI = \frac{SWIR}{Green}-1''',
-        "ref": """"""
-    },
-    "CDOM": {
-        "name": "🦠 CDOM – Colored Dissolved Organic Matter",
-        "description": "Is a water quality indicator used to assess optically active organic materials in water. "
-                       "This parameter is influenced by two primary sources of organic matter. "
-                       "The first source is the organic material that forms within the water body itself, such as phytoplankton. "
-                       "The second source is organic matter that enters the water from external sources, like coal that may leach from the surrounding soil. "
-                       "It has also been demonstrated that there is a correlation between content of methylmercury and CDOM in rivers (Fichot et al. 2016).",
-        "formula": r'''CDOM = 537 \cdot \exp\left(-2.93 \cdot \frac{Green}{Red}\right)''',
-        "ref": """<ul><li>Fichot C.G., Downing B.D., Bergamaschi B.A., Windham-Myers L., Marvin-DiPasquale M., Thompson D.R., Gierach M.M. 2016. <i>"High-Resolution Remote Sensing of Water Quality in the SanFrancisco Bay−Delta Estuary."</i>, Environmental Science and Technology, 50. doi:10.1021/acs.est.5b03518.</li></ul>"""
-    },
-    "DOC": {
-        "name": "🦠 DOC – Dissolved Organic Carbon",
-        "description": "Refers to the presence of organic carbon compounds that are dissolved in the water. "
-                       "It serves as a key indicator of water quality, with higher levels often indicating pollution and potential for undesirable biological growth. "
-                       "DOC may also be influenced by the density of other dissolved substances, such as metals. "
-                       "Organic matter levels in the river are closely related to rainfall/runoff events, seasons and operational practices and typically range from 0.1 mg :small[$L^{-1}$] to 10-20 mg :small[$L^{-1}$] in fresh waters (Volk et al. 2002).",
-        "formula": r'''DOC = 432 \cdot \exp\left(-2.24 \cdot \frac{Green}{Red}\right)''',
-        "ref": """<ul><li>Volk C., Wood L., Johnson B., Robinson J., Wei Zhu H., Kaplan L. 2002. <i>"Monitoring dissolved organic carbon in surface and drinking waters."</i>, Journal of Environmental Monitoring, 4, 43-47. doi:10.1039/B107768F.</li></ul>"""
-    },
-    "Cyanobacteria": {
-        "name": "🦠 Cyanobacteria",
-        "description": "The values of this parameter are primarily linked to the presence of cyanobacterial blooms, which can be highly hazardous to humans, animals, and plants (Topp et al. 2020). "
-        "Their blooms reduce the aesthetic value of recreational parts of water bodies. "
-        "Moreover, cyanobacteria can produce both hepatotoxic peptides, such as Microcystis and Cyanopeptolin, which cause liver damage and are tumor-inducing (Hannson et al. 2007). "
-        "The formula below was transformed for the Sentinel-2 satellite from algorithms created by Potes et al. (2011, 2012).",
-        "formula": r'''Cyanobacteria = 115530.31 \cdot \left(\frac{Green \cdot Red}{Blue}\right)^{2.38} = \\
-                                       115530.31 \cdot \left(\frac{B3 \cdot B4}{B2}\right)^{2.38}''',
-        "ref": """<ul><li>M. S. Topp, N. Gokbuget, G. Zugmaier, A. S. Stein, H. Dombret, Y. Chen, J. Ribera, R. C. Bargou, H. Horst, H. M. Kantarjian, 2020. <i>"Long-term survival of patients with relapsed/refractory acute lymphoblastic leukemia treated with blinatumomab."</i>, American Cancer Society Journals, t. 127, n. 4, s. 554-559. doi:10.1002/cncr.33298.</li>
+                  </ul>""",
+    ),
+    "CGI": WaterIndex(
+        SWIR / GREEN - 1,
+        vis={'min': 1, 'max': 5, 'palette': 'PuBuGn'},
+        title="🦠 CGI – Chlorophyll Green Index",
+        description="In general, the chlorophyll index is applied to determine the total amount of chlorophyll in plants. "
+            "This variation uses the SWIR (resolution 60 meters and central wavelength at 945 nm) and Green channels in calculations.",
+    ),
+    "CDOM": WaterIndex(
+        537 * exp(-2.93 * (GREEN / RED)),
+        vis={'min': 5, 'max': 50, 'palette': colorScaleHex},
+        units="mg/L",
+        title="🦠 CDOM – Colored Dissolved Organic Matter",
+        description="Is a water quality indicator used to assess optically active organic materials in water. "
+            "This parameter is influenced by two primary sources of organic matter. "
+            "The first source is the organic material that forms within the water body itself, such as phytoplankton. "
+            "The second source is organic matter that enters the water from external sources, like coal that may leach from the surrounding soil. "
+            "It has also been demonstrated that there is a correlation between content of methylmercury and CDOM in rivers (Fichot et al. 2016).",
+        ref="""<ul><li>Fichot C.G., Downing B.D., Bergamaschi B.A., Windham-Myers L., Marvin-DiPasquale M., Thompson D.R., Gierach M.M. 2016. <i>"High-Resolution Remote Sensing of Water Quality in the SanFrancisco Bay−Delta Estuary."</i>, Environmental Science and Technology, 50. doi:10.1021/acs.est.5b03518.</li></ul>""",
+    ),
+    "DOC": WaterIndex(
+        432 * exp(-2.24 * (GREEN / RED)),
+        vis={'min': 10, 'max': 70, 'palette': colorScaleHex},
+        units="mg/L",
+        title="🦠 DOC – Dissolved Organic Carbon",
+        description="Refers to the presence of organic carbon compounds that are dissolved in the water. "
+            "It serves as a key indicator of water quality, with higher levels often indicating pollution and potential for undesirable biological growth. "
+            "DOC may also be influenced by the density of other dissolved substances, such as metals. "
+            "Organic matter levels in the river are closely related to rainfall/runoff events, seasons and operational practices and typically range from 0.1 mg :small[$L^{-1}$] to 10-20 mg :small[$L^{-1}$] in fresh waters (Volk et al. 2002).",
+        ref="""<ul><li>Volk C., Wood L., Johnson B., Robinson J., Wei Zhu H., Kaplan L. 2002. <i>"Monitoring dissolved organic carbon in surface and drinking waters."</i>, Journal of Environmental Monitoring, 4, 43-47. doi:10.1039/B107768F.</li></ul>""",
+    ),
+    "Cyanobacteria": WaterIndex(
+        115530.31 * (GREEN * RED / BLUE) ** 2.38,
+        vis={'min': 100, 'max': 1000, 'palette': colorScaleHex},
+        units="10^3 cell/mL",
+        title="🦠 Cyanobacteria",
+        description="The values of this parameter are primarily linked to the presence of cyanobacterial blooms, which can be highly hazardous to humans, animals, and plants (Topp et al. 2020). "
+            "Their blooms reduce the aesthetic value of recreational parts of water bodies. "
+            "Moreover, cyanobacteria can produce both hepatotoxic peptides, such as Microcystis and Cyanopeptolin, which cause liver damage and are tumor-inducing (Hannson et al. 2007). "
+            "The formula below was transformed for the Sentinel-2 satellite from algorithms created by Potes et al. (2011, 2012).",
+        ref="""<ul><li>M. S. Topp, N. Gokbuget, G. Zugmaier, A. S. Stein, H. Dombret, Y. Chen, J. Ribera, R. C. Bargou, H. Horst, H. M. Kantarjian, 2020. <i>"Long-term survival of patients with relapsed/refractory acute lymphoblastic leukemia treated with blinatumomab."</i>, American Cancer Society Journals, t. 127, n. 4, s. 554-559. doi:10.1002/cncr.33298.</li>
                       <li>L. A. Hannson, S. Gustafsson, K. Rengefors, L. Bomark, 2007. <i>"Cyanobacterial chemical warfare affects zooplankton community composition."</i>, Freshwater Biology, t. 52, n. 7, s. 1290-1301. doi:10.1111/j.1365-2427.2007.01765.x.</li>
                       <li>M. Potes, M. J. Costa, J. C. B. da Silva, A. M. Silva, M. Morais, 2011. <i>"Remote sensing of water quality parameters over Alqueva Reservoir in the south of Portugal."</i>, International Journal of Remote Sensing, t. 32 n. 12, s. 3373-3388. doi:10.1080/01431161003747513.</li>
                       <li>M. Potes, J. Costa, R. Salgado, 2012. <i>"Satellite remote sensing of water turbidity in Alqueva reservoir and implications on lake modelling."</i>, Hydrology and Earth System Sciences, t. 16, n. 6, s. 1623–1633. doi:10.5194/hess-16-1623-2012.</li>
-                  </ul>"""
-    },
-    "Turbidity": {
-        "name": "💦 Turbidity",
-        "description": "Is a reduction in water clarity because of the presence of suspended matter absorbing or scattering light. "
-        "Beyond its impact on the visual quality of rivers and recreational reservoirs, the transparency of the water affects changes in the amount of light available at different depths, influencing the process of photosynthesis (Izagirre et al. 2009). "
-        "The formula below was transformed for the Sentinel-2 satellite from algorithms created by Potes et al. (2011, 2012).",
-        "formula": r'''Turbidity = \frac{Red - Green}{Red + Green} = \frac{B4 - B3}{B4 + B3}''',
-        "ref": """<ul><li>O. Izagirre, A. Serra, H. Guasch, A. Elosegi, 2009 <i>"Effects of sediment deposition on periphytic biomass, photosynthetic activity and algal community structure."</i>, Science of The Total Environment, t. 407, n. 21, s. 5694-5700. doi:10.1016/j.scitotenv.2009.06.049.</li>
+                  </ul>""",
+    ),
+    "Turbidity": WaterIndex(
+        normalized_difference(RED, GREEN),
+        vis={'min': -1, 'max': 1, 'palette': ['blue', 'green', 'yellow', 'orange', 'red']},
+        title="💦 Turbidity",
+        description="Is a reduction in water clarity because of the presence of suspended matter absorbing or scattering light. "
+            "Beyond its impact on the visual quality of rivers and recreational reservoirs, the transparency of the water affects changes in the amount of light available at different depths, influencing the process of photosynthesis (Izagirre et al. 2009). "
+            "The formula below was transformed for the Sentinel-2 satellite from algorithms created by Potes et al. (2011, 2012).",
+        ref="""<ul><li>O. Izagirre, A. Serra, H. Guasch, A. Elosegi, 2009 <i>"Effects of sediment deposition on periphytic biomass, photosynthetic activity and algal community structure."</i>, Science of The Total Environment, t. 407, n. 21, s. 5694-5700. doi:10.1016/j.scitotenv.2009.06.049.</li>
                       <li>M. Potes, M. J. Costa, J. C. B. da Silva, A. M. Silva, M. Morais, 2011. <i>"Remote sensing of water quality parameters over Alqueva Reservoir in the south of Portugal."</i>, International Journal of Remote Sensing, t. 32 n. 12, s. 3373-3388. doi:10.1080/01431161003747513.</li>
                       <li>M. Potes, J. Costa, R. Salgado, 2012. <i>"Satellite remote sensing of water turbidity in Alqueva reservoir and implications on lake modelling."</i>, Hydrology and Earth System Sciences, t. 16, n. 6, s. 1623–1633. doi:10.5194/hess-16-1623-2012.</li> 
-                  </ul>"""
-    }
+                  </ul>""",
+    ),
+    "AWEI": WaterIndex(
+        4 * (GREEN - SWIR1) - (0.25 * NIR + 2.75 * SWIR2),
+        vis={'min': -1, 'max': 1, 'palette': ['#f5f5dc', '#ffffcc', '#a1dab4', '#41b6c4', '#225ea8'], 'breaks': [-2.0, -1.5, -1.0, -0.5, 0.0, 0.5, 1.0, 1.5, 2.0]},
+    ),
 }
 
 
-def water_indexes(image, only=None):
-    available = {
-        'NDWI': image.normalizedDifference(['B3', 'B8']).rename('NDWI'),
-        'NDVI': image.normalizedDifference(['B8', 'B4']).rename('NDVI'),
-        'NDSI': image.normalizedDifference(['B11', 'B12']).rename('NDSI'),
-        'SABI': image.expression('(NIR - RED) / (BLUE + GREEN)',
-                                 {'NIR': image.select('B8'), 'RED': image.select('B4'), 'BLUE': image.select('B2'), 'GREEN': image.select('B3')}).rename('SABI'),
-        'CGI': image.expression('((SWIR / GREEN) - 1)',
-                                {'SWIR': image.select('B9'), 'GREEN': image.select('B3')}).rename('CGI'),
-        'CDOM': image.expression('537 * exp(-2.93 * GREEN / RED)',
-                                 {'GREEN': image.select('B3'), 'RED': image.select('B4')}).rename('CDOM'),
-        'DOC': image.expression('432 * exp(-2.24 * GREEN / RED)',
-                                {'GREEN': image.select('B3'), 'RED': image.select('B4')}).rename('DOC'),
-        'Cyanobacteria': image.expression('115530.31 * (GREEN * RED / BLUE) ** 2.38',
-                                {'RED': image.select('B4'), 'BLUE': image.select('B2'), 'GREEN': image.select('B3')}).rename('Cyanobacteria'),
-        'Turbidity': image.normalizedDifference(['B4', 'B3']).rename('Turbidity'),
-        'AWEI': image.expression('4*(GREEN - SWIR1) - (0.25*NIR + 2.75*SWIR2)',
-                                 {'GREEN': image.select('B3'), 'NIR': image.select('B8'), 'SWIR1': image.select('B11'), 'SWIR2': image.select('B12')}).rename('AWEI')
-    }
-
-    if only is not None:
-        selected = [available[k] for k in only if k in available]
+def index_latex(name):
+    # "NAME = symbolic formula = formula over band ids"
+    formula = INDEXES[name].formula
+    return f'{name} = {formula.latex()} = {formula.latex(bands=True)}'
+
+
+# Texts of the Water Quality page, keyed by index name
+indices_description = {
+    name: {"name": index.title, "description": index.description, "formula": index_latex(name), "ref": index.ref}
+    for name, index in INDEXES.items() if index.title is not None
+}
+
+
+def graph_nodes(names):
+    # {key: node} of the expression graph of several indexes, each shared subexpression once
+    found = {}
+    for name in names:
+        found.update(INDEXES[name].formula.nodes())
+    return found
+
+
+def _shared_keys(names):
+    # Keys of the operations used by more than one of the formulas
+    counts = {}
+    for name in names:
+        for key, node in INDEXES[name].formula.nodes().items():
+            if node.op not in ('band', 'nd'):
+                counts[key] = counts.get(key, 0) + 1
+    return {key for key, count in counts.items() if count > 1}
+
+
+def _inputs(node, shared):
+    # {key: node} of the bands, normalized differences and shared subexpressions a formula reads
+    found = {}
+    stack = list(node.args)
+    while stack:
+        arg = stack.pop()
+        if arg.op in ('band', 'nd') or arg.key in shared:
+            found.setdefault(arg.key, arg)
+        elif arg.op != 'const':
+            stack.extend(arg.args)
+    return found
+
+
+def _build(node, image, built, shared):
+    # ee.Image of a node, built once per key
+    if node.key in built:
+        return built[node.key]
+    if node.op == 'band':
+        result = image.select(node.value)
+    elif node.op == 'nd':
+        result = image.normalizedDifference([arg.value for arg in node.args])
     else:
-        selected = list(available.values())
+        inputs = _inputs(node, shared)
+        variables = {
+            key: BAND_NAMES[arg.value].upper() if arg.op == 'band' else f'X{i}'
+            for i, (key, arg) in enumerate(inputs.items())
+        }
+        result = image.expression(node.expression(variables), {
+            variables[key]: _build(arg, image, built, shared) for key, arg in inputs.items()
+        })
+    built[node.key] = result
+    return result
+
 
+def water_indexes(image, only=None):
+    """
+    Adds index bands to a Sentinel-2 image (reflectances, i.e. divided by 10000).
+    Parameters:
+        only: Index names to compute, in band order; all registered indexes if None.
+              Only these formulas are built, sharing their common subexpressions.
+    Returns:
+        The image with one band per index, named after the index.
+    """
+    names = [k for k in only if k in INDEXES] if only is not None else list(INDEXES)
+    built = {}
+    shared = _shared_keys(names)
+    selected = [_build(INDEXES[name].formula, image, built, shared).rename(name) for name in names]
     return image.addBands(ee.Image.cat(selected))
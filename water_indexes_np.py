@@ -0,0 +1,166 @@
+import numpy as np
+from water_indexes import INDEXES
+
+# Sentinel-2 bands needed by each index (same formulas as the water_indexes registry)
+INDEX_BANDS = {name: index.bands for name, index in INDEXES.items()}
+
+
+def _safe_divide(num, den, out):
+    # Division by zero yields NaN (a masked pixel in Earth Engine terms)
+    zero = den == 0
+    np.divide(num, den, out=out, where=~zero)
+    out[zero] = np.nan
+    return out
+
+
+def _normalized_difference(a, b, out, difference=None):
+    # As Earth Engine's normalizedDifference: NaN where the sum is zero or either input is negative
+    if difference is None:
+        difference = np.subtract(a, b, out=out)
+    _safe_divide(difference, a + b, out)
+    out[(a < 0) | (b < 0)] = np.nan
+    return out
+
+
+def _ndwi(b, shared, out):
+    return _normalized_difference(b['B3'], b['B8'], out)
+
+
+def _ndvi(b, shared, out):
+    return _normalized_difference(b['B8'], b['B4'], out, shared('NIR-RED', lambda: b['B8'] - b['B4']))
+
+
+def _ndsi(b, shared, out):
+    return _normalized_difference(b['B11'], b['B12'], out)
+
+
+def _sabi(b, shared, out):
+    return _safe_divide(shared('NIR-RED', lambda: b['B8'] - b['B4']), b['B2'] + b['B3'], out)
+
+
+def _cgi(b, shared, out):
+    _safe_divide(b['B9'], b['B3'], out)
+    out -= 1
+    return out
+
+
+def _green_red(b, shared):
+    return shared('GREEN/RED', lambda: _safe_divide(b['B3'], b['B4'], np.empty_like(b['B3'])))
+
+
+def _cdom(b, shared, out):
+    np.multiply(_green_red(b, shared), -2.93, out=out)
+    np.exp(out, out=out)
+    out *= 537
+    return out
+
+
+def _doc(b, shared, out):
+    np.multiply(_green_red(b, shared), -2.24, out=out)
+    np.exp(out, out=out)
+    out *= 432
+    return out
+
+
+def _cyanobacteria(b, shared, out):
+    np.multiply(b['B3'], b['B4'], out=out)
+    _safe_divide(out, b['B2'], out)
+    # Negative ratios have no real power and become NaN
+    np.power(out, 2.38, out=out)
+    out *= 115530.31
+    return out
+
+
+def _turbidity(b, shared, out):
+    return _normalized_difference(b['B4'], b['B3'], out)
+
+
+def _awei(b, shared, out):
+    np.subtract(b['B3'], b['B11'], out=out)
+    out *= 4
+    out -= 0.25 * b['B8'] + 2.75 * b['B12']
+    return out
+
+
+_FORMULAS = {
+    'NDWI': _ndwi,
+    'NDVI': _ndvi,
+    'NDSI': _ndsi,
+    'SABI': _sabi,
+    'CGI': _cgi,
+    'CDOM': _cdom,
+    'DOC': _doc,
+    'Cyanobacteria': _cyanobacteria,
+    'Turbidity': _turbidity,
+    'AWEI': _awei,
+}
+
+
+def water_indexes_array(bands, only=None, mask=None, out=None, scale=None, chunk_rows=1024):
+    """
+    Computes water indexes from local Sentinel-2 band arrays, block of rows by block of rows.
+    Parameters:
+        bands: Dict of 2-D arrays (NumPy arrays or memmaps) keyed by band name, e.g. {'B3': ..., 'B4': ...}.
+               All bands must share one grid (resample 20/60 m bands beforehand).
+        only: List of index names to compute. If None, compute all of them.
+        mask: Optional boolean array, True for valid pixels. Invalid pixels are set to NaN.
+              May also be a function of the block's (scaled) band dict returning the block's
+              mask, so a mask derived from the bands is never built for the whole tile.
+        out: Optional dict of preallocated float arrays (e.g. np.memmap) keyed by index name.
+        scale: Optional factor applied to the bands (1 / 10000 for L2A digital numbers).
+        chunk_rows: Number of rows processed at once; bounds the working memory.
+    Returns:
+        A dict of float32 index arrays keyed by index name.
+    """
+    names = list(only) if only is not None else list(_FORMULAS)
+    unknown = [name for name in names if name not in _FORMULAS]
+    if unknown:
+        raise ValueError(f"Unknown water indexes: {unknown}")
+    if not names:
+        return {}
+    needed = sorted({band for name in names for band in INDEX_BANDS[name]})
+    missing = [band for band in needed if band not in bands]
+    if missing:
+        raise ValueError(f"Missing bands for {names}: {missing}")
+
+    shape = bands[needed[0]].shape
+    out = dict(out or {})
+    for name in names:
+        if name not in out:
+            out[name] = np.empty(shape, dtype=np.float32)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for start in range(0, shape[0], chunk_rows):
+            rows = slice(start, min(start + chunk_rows, shape[0]))
+
+            chunk = {}
+            for band in needed:
+                chunk[band] = np.array(bands[band][rows], dtype=np.float32)
+                if scale is not None:
+                    chunk[band] *= scale
+
+            # Intermediates shared between indexes, e.g. GREEN/RED for CDOM and DOC
+            cache = {}
+
+            def shared(key, compute):
+                if key not in cache:
+                    cache[key] = compute()
+                return cache[key]
+
+            if mask is None:
+                valid = None
+            elif callable(mask):
+                valid = np.asarray(mask(chunk), dtype=bool)
+            else:
+                valid = np.asarray(mask[rows], dtype=bool)
+            for name in names:
+                target = out[name][rows]
+                if target.dtype == np.float32:
+                    result = _FORMULAS[name](chunk, shared, target)
+                else:
+                    result = _FORMULAS[name](chunk, shared, np.empty(target.shape, dtype=np.float32))
+                    target[...] = result
+                if valid is not None:
+                    target[~valid] = np.nan
+
+    return out
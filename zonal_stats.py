@@ -0,0 +1,181 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import ee
+from ee_executor import get_executor, get_info
+
+# Label value of pixels outside every zone
+NO_ZONE = 0
+
+_label_images = {}
+_disjoint_zones = set()
+_label_lock = threading.Lock()
+
+
+def check_disjoint_zones(zones, id_property="zone_id", scale=10):
+    """
+    Raises ValueError when zones overlap. Every pixel of the label image
+    belongs to one zone, so the shared pixels of overlapping zones (a bathing
+    site inside a river reach) would count for one of them only; reduce such
+    zones in separate calls. Checked once per zone collection (one round trip).
+    """
+    key = (zones.serialize(), id_property, scale)
+    with _label_lock:
+        if key in _disjoint_zones:
+            return
+    overlap = get_info(
+        zones.reduceToImage([id_property], ee.Reducer.count()).reduceRegion(
+            reducer=ee.Reducer.max(),
+            geometry=zones.geometry(),
+            scale=scale,
+            maxPixels=1e10
+        )
+    ) or {}
+    if (overlap.get("count") or 0) > 1:
+        raise ValueError(f"Zones overlap (up to {overlap['count']} zones on a pixel); reduce them in separate calls")
+    with _label_lock:
+        _disjoint_zones.add(key)
+
+
+def zone_label_image(zones, id_property="zone_id"):
+    """
+    Rasterizes the zones once into an integer label image (0 outside zones).
+    Parameters:
+        zones: FeatureCollection of reaches / bathing sites with a positive integer `id_property`.
+               Zones must not overlap (see check_disjoint_zones).
+    """
+    key = (zones.serialize(), id_property)
+    with _label_lock:
+        if key not in _label_images:
+            _label_images[key] = (
+                zones.reduceToImage([id_property], ee.Reducer.first())
+                .unmask(NO_ZONE)
+                .toInt()
+                .rename("zone")
+            )
+        return _label_images[key]
+
+
+def zonal_stats_ee(ic, zones, indexes, id_property="zone_id", scale=10):
+    """
+    Per-zone medians and pixel counts of all indexes for every image, in one
+    grouped reduction and one round trip (plus one for the overlap check of
+    a new zone collection).
+    Returns:
+        A long DataFrame with columns date, zone, index, median, count.
+    """
+    indexes = list(indexes)
+    check_disjoint_zones(zones, id_property, scale)
+    labels = zone_label_image(zones, id_property)
+    reducer = (
+        ee.Reducer.median().repeat(len(indexes))
+        .combine(ee.Reducer.count().repeat(len(indexes)), sharedInputs=True)
+        .group(groupField=len(indexes), groupName="zone")
+    )
+
+    def set_groups(img):
+        groups = img.select(indexes).addBands(labels).updateMask(labels.neq(NO_ZONE)).reduceRegion(
+            reducer=reducer,
+            geometry=zones.geometry(),
+            scale=scale,
+            maxPixels=1e10
+        ).get("groups")
+        return img.set("date", img.date().format("YYYY-MM-dd")).set("groups", groups)
+
+    data = get_info(ic.map(set_groups).reduceColumns(
+        reducer=ee.Reducer.toList(2),
+        selectors=["date", "groups"]
+    )) or {}
+
+    rows = []
+    for date_str, groups in data.get("list", []):
+        for group in groups or []:
+            for name, median, count in zip(indexes, group["median"], group["count"]):
+                rows.append((date_str, group["zone"], name, median, count))
+    return pd.DataFrame(rows, columns=["date", "zone", "index", "median", "count"])
+
+
+def export_zone_labels(zones, grid, path, id_property="zone_id"):
+    """
+    Label raster of the zones on a local cube grid, exported once and cached as .npy.
+    """
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r")
+
+    check_disjoint_zones(zones, id_property, abs(grid["affineTransform"]["scaleX"]))
+    pixels = get_executor().run(ee.data.computePixels, {
+        "expression": zone_label_image(zones, id_property),
+        "fileFormat": "NUMPY_NDARRAY",
+        "grid": grid,
+    })
+    labels = np.ascontiguousarray(pixels["zone"], dtype=np.int32)
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, labels)
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def zonal_stats_array(labels, values, n_zones=None):
+    """
+    Per-zone medians and counts of local rasters in one vectorized pass.
+    Parameters:
+        labels: 2-D integer label raster, NO_ZONE outside the zones.
+        values: Array of shape (n_indexes, height, width); NaN pixels are ignored.
+        n_zones: Highest zone id. If None, labels.max().
+    Returns:
+        (medians, counts), both of shape (n_indexes, n_zones + 1), indexed by zone id;
+        medians are NaN for zones without valid pixels.
+    """
+    labels = np.asarray(labels)
+    values = np.asarray(values)
+    n_zones = int(labels.max()) if n_zones is None else n_zones
+
+    in_zone = labels.ravel() != NO_ZONE
+    zone_labels = labels.ravel()[in_zone]
+
+    medians = np.full((len(values), n_zones + 1), np.nan)
+    counts = np.zeros((len(values), n_zones + 1), dtype=np.int64)
+    for i, band in enumerate(values):
+        v = band.ravel()[in_zone]
+        valid = ~np.isnan(v)
+        lab, v = zone_labels[valid], v[valid]
+
+        # Sort by (zone, value); every zone becomes one sorted segment
+        order = np.lexsort((v, lab))
+        v = v[order]
+        c = np.bincount(lab, minlength=n_zones + 1)
+        starts = np.concatenate([[0], np.cumsum(c)[:-1]])
+
+        has = c > 0
+        lo = starts[has] + (c[has] - 1) // 2
+        hi = starts[has] + c[has] // 2
+        medians[i, has] = (v[lo].astype(np.float64) + v[hi]) / 2
+        counts[i] = c
+    return medians, counts
+
+
+def zonal_stats_local(cube, labels, indexes, dates=None):
+    """
+    Per-zone medians and counts from the local raster cube.
+    Returns:
+        A long DataFrame with columns date, zone, index, median, count.
+    """
+    indexes = list(indexes)
+    n_zones = int(np.max(labels))
+    frames = []
+    for date_str in (dates if dates is not None else cube.dates):
+        values = np.stack([cube.read(date_str, name) for name in indexes])
+        medians, counts = zonal_stats_array(labels, values, n_zones)
+        zones = np.arange(1, n_zones + 1)
+        for i, name in enumerate(indexes):
+            frames.append(pd.DataFrame({
+                "date": date_str,
+                "zone": zones,
+                "index": name,
+                "median": medians[i, 1:],
+                "count": counts[i, 1:],
+            }))
+    if not frames:
+        return pd.DataFrame(columns=["date", "zone", "index", "median", "count"])
+    return pd.concat(frames, ignore_index=True)